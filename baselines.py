@@ -0,0 +1,97 @@
+'''
+The baselines table: the Average and Replacement players WAR is measured
+against, one set per season and position group. They are stored in long
+format, one row per baseline and stat, instead of as extra rows at the end
+of every -JOIN table.
+'''
+import pandas as pd
+
+import player_season
+
+TABLE = 'baselines'
+
+# a replacement player is this fraction of the average player
+REPLACEMENT_LEVEL = .75
+
+# columns of a joined table that are not stats
+NOT_STATS = ['index', 'level_0', 'player_id']
+
+def create_table(writer):
+    '''
+    Creates the baselines table if it does not exist
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+
+    Returns:
+        None
+    '''
+    with writer.transaction():
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' + TABLE + ''' (
+                                   season TEXT,
+                                   position_group TEXT,
+                                   baseline TEXT,
+                                   stat TEXT,
+                                   value REAL,
+                                   PRIMARY KEY (season, position_group,
+                                                baseline, stat));''')
+
+def compute(df):
+    '''
+    Computes the baselines of a joined table
+
+    Inputs:
+        df (DataFrame): a season's joined table for one position
+
+    Returns:
+        A DataFrame with an 'Average' and a 'Replacement' row and a column
+        for each numeric stat
+    '''
+    stats = df.drop(columns=[col for col in NOT_STATS if col in df.columns])
+    average = stats.mean(numeric_only=True)
+    return pd.DataFrame([average, average*REPLACEMENT_LEVEL],
+                        index=['Average', 'Replacement'])
+
+def write_group(writer, baseline_df, season, position_group):
+    '''
+    Replaces the baselines of one season and position group
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        baseline_df (DataFrame): the baselines from compute
+        season (str): the season, like '2019-2020'
+        position_group (str): the position group, like 'FW'
+
+    Returns:
+        None
+    '''
+    rows = baseline_df.stack().reset_index()
+    rows.columns = ['baseline', 'stat', 'value']
+    rows.insert(0, 'position_group', position_group)
+    rows.insert(0, 'season', season)
+    with writer.transaction():
+        writer.connection.execute('DELETE FROM ' + TABLE + ''' WHERE season = ?
+                                  AND position_group = ?;''',
+                                  (season, position_group))
+        writer.insert(rows, TABLE)
+        player_season.bump_version(writer)
+
+def read_group(connection, season, position_group):
+    '''
+    Reads the baselines of one season and position group
+
+    Inputs:
+        connection (Connection): the players database
+        season (str): the season, like '2019-2020'
+        position_group (str): the position group, like 'FW'
+
+    Returns:
+        A DataFrame like the one compute returns
+    '''
+    rows = pd.read_sql_query('SELECT baseline, stat, value FROM ' + TABLE +
+                             ' WHERE season = ? AND position_group = ?;',
+                             connection, params=(season, position_group))
+    baseline_df = rows.pivot(index='baseline', columns='stat', values='value')
+    baseline_df.index.name = None
+    baseline_df.columns.name = None
+    return baseline_df
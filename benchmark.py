@@ -0,0 +1,253 @@
+'''
+Benchmarks the scraper's parsers without touching the network. Saved fbref
+and Wikipedia pages are replayed from disk through the same parse and
+get_tables calls a crawl makes, writing into a throwaway database.
+
+Usage:
+    python benchmark.py CORPUS [--scale N] [--repeat N]
+
+CORPUS is either a directory of saved .html pages or a page cache directory
+made with scraper.py --cache. With --scale N every fbref page is also run
+with its stats table repeated N times to see how parsing scales with rows.
+Each run is made in a process of its own, so its peak RSS is its own and
+not the most an earlier run used.
+'''
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import bs4
+
+import scraper
+import db_writer
+import page_cache
+
+def load_corpus(path):
+    '''
+    Reads every saved page in a corpus
+
+    Inputs:
+        path (str): a directory of .html files or a page cache directory
+
+    Returns:
+        pages (list): (name, html bytes) for every page
+    '''
+    pages = []
+    if os.path.exists(os.path.join(path, 'index.db')):
+        cache = page_cache.PageCache(path, mode='replay')
+        urls = [row[0] for row in
+                cache.connection.execute('SELECT url FROM pages;')]
+        for url in urls:
+            page = cache.read(cache.lookup(url))
+            if page != None:
+                pages.append((url, page.content))
+        cache.close()
+        return pages
+
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith('.html') or filename.endswith('.htm'):
+            with open(os.path.join(path, filename), 'rb') as f:
+                pages.append((filename, f.read()))
+    return pages
+
+def classify(html):
+    '''
+    Works out which parser a saved page belongs to
+
+    Inputs:
+        html (bytes): a saved page
+
+    Returns:
+        The subcrawl of a fbref page (a key of scraper.SUBCRAWLS), 'wiki'
+        for the Wikipedia records page, or None if the page is neither
+    '''
+    for sub, (_, spec) in scraper.SUBCRAWLS.items():
+        if ('id="' + spec.table_id + '"').encode('utf8') in html:
+            return sub
+    if b'wikitable sortable' in html:
+        return 'wiki'
+    return None
+
+def scale_page(html, table_id, factor):
+    '''
+    Makes a synthetic page with the rows of its stats table repeated
+
+    Inputs:
+        html (bytes): a saved fbref page
+        table_id (str): the id of the stats table
+        factor (int): how many copies of the rows the new table has
+
+    Returns:
+        The new page's html, or the page unchanged if it has no table body
+    '''
+    start = html.find(('id="' + table_id + '"').encode('utf8'))
+    body_start = html.find(b'<tbody>', start)
+    body_end = html.find(b'</tbody>', body_start)
+    if start == -1 or body_start == -1 or body_end == -1:
+        return html
+
+    body_start += len(b'<tbody>')
+    rows = html[body_start:body_end]
+    return html[:body_start] + rows * factor + html[body_end:]
+
+class Timers:
+    '''
+    Adds up the time spent in each timed function
+    '''
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def time(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return result
+
+def peak_rss_mb():
+    '''
+    The most memory this process has used so far, in megabytes
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def run(pages, db, repeat=1, scale=1):
+    '''
+    Replays pages through the parsers and the database writes
+
+    Inputs:
+        pages (list): (name, html bytes) for every page
+        db (str): the database to write to
+        repeat (int): how many times to replay the corpus
+        scale (int): how many copies of each fbref stats table's rows to use
+
+    Returns:
+        A dict of results: pages, rows, seconds and per function timers
+    '''
+    timers = Timers()
+    n_pages = 0
+    n_rows = 0
+    start = time.perf_counter()
+
+    # get_tables builds and writes a page's tables in one transaction, as a
+    # crawl does. Its parse_tables call is timed on its own, and the rest of
+    # it is the write.
+    parse_tables = scraper.parse_tables
+    def timed_parse_tables(page, spec):
+        return timers.time('parse_tables', parse_tables, page, spec)
+    scraper.parse_tables = timed_parse_tables
+
+    try:
+        for _ in range(repeat):
+            for name, html in pages:
+                sub = classify(html)
+                if sub == None:
+                    continue
+
+                if sub == 'wiki':
+                    soup = timers.time('bs4', bs4.BeautifulSoup, html,
+                                       'html.parser')
+                    goals = timers.time('parse_wiki_table',
+                                        scraper.parse_wiki_table, soup)
+                    n_rows += len(goals)
+                    n_pages += 1
+                    continue
+
+                starting_url, spec = scraper.SUBCRAWLS[sub]
+                if scale > 1:
+                    html = scale_page(html, spec.table_id, scale)
+                page = timers.time('extract', scraper.parse_page, html,
+                                   spec.table_id)
+                timers.time('get_links', scraper.get_links, page,
+                            starting_url, sub)
+                timers.time('write', scraper.get_tables, page, spec, db)
+                n_rows += page.n_rows
+                n_pages += 1
+    finally:
+        scraper.parse_tables = parse_tables
+
+    if 'write' in timers.seconds:
+        timers.seconds['write'] -= timers.seconds['parse_tables']
+
+    return {'pages': n_pages,
+            'rows': n_rows,
+            'seconds': time.perf_counter() - start,
+            'timers': timers}
+
+def run_measured(pages, db, repeat=1, scale=1):
+    '''
+    Runs the benchmark with the per table write messages kept out of the
+    report, closes the database and notes the process's peak RSS
+
+    Returns:
+        The results of run with peak_rss_mb added
+    '''
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            results = run(pages, db, repeat, scale)
+    db_writer.close_writers()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def run_isolated(pages, db, repeat=1, scale=1):
+    '''
+    Runs run_measured in a new process, since the peak RSS of a process only
+    grows and would otherwise carry over from one run to the next
+    '''
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_measured, pages, db, repeat, scale).result()
+
+def report(label, results):
+    '''
+    Prints the results of a run
+    '''
+    seconds = results['seconds'] or 1e-9
+    print()
+    print(label)
+    print('  pages:', results['pages'], ' rows:', results['rows'],
+          ' seconds:', round(seconds, 3))
+    print('  pages/sec:', round(results['pages'] / seconds, 1),
+          ' rows/sec:', round(results['rows'] / seconds, 1))
+    print('  peak RSS (MB):', round(results['peak_rss_mb'], 1))
+    timers = results['timers']
+    for name in sorted(timers.seconds, key=timers.seconds.get, reverse=True):
+        print('  {:<18}{:>10.3f} s {:>8} calls'.format(
+            name, timers.seconds[name], timers.calls[name]))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scraper '
+                                     'parsers on saved pages')
+    parser.add_argument('corpus', help='directory of saved pages or a page '
+                        'cache directory')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='also run with each stats table repeated this '
+                        'many times')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='replay the corpus this many times')
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    print('Loaded', len(pages), 'pages from', args.corpus)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = os.path.join(tmp_dir, 'benchmark.db')
+        corpus_results = run_isolated(pages, db, args.repeat)
+        if args.scale > 1:
+            scaled_results = run_isolated(pages, db, args.repeat, args.scale)
+        report('Corpus', corpus_results)
+        if args.scale > 1:
+            report('Synthetic, ' + str(args.scale) + 'x rows', scaled_results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+'''
+Bootstrap confidence intervals for WAR. Every resample refits the goals
+to wins regression on a resample of the club seasons it was trained on, and
+redraws each table's players with replacement. The drawn players give the
+table its Average and Replacement players and the lowest and highest goal
+differential WAR is scaled over. Each player's WAR is then scored against
+every resampled table, and the bounds over the resamples are stored next to
+WAR as WAR_lower and WAR_upper.
+
+WAR is min-max normalized within each table, so a resample that only moved
+the regression's slope or the replacement level would cancel out and leave
+every player's WAR where it was. The range moving with the players drawn is
+what the intervals measure: how much a player's WAR depends on which other
+players the table happened to have. A player who sets the table's range can
+have WAR outside 0 to 6 in resamples that leave them out.
+
+A player's goal differential only moves with the replacement player through
+the features measured against it, by the same amount for every player of the
+table, so each resample comes down to a few numbers per table. Only turning
+them into every player's WAR is done per player, in chunks of players spread
+over a pool of processes.
+
+join_years computes the intervals when it is given a number of resamples,
+for the seasons that do not have them from that many already. Changing the
+number of resamples never joins a season again:
+
+    python scraper.py --rebuild --bootstrap 1000 --jobs 4
+'''
+import warnings
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import war_calc as war
+import baselines
+
+# the share of resamples the interval covers
+CONFIDENCE = 0.95
+
+# the most players whose WAR is computed over every resample at once
+CHUNK_SIZE = 2000
+
+def coef_samples(n_resamples, coef, rng):
+    '''
+    Refits the goals to wins regression on resamples of its training rows
+
+    Inputs:
+        n_resamples (int): the number of resamples
+        coef (float): the coefficient of the fit, used for every resample
+            if the saved fit does not have its training rows
+        rng (Generator): the random number generator
+
+    Returns:
+        An array of one coefficient per resample
+    '''
+    training = war.regr_training_data()
+    if training == None:
+        print('No regression training rows saved, WAR intervals only '
+              'resample the players')
+        return np.full(n_resamples, float(coef))
+
+    X, y = training
+    rows = rng.integers(0, len(X), size=(n_resamples, len(X)))
+    xs = X[rows] - X[rows].mean(axis=1, keepdims=True)
+    ys = y[rows] - y[rows].mean(axis=1, keepdims=True)
+    return (xs*ys).sum(axis=1)/(xs*xs).sum(axis=1)
+
+def resampled_means(X, counts):
+    '''
+    The mean of every column of X over many resamples of its rows, skipping
+    NaN like DataFrame.mean
+
+    Inputs:
+        X (array): a table's player features
+        counts (array): how many times each resample draws each row, one
+            row per resample
+
+    Returns:
+        An array with a row per resample and a column per feature
+    '''
+    finite = np.isfinite(X)
+    totals = counts @ np.where(finite, X, 0)
+    numbers = counts @ (~np.isnan(X)).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals/numbers
+
+    # infinite values drawn make the mean infinite, or NaN if both signs are
+    positive = (counts @ np.isposinf(X).astype(float)) > 0
+    negative = (counts @ np.isneginf(X).astype(float)) > 0
+    means[positive] = np.inf
+    means[negative] = -np.inf
+    means[positive & negative] = np.nan
+    return means
+
+def table_samples(X, gd, group_pos, lengths, n_resamples, rng):
+    '''
+    Redraws the players of every table with replacement, and finds each
+    resampled table's Average and Replacement players and its range of goal
+    differential
+
+    Inputs:
+        X (array): the stacked feature matrices of every table, see
+            war_calc.score
+        gd (array): the goal differential of every row of X with no features
+            centered, see war_calc.goal_differential
+        group_pos (array): the index in war_calc.POSITIONS of each table
+        lengths (array): the number of rows of each table, with its
+            baseline rows
+        n_resamples (int): the number of resamples
+        rng (Generator): the random number generator
+
+    Returns:
+        (average, replacement, gd_low, gd_high). average and replacement are
+        arrays of features with a row per resample, a column per table and a
+        last axis per feature. gd_low and gd_high have a row per resample and
+        a column per table.
+    '''
+    starts = war.segments(lengths)[0]
+    n_players = np.asarray(lengths) - len(war.BASELINES)
+    average = np.full((n_resamples, len(lengths), X.shape[1]), np.nan)
+    gd_low = np.full((n_resamples, len(lengths)), np.nan)
+    gd_high = np.full((n_resamples, len(lengths)), np.nan)
+    for group, (start, n) in enumerate(zip(starts, n_players)):
+        if n == 0:
+            continue
+        counts = rng.multinomial(n, np.full(n, 1/n), size=n_resamples)
+        average[:, group] = resampled_means(X[start:start + n], counts)
+        drawn = np.where(counts > 0, gd[start:start + n], np.nan)
+        gd_low[:, group] = np.fmin.reduce(drawn, axis=1)
+        gd_high[:, group] = np.fmax.reduce(drawn, axis=1)
+    average[..., war.FEATURES.index('const')] = 1
+    replacement = average*baselines.REPLACEMENT_LEVEL
+    replacement[..., war.FEATURES.index('const')] = 1
+    return (average, replacement, gd_low, gd_high)
+
+def war_bounds(gd, groups, coefs, offset, low, scale, quantiles):
+    '''
+    The bounds of the WAR of a chunk of players over every resample. Runs
+    in a worker process.
+
+    Inputs:
+        gd (array): each player's goal differential with no features
+            centered, see war_calc.goal_differential
+        groups (array): each player's table
+        coefs (array): the regression coefficient of each resample
+        offset (array): per resample and table, the goal differential the
+            table's players are measured from: its replacement player's,
+            plus what centering on it takes off every player
+        low (array): per resample and table, the lowest raw WAR
+        scale (array): per resample and table, one over the raw WAR's range
+        quantiles (list): the lower and upper quantile, in percent
+
+    Returns:
+        An array of the lower and upper bound of each player
+    '''
+    scale = scale[:, groups]
+    with np.errstate(invalid='ignore'):
+        raw_war = coefs[:, np.newaxis]*(gd[np.newaxis] - offset[:, groups])
+        war_samples = (raw_war*scale - low[:, groups]*scale)*6
+
+    # players whose WAR is NaN, like keepers of seasons without the stats
+    # for Raw_Save%, have NaN bounds
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(war_samples, quantiles, axis=0)
+
+def intervals(X, group_pos, lengths, coef, n_resamples, jobs=1, seed=None):
+    '''
+    Bootstraps the WAR of every player of many tables
+
+    Inputs:
+        X (array): the stacked feature matrices of every table, see
+            war_calc.score
+        group_pos (array): the index in war_calc.POSITIONS of each table
+        lengths (array): the number of rows of each table, with its
+            baseline rows
+        coef (float): wins per goal of differential, from find_regr
+        n_resamples (int): the number of resamples
+        jobs (int): the number of processes to spread the players over
+        seed (int): seed for the resamples so every build draws the same,
+            war_calc.RANDOM_SEED by default
+
+    Returns:
+        (lower, upper), arrays with a value per row of X that are NaN for the
+        baseline rows
+    '''
+    if seed == None:
+        seed = war.RANDOM_SEED
+    starts, replacement_rows, groups = war.segments(lengths)
+    n_groups = len(lengths)
+    player_rows = np.ones(len(X), dtype=bool)
+    player_rows[replacement_rows] = False
+    player_rows[replacement_rows - 1] = False
+    row_pos = np.asarray(group_pos)[groups]
+
+    # every player's goal differential before centering
+    gd = war.goal_differential(X, row_pos)
+
+    rng = np.random.default_rng(seed)
+    coefs = coef_samples(n_resamples, coef, rng)
+    average, replacement, gd_low, gd_high = table_samples(
+        X, gd, group_pos, lengths, n_resamples, rng)
+
+    # the baselines' goal differentials and the centering of each resample
+    centering = np.where(war.CENTERED[group_pos], replacement, 0)
+    table_pos = np.tile(group_pos, n_resamples)
+    shape = (n_resamples, n_groups)
+    with np.errstate(invalid='ignore'):
+        average_gd = war.goal_differential(
+            (average - centering).reshape(-1, X.shape[1]), table_pos)
+        replace_gd = war.goal_differential(
+            (replacement - centering).reshape(-1, X.shape[1]), table_pos)
+    shift = war.goal_differential(centering.reshape(-1, X.shape[1]),
+                                  table_pos).reshape(shape)
+    offset = shift + replace_gd.reshape(shape)
+    average_war = coefs[:, np.newaxis]*(average_gd.reshape(shape) -
+                                        replace_gd.reshape(shape))
+
+    # the range of raw WAR over each resampled table's players and
+    # baselines, where the replacement player is always 0
+    candidates = np.stack([coefs[:, np.newaxis]*(gd_low - offset),
+                           coefs[:, np.newaxis]*(gd_high - offset),
+                           average_war, np.zeros(shape)])
+    low = np.fmin.reduce(candidates, axis=0)
+    spread = np.fmax.reduce(candidates, axis=0) - low
+    scale = 1/np.where(spread == 0, 1, spread)
+
+    tail = (1 - CONFIDENCE)/2*100
+    quantiles = [tail, 100 - tail]
+    rows = np.flatnonzero(player_rows)
+    chunks = [rows[i:i + CHUNK_SIZE] for i in range(0, len(rows), CHUNK_SIZE)]
+    args = [(gd[chunk], groups[chunk], coefs, offset, low, scale, quantiles)
+            for chunk in chunks]
+    if jobs <= 1:
+        bounds = [war_bounds(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            bounds = list(pool.map(war_bounds, *zip(*args)))
+
+    lower = np.full(len(X), np.nan)
+    upper = np.full(len(X), np.nan)
+    for chunk, (chunk_lower, chunk_upper) in zip(chunks, bounds):
+        lower[chunk] = chunk_lower
+        upper[chunk] = chunk_upper
+    return (lower, upper)
+
+def add_intervals(tables, coef, n_resamples, jobs=1):
+    '''
+    Adds the WAR_lower and WAR_upper columns to many joined tables, after
+    war_calc.add_war_batch
+
+    Inputs:
+        tables (list): (df, pos, baseline_df) for each table, see
+            war_calc.add_war_batch
+        coef (float): wins per goal of differential, from find_regr
+        n_resamples (int): the number of resamples
+        jobs (int): the number of processes to spread the players over
+
+    Returns:
+        A list of the tables with WAR_lower and WAR_upper
+    '''
+    if len(tables) == 0:
+        return []
+
+    X, group_pos, lengths = war.stack(tables)
+    lower, upper = intervals(X, group_pos, lengths, coef, n_resamples, jobs)
+
+    # players without WAR, like the keepers of a table where one has an
+    # infinite Raw_Save%, get no interval from the resamples that leave the
+    # infinite one out
+    start = 0
+    for (df, pos, baseline_df), length in zip(tables, lengths):
+        rows = slice(start, start + len(df))
+        scored = df['WAR'].notnull().to_numpy()
+        df['WAR_lower'] = np.where(scored, lower[rows], np.nan)
+        df['WAR_upper'] = np.where(scored, upper[rows], np.nan)
+        start += length
+    return [df for df, _, _ in tables]
@@ -0,0 +1,225 @@
+'''
+The secondary indexes behind the site's search form. The build creates them
+on the player_season table the site queries and on every -JOIN table, runs
+ANALYZE so SQLite's planner knows how selective they are, and writes a report
+of the query plan of each query shape the form can produce and of each
+career and rolling WAR leaderboard.
+
+To add the indexes to an existing database and write the report, run:
+
+    python db_indexes.py [DB] [--report FILE]
+'''
+import os
+import argparse
+import importlib.util
+
+import db_writer
+import player_season
+import player_career
+
+# player_info lives with the site, and builds the queries the report explains
+PLAYER_INFO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'soccer_war_site', 'player_info.py')
+
+# the file the build writes the query plan report to
+REPORT = 'query_plans.txt'
+
+# indexes on player_season, on top of the ones it is created with. Every
+# search is for one position group, so it leads every index.
+SEASON_INDEXES = {
+    'ix_player_season_squad': ['position_group', 'Squad', 'WAR DESC'],
+    'ix_player_season_nation': ['position_group', 'Nation', 'Age'],
+    'ix_player_season_age': ['position_group', 'Age'],
+    'ix_player_season_gls': ['position_group', 'Gls'],
+    'ix_player_season_ast': ['position_group', 'Ast'],
+}
+
+# indexes on each -JOIN table, by the columns they cover. Goalkeeping tables
+# have no Gls or Ast, so indexes on columns a table lacks are skipped.
+JOIN_INDEXES = [
+    ['player_id'],
+    ['Player'],
+    ['Squad', 'WAR DESC'],
+    ['Nation', 'Age'],
+    ['Age'],
+    ['Gls'],
+    ['Ast'],
+    ['WAR DESC'],
+]
+
+# the query shapes the search form produces, as the arguments it passes to
+# player_info.find_players
+QUERY_SHAPES = [
+    ('Player, all seasons',
+     {'Pos': 'FW', 'season': 'All', 'order_by': 'None',
+      'Player': 'Harry Kane'}),
+    ('All seasons, newest first',
+     {'Pos': 'FW', 'season': 'All', 'order_by': 'None'}),
+    ('All seasons by WAR',
+     {'Pos': 'MF', 'season': 'All', 'order_by': 'WAR'}),
+    ('One season by WAR',
+     {'Pos': 'DF', 'season': '2018-2019', 'order_by': 'WAR'}),
+    ('Squads by WAR',
+     {'Pos': 'FW', 'season': 'All', 'order_by': 'WAR',
+      'Squad': ['Arsenal', 'Chelsea']}),
+    ('Nation and age',
+     {'Pos': 'GK', 'season': 'All', 'order_by': 'Age', 'Nation': 'ENG',
+      'age_lower': 20, 'age_upper': 26}),
+    ('Age range',
+     {'Pos': 'WB', 'season': 'All', 'order_by': 'None', 'Nation': 'All',
+      'age_lower': 18, 'age_upper': 21}),
+    ('Goals range by goals',
+     {'Pos': 'FW', 'season': 'All', 'order_by': 'Goals', 'gls_lower': 20,
+      'gls_upper': 40}),
+    ('Assists range',
+     {'Pos': 'WING', 'season': '2019-2020', 'order_by': 'WAR',
+      'Ast': (10, 20)}),
+]
+
+# the leaderboards, as the arguments to player_career.leaderboard_query
+LEADERBOARD_SHAPES = [
+    ('Careers by WAR', {}),
+    ('Careers by WAR per 90',
+     {'order_by': 'WAR_per_90', 'min_minutes': 2700}),
+    ('Last 3 seasons by WAR', {'span': 3, 'last_season': '2019-2020'}),
+    ('Last 5 seasons by WAR per 90',
+     {'span': 5, 'last_season': '2019-2020', 'order_by': 'WAR_per_90'}),
+    ('Best 3 season spells', {'span': 3}),
+]
+
+def index_sql(name, table, columns):
+    '''
+    The statement that creates an index
+
+    Inputs:
+        name (str): the name of the index
+        table (str): the table to index
+        columns (list): the indexed columns, each optionally followed by
+            ' DESC'
+
+    Returns:
+        The CREATE INDEX statement
+    '''
+    columns = [db_writer.quote(col.split(' ')[0]) + col[len(col.split(' ')[0]):]
+               for col in columns]
+    return ('CREATE INDEX IF NOT EXISTS ' + db_writer.quote(name) + ' ON ' +
+            db_writer.quote(table) + ' (' + ', '.join(columns) + ');')
+
+def join_tables(connection):
+    '''
+    The names of every -JOIN table in a database
+    '''
+    tables = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table';")]
+    return sorted([table for table in tables
+                   if player_season.JOIN_TABLE.match(table) != None])
+
+def create_indexes(db):
+    '''
+    Creates the search indexes on player_season and the -JOIN tables, then
+    runs ANALYZE
+
+    Inputs:
+        db (str): the database to index
+
+    Returns:
+        None
+    '''
+    writer = db_writer.get_writer(db)
+    player_season.create_table(writer)
+    player_career.create_table(writer)
+    with writer.transaction():
+        for name, columns in SEASON_INDEXES.items():
+            writer.connection.execute(index_sql(name, player_season.TABLE,
+                                                columns))
+
+        for table in join_tables(writer.connection):
+            table_columns = [row[1] for row in writer.connection.execute(
+                'PRAGMA table_info(' + db_writer.quote(table) + ');')]
+            for columns in JOIN_INDEXES:
+                names = [col.split(' ')[0] for col in columns]
+                if not set(names).issubset(table_columns):
+                    continue
+                name = 'ix_' + table + '_' + '_'.join(names)
+                writer.connection.execute(index_sql(name, table, columns))
+
+    writer.connection.execute('ANALYZE;')
+    print('Indexed', db)
+
+def explain(connection, query, args):
+    '''
+    The query plan SQLite picks for a query
+
+    Returns:
+        A list of the plan's steps
+    '''
+    rows = connection.execute('EXPLAIN QUERY PLAN ' + query, args).fetchall()
+    return [row[-1] for row in rows]
+
+def load_player_info():
+    '''
+    Imports the site's player_info module from its file, without putting
+    the site's directory on the import path
+    '''
+    spec = importlib.util.spec_from_file_location('player_info', PLAYER_INFO)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def write_report(db, path):
+    '''
+    Writes the query plan of every search form query shape and leaderboard
+    to a file. Steps that scan a whole table or sort without an index are
+    marked, a scan of an index in the order asked for is not, and neither
+    is the b-tree a DISTINCT drops repeated rows with.
+
+    Inputs:
+        db (str): the database the site queries
+        path (str): the file to write the report to
+
+    Returns:
+        The number of query shapes that scan or sort without an index
+    '''
+    connection = db_writer.get_writer(db).connection
+    player_info = load_player_info()
+    shapes = ([(label,) + player_info.build_query(args_from_ui)
+               for label, args_from_ui in QUERY_SHAPES] +
+              [(label,) + player_career.leaderboard_query(**kwargs)
+               for label, kwargs in LEADERBOARD_SHAPES])
+    unindexed = 0
+    with open(path, 'w') as f:
+        for label, query, args in shapes:
+            plan = explain(connection, query, args)
+            # the b-tree of a DISTINCT only holds the rows the search
+            # returned, to drop repeats, and does not reorder them
+            slow = [step for step in plan if
+                    (step.startswith('SCAN') and 'USING' not in step) or
+                    ('TEMP B-TREE' in step and 'DISTINCT' not in step)]
+            if slow:
+                unindexed += 1
+
+            f.write('-- ' + label + '\n')
+            f.write(query + '\n')
+            for step in plan:
+                marker = '  ** ' if step in slow else '     '
+                f.write(marker + step + '\n')
+            f.write('\n')
+
+    print('Wrote query plans to', path + ',', unindexed, 'of',
+          len(shapes), 'query shapes scan or sort without an index')
+    return unindexed
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the search indexes '
+                                     'and report the query plans')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to index')
+    parser.add_argument('--report', default=REPORT,
+                        help='the file to write the query plans to')
+    args = parser.parse_args()
+    create_indexes(args.db)
+    write_report(args.db, args.report)
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+# pragmas for building the database: the build can always be rerun, so it
+# trades crash safety for speed, and WAL lets the web app keep reading
+BUILD_PRAGMAS = [
+    'PRAGMA journal_mode = WAL;',
+    'PRAGMA synchronous = NORMAL;',
+    'PRAGMA cache_size = -65536;',
+    'PRAGMA temp_store = MEMORY;',
+]
+
+def sql_type(dtype):
+    '''
+    The SQLite column type for a pandas dtype
+    '''
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def quote(name):
+    '''
+    Quotes a table or column name for use in a statement
+    '''
+    return '"' + str(name).replace('"', '""') + '"'
+
+def to_python(value):
+    '''
+    Converts a numpy scalar to the python type sqlite3 can bind
+    '''
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return int(value)
+    return value
+
+def to_rows(df):
+    '''
+    The rows of a DataFrame as tuples sqlite3 can bind, with NaN as NULL
+    '''
+    values = df.astype(object).where(df.notna(), None)
+    return [tuple(to_python(value) for value in row)
+            for row in values.itertuples(index=False, name=None)]
+
+class SQLiteWriter:
+    '''
+    Writes DataFrames to a SQLite database over one connection that is kept
+    open for the whole build. Writes inside a transaction() block are
+    committed together, and transactions can be nested.
+    '''
+    def __init__(self, db, pragmas=BUILD_PRAGMAS):
+        self.db = db
+        self.connection = sqlite3.connect(db, isolation_level=None,
+                                          check_same_thread=False)
+        self.lock = threading.RLock()
+        self.depth = 0
+        for pragma in pragmas:
+            self.connection.execute(pragma)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Groups every write in the block into a single transaction. A nested
+        block becomes a savepoint of the transaction around it.
+        '''
+        with self.lock:
+            savepoint = 'sp_' + str(self.depth)
+            if self.depth == 0:
+                self.connection.execute('BEGIN;')
+            else:
+                self.connection.execute('SAVEPOINT ' + savepoint + ';')
+            self.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.connection.execute('ROLLBACK;')
+                else:
+                    self.connection.execute('ROLLBACK TO ' + savepoint + ';')
+                    self.connection.execute('RELEASE ' + savepoint + ';')
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.connection.execute('COMMIT;')
+            else:
+                self.connection.execute('RELEASE ' + savepoint + ';')
+
+    def write(self, df, name, index=True, types=None):
+        '''
+        Replaces a table with the contents of a DataFrame
+
+        Inputs:
+            df (DataFrame): the data to write
+            name (str): the name of the table
+            index (bool): also write the DataFrame's index as a column,
+                like pandas' to_sql does
+            types (dict): column name to the SQLite type to declare for it.
+                Columns not in types get the type of their dtype.
+
+        Returns:
+            None
+        '''
+        # like pandas, the index column is 'index' unless the DataFrame
+        # already has a column by that name, then it is 'level_0'
+        if index:
+            df = df.reset_index()
+            label = df.columns[0]
+
+        types = types or {}
+        columns = [quote(col) + ' ' + types.get(col, sql_type(dtype))
+                   for col, dtype in zip(df.columns, df.dtypes)]
+        placeholders = ', '.join(['?'] * len(df.columns))
+
+        with self.transaction():
+            self.connection.execute('DROP TABLE IF EXISTS ' + quote(name) + ';')
+            self.connection.execute('CREATE TABLE ' + quote(name) + ' (' +
+                                    ', '.join(columns) + ');')
+            self.connection.executemany('INSERT INTO ' + quote(name) +
+                                        ' VALUES (' + placeholders + ');',
+                                        to_rows(df))
+            if index:
+                self.connection.execute(
+                    'CREATE INDEX ' + quote('ix_' + name + '_' + label) +
+                    ' ON ' + quote(name) + ' (' + quote(label) + ');')
+
+    def insert(self, df, name):
+        '''
+        Adds the rows of a DataFrame to an existing table, matching the
+        DataFrame's columns to the table's by name
+
+        Inputs:
+            df (DataFrame): the rows to add
+            name (str): the name of the table
+
+        Returns:
+            None
+        '''
+        columns = ', '.join([quote(col) for col in df.columns])
+        placeholders = ', '.join(['?'] * len(df.columns))
+        with self.transaction():
+            self.connection.executemany('INSERT INTO ' + quote(name) + ' (' +
+                                        columns + ') VALUES (' +
+                                        placeholders + ');', to_rows(df))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# one writer per database for the whole build
+WRITERS = {}
+WRITERS_LOCK = threading.Lock()
+
+def get_writer(db):
+    '''
+    Gets the writer for a database, opening it the first time it is used
+    '''
+    with WRITERS_LOCK:
+        if db not in WRITERS:
+            WRITERS[db] = SQLiteWriter(db)
+        return WRITERS[db]
+
+def close_writers():
+    '''
+    Closes every writer that has been opened
+    '''
+    with WRITERS_LOCK:
+        for writer in WRITERS.values():
+            writer.close()
+        WRITERS.clear()
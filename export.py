@@ -0,0 +1,209 @@
+'''
+Exports the WAR dataset, every season's -JOIN tables, as one columnar
+dataset partitioned by season and position group, and loads it back.
+
+The dataset is written as Arrow IPC files by default, which load() memory
+maps so that reading a column does not copy it. Parquet files are smaller
+to share but are decoded on every read. Either way a reader only touches the
+partitions and columns it asks for.
+
+Usage:
+    python export.py [DB] [--out DIR] [--format ipc|parquet]
+
+    import export
+    df = export.load_frame('war_dataset', columns=['Player', 'WAR'],
+                           season_names=['2019-2020'], positions=['FW'])
+'''
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+import seasons
+import season_join
+import player_season
+import table_schemas as schemas
+
+# the directory the dataset is written to
+DATASET = 'war_dataset'
+
+# the dataset's partition columns, as hive style directories like
+# season=2019-2020/position_group=FW
+PARTITIONING = ds.partitioning(pa.schema([('season', pa.string()),
+                                          ('position_group', pa.string())]),
+                               flavor='hive')
+
+# real columns kept at full precision, every other real is stored as float32
+FULL_PRECISION = ['Raw_Save%', 'Raw_GD', 'Raw_WAR', 'Normed_WAR', 'WAR',
+                  'WAR_lower', 'WAR_upper']
+
+# text columns with at most this many distinct values, like Squad and
+# Nation, are stored as categories
+MAX_CATEGORIES = 1000
+
+# the columns the database adds for its own row index
+INDEX_COLUMNS = ['index', 'level_0']
+
+# the values the joins fill a missing second position with, 0 as text or
+# as a real depending on the table
+NO_POSITION = ['0', '0.0']
+
+def read_joined(db):
+    '''
+    Reads every -JOIN table into one DataFrame
+
+    Inputs:
+        db (str): the players database
+
+    Returns:
+        A DataFrame of every player row of every -JOIN table, with season
+        and position_group columns. Columns a table lacks are missing, and
+        so is the Pos_2 of a player with one position.
+    '''
+    connection = sqlite3.connect(db)
+    names = season_join.table_names(connection)
+    frames = []
+    for season in seasons.get_seasons():
+        for pos in season_join.POSITIONS:
+            table = season+pos+'-JOIN'
+            if table not in names:
+                continue
+            df = pd.read_sql_query('SELECT * FROM "' + table + '";', connection)
+            df = df.loc[:,~df.columns.duplicated()]
+            df = df[~df['Player'].isin(player_season.BASELINE_ROWS)]
+            df = df.drop(columns=[col for col in INDEX_COLUMNS
+                                  if col in df.columns])
+            df['season'] = season
+            df['position_group'] = player_season.position_group(pos)
+            frames.append(df)
+    connection.close()
+    if len(frames) == 0:
+        raise ValueError(db + ' has no -JOIN tables to export, run the join '
+                         'first')
+
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    if 'Pos_2' in df.columns:
+        df['Pos_2'] = df['Pos_2'].where(
+            ~df['Pos_2'].astype(str).isin(NO_POSITION))
+    return df
+
+def smallest_int(values):
+    '''
+    The smallest nullable integer dtype that holds every value of a column
+    '''
+    for dtype in ['Int8', 'Int16', 'Int32']:
+        info = np.iinfo(dtype.lower())
+        if values.min() >= info.min and values.max() <= info.max:
+            return dtype
+    return 'Int64'
+
+def compact(df):
+    '''
+    Converts every column to the smallest dtype that holds it: repeated
+    text to categories, whole numbers to the smallest integer type and reals to
+    float32, except the WAR columns
+
+    Inputs:
+        df (DataFrame): the rows from read_joined
+
+    Returns:
+        The compacted DataFrame
+    '''
+    compacted = {}
+    for column in df.columns:
+        values = df[column]
+        if column in ['season', 'position_group']:
+            compacted[column] = values
+            continue
+
+        numbers = pd.to_numeric(values, errors='coerce')
+        is_text = (schemas.sql_types([column])[column] == 'TEXT' or
+                   numbers.isnull().sum() > values.isnull().sum())
+        if is_text:
+            values = values.where(values.isnull(), values.astype(str))
+            # every partition's file holds a column's whole dictionary, so
+            # only columns with few distinct values become categories
+            if values.nunique() <= MAX_CATEGORIES:
+                values = values.astype('category')
+            compacted[column] = values
+        elif numbers.notnull().any() and (numbers.dropna() % 1 == 0).all():
+            compacted[column] = numbers.astype(smallest_int(numbers.dropna()))
+        elif column in FULL_PRECISION:
+            compacted[column] = numbers.astype('float64')
+        else:
+            compacted[column] = numbers.astype('float32')
+    return pd.DataFrame(compacted)
+
+def export(db='players.db', path=DATASET, file_format='ipc'):
+    '''
+    Writes the WAR dataset
+
+    Inputs:
+        db (str): the players database
+        path (str): the directory to write the dataset to. Partitions
+            already there are replaced.
+        file_format (str): 'ipc' for Arrow IPC files or 'parquet'
+
+    Returns:
+        None
+    '''
+    df = compact(read_joined(db))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(table, path, format=file_format,
+                     partitioning=PARTITIONING,
+                     existing_data_behavior='delete_matching')
+    print('Wrote ', table.num_rows, ' rows and ', table.num_columns,
+          ' columns to ', path)
+
+def load(path=DATASET, columns=None, season_names=None, positions=None,
+         file_format='ipc'):
+    '''
+    Loads the WAR dataset, memory mapping its files
+
+    Inputs:
+        path (str): the dataset's directory
+        columns (list): the columns to load, or None for all of them
+        season_names (list): the seasons to load, or None for all of them
+        positions (list): the position groups to load, like 'FW', or None
+            for all of them
+        file_format (str): the format the dataset was written in
+
+    Returns:
+        A pyarrow Table
+    '''
+    dataset = ds.dataset(path, format=file_format, partitioning=PARTITIONING,
+                         filesystem=fs.LocalFileSystem(use_mmap=True))
+    # only the partitions that match are read
+    condition = ds.scalar(True)
+    if season_names != None:
+        condition = condition & ds.field('season').isin(season_names)
+    if positions != None:
+        condition = condition & ds.field('position_group').isin(positions)
+    return dataset.to_table(columns=columns, filter=condition)
+
+def load_frame(path=DATASET, columns=None, season_names=None, positions=None,
+               file_format='ipc'):
+    '''
+    Loads the WAR dataset as a pandas DataFrame, see load
+    '''
+    table = load(path, columns, season_names, positions, file_format)
+    return table.to_pandas()
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the WAR dataset')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to export')
+    parser.add_argument('--out', default=DATASET,
+                        help='the directory to write the dataset to')
+    parser.add_argument('--format', dest='file_format', default='ipc',
+                        choices=['ipc', 'parquet'],
+                        help='Arrow IPC files to memory map, or Parquet')
+    args = parser.parse_args()
+    export(args.db, args.out, args.file_format)
+
+if __name__ == '__main__':
+    main()
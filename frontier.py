@@ -0,0 +1,172 @@
+import os
+import json
+import heapq
+import urllib.parse
+
+import seasons
+
+def canonicalize(url):
+    '''
+    Reduce an url to one canonical spelling so that the same page is only
+    crawled once. Uses https, lowercases the host, drops default ports,
+    fragments and trailing slashes.
+
+    Inputs:
+        url (str): an absolute url
+
+    Returns:
+        The canonical url
+    '''
+    parsed = urllib.parse.urlparse(url)
+    scheme = parsed.scheme.lower()
+    if scheme == 'http':
+        scheme = 'https'
+
+    netloc = parsed.netloc.lower()
+    if netloc.endswith(':80') or netloc.endswith(':443'):
+        netloc = netloc.rsplit(':', 1)[0]
+
+    path = parsed.path
+    while len(path) > 1 and path.endswith('/'):
+        path = path[:-1]
+    if path == '':
+        path = '/'
+
+    return urllib.parse.urlunparse((scheme, netloc, path, parsed.params,
+                                    parsed.query, ''))
+
+def season_priority(url):
+    '''
+    Orders urls so that the newest season is crawled first. Urls that do not
+    name a season are the current season's pages and come before all others.
+
+    Inputs:
+        url (str): an absolute url
+
+    Returns:
+        priority (int): lower values are crawled first
+    '''
+    season = seasons.season_of(url)
+    if season == None:
+        return -10000
+    return -int(season[:4])
+
+class Frontier:
+    '''
+    The set of pages a crawl still has to visit. Keeps a seen set of
+    canonical urls so that adding a link is O(1), hands out urls newest
+    season first, and can be checkpointed to disk so an interrupted crawl
+    resumes where it stopped.
+    '''
+    def __init__(self, checkpoint=None, priority=season_priority):
+        self.checkpoint = checkpoint
+        self.priority = priority
+        self.heap = []
+        self.count = 0
+        self.seen = set()
+        self.active = set()
+        self.crawled = set()
+
+        if checkpoint != None and os.path.exists(checkpoint):
+            self.load()
+
+    def put(self, url):
+        '''
+        Add an url to the frontier unless it has been seen before
+
+        Inputs:
+            url (str): an absolute url
+
+        Returns:
+            True if the url was added, False if it was already seen
+        '''
+        key = canonicalize(url)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        heapq.heappush(self.heap, (self.priority(url), self.count, url))
+        self.count += 1
+        return True
+
+    def get(self):
+        '''
+        Take the next url to crawl off the frontier
+        '''
+        url = heapq.heappop(self.heap)[2]
+        self.active.add(url)
+        return url
+
+    def empty(self):
+        return len(self.heap) == 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def is_crawled(self, url):
+        '''
+        Has the page at url been crawled already?
+        '''
+        return canonicalize(url) in self.crawled
+
+    def mark_crawled(self, url, final_url=None):
+        '''
+        Record that an url has been crawled. The url it redirected to is
+        recorded as well so that links to either are skipped from now on.
+
+        Inputs:
+            url (str): the url that was taken off the frontier
+            final_url (str): the true url of the page after redirects
+        '''
+        self.active.discard(url)
+        for page in (url, final_url):
+            if page != None:
+                key = canonicalize(page)
+                self.seen.add(key)
+                self.crawled.add(key)
+        self.save()
+
+    def mark_failed(self, url):
+        '''
+        Record that an url could not be fetched
+        '''
+        self.active.discard(url)
+        self.save()
+
+    def save(self):
+        '''
+        Write the frontier's state to its checkpoint file, if it has one.
+        Pages that were being crawled are saved as still pending.
+        '''
+        if self.checkpoint == None:
+            return
+
+        pending = [url for _, _, url in sorted(self.heap)]
+        pending.extend(sorted(self.active))
+        state = {'pending': pending,
+                 'seen': sorted(self.seen),
+                 'crawled': sorted(self.crawled)}
+
+        tmp_path = self.checkpoint + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    def load(self):
+        '''
+        Restore the frontier's state from its checkpoint file
+        '''
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+
+        self.seen = set(state['seen'])
+        self.crawled = set(state['crawled'])
+        for url in state['pending']:
+            heapq.heappush(self.heap, (self.priority(url), self.count, url))
+            self.count += 1
+
+    def finish(self):
+        '''
+        Remove the checkpoint file once a crawl has completed
+        '''
+        if self.checkpoint != None and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
@@ -0,0 +1,417 @@
+'''
+Match by match WAR during a live season. Each match log row adds one
+player's stats from one match to their season to date in player_season, and
+only the players in the log have their WAR recomputed.
+
+Every table keeps running totals of its players' stats, for its Average and
+Replacement players, and its lowest and highest goal differential. WAR is a
+player's goal differential scaled over the table's range, so as long as
+that range does not move, the players who did not play keep their WAR. Their
+Raw_GD and Raw_WAR move with the Replacement player by the same amount for
+the whole table, which is one UPDATE. Only when the range moves is the whole
+table scored again.
+
+The career and rolling WAR of every player whose WAR changed are rebuilt
+with their seasons. The -JOIN tables are left alone until the next join_years.
+
+Usage:
+    python live_war.py LOG.csv [DB]
+
+    import live_war
+    live = live_war.LiveWAR('players.db')
+    live.ingest(matchweek_log)
+
+A log has a season, position_group and player_id (or fbref_id) column, any
+of the columns in ADDITIVE, and optionally the columns in INFO.
+'''
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import war_calc as war
+import db_writer
+import player
+import baselines
+import player_season
+import player_career
+
+# the stats a match log adds to a player's season to date
+ADDITIVE = ['MP', 'Starts', 'Min', 'Gls', 'Ast', 'PK', 'PKatt', 'CrdY', 'CrdR',
+            'Sh', 'SoT', 'GA', 'SoTA', 'Saves', 'CS']
+
+# the columns of a log that describe a player rather than a match, the
+# latest value is kept
+INFO = ['Player', 'Nation', 'Pos_1', 'Pos_2', 'Squad', 'Age']
+
+# the columns written for a player whose stats or WAR change
+SCORES = ['Raw_GD', 'Raw_WAR', 'Normed_WAR', 'WAR']
+
+class GroupState:
+    '''
+    The season to date of one season and position group
+
+    Attributes:
+        season (str): the season, like '2019-2020'
+        position_group (str): the position group, like 'FW'
+        pos (int): the index of the position in war_calc.POSITIONS
+        stats (DataFrame): INFO, ADDITIVE and Raw_Save% of every player and
+            the rowid of their player_season row, indexed by player_id. Rows
+            of older builds without a player_id get a negative one.
+        gd (Series): each player's goal differential with no feature
+            centered, see war_calc.goal_differential
+        totals (Series): the sum of every stat over the players
+        low_id, high_id: the players with the lowest and highest gd
+    '''
+    def __init__(self, season, position_group, stats):
+        self.season = season
+        self.position_group = position_group
+        self.pos = war.POSITIONS.index('-' + position_group)
+        self.stats = stats
+        self.gd = self.goal_differential(stats)
+        self.totals = self.stats_sum(stats)
+        self.find_bounds()
+
+    def goal_differential(self, stats):
+        '''
+        The goal differential of some players, with no feature centered
+        '''
+        row_pos = np.full(len(stats), self.pos)
+        return pd.Series(war.goal_differential(war.features(stats), row_pos),
+                         index=stats.index)
+
+    def stats_sum(self, stats):
+        '''
+        The sum of every numeric stat over some players, NaN for a stat none
+        of them have
+        '''
+        return stats.reindex(columns=ADDITIVE + ['Raw_Save%']).sum(
+            min_count=1)
+
+    def find_bounds(self):
+        '''
+        Finds the lowest and highest goal differential over every player
+        '''
+        self.low_id = self.gd.idxmin() if self.gd.notnull().any() else None
+        self.high_id = self.gd.idxmax() if self.gd.notnull().any() else None
+
+    def baseline_df(self):
+        '''
+        The Average and Replacement players, like baselines.compute
+        '''
+        average = self.totals/len(self.stats)
+        return pd.DataFrame([average, average*baselines.REPLACEMENT_LEVEL],
+                            index=war.BASELINES)
+
+    def baseline_gd(self):
+        '''
+        The goal differentials the table's WAR depends on
+
+        Returns:
+            (average_gd, replace_gd, shift), the Average and Replacement
+            players' goal differentials with no feature centered, and what
+            centering on the Replacement player takes off every player
+        '''
+        X = war.features(self.baseline_df())
+        row_pos = np.full(len(X), self.pos)
+        average_gd, replace_gd = war.goal_differential(X, row_pos)
+        centering = np.where(war.CENTERED[self.pos], X[-1], 0)
+        shift = war.goal_differential(centering[np.newaxis], row_pos[:1])[0]
+        return (average_gd, replace_gd, shift)
+
+    def bounds(self):
+        '''
+        The lowest and highest goal differential over the players and the
+        baselines, which WAR is scaled over
+        '''
+        average_gd, replace_gd, shift = self.baseline_gd()
+        values = [average_gd, replace_gd]
+        if self.low_id != None:
+            values += [self.gd[self.low_id], self.gd[self.high_id]]
+        return (np.fmin.reduce(values), np.fmax.reduce(values))
+
+    def update(self, delta):
+        '''
+        Adds a log's stats to the season to date of its players
+
+        Inputs:
+            delta (DataFrame): the summed stats of the log, indexed by
+                player_id, with any INFO columns
+
+        Returns:
+            The player_ids of the players that are new to the table
+        '''
+        # a table only keeps the stats its players have, keepers have no Gls
+        empty = len(self.stats) == 0
+        tracked = [col for col in ADDITIVE if
+                   (empty and col in delta.columns) or
+                   (not empty and pd.notnull(self.totals[col]))]
+        stats = [col for col in tracked if col in delta.columns]
+        new_ids = delta.index.difference(self.stats.index)
+        old = self.stats.reindex(delta.index)
+        old.loc[new_ids, tracked] = 0
+
+        updated = old.copy()
+        for column in INFO:
+            if column in delta.columns:
+                updated[column] = delta[column].combine_first(old[column])
+        updated[stats] = old[stats].fillna(0) + delta[stats]
+        if self.position_group == 'GK':
+            save = (updated['SoTA'] - updated['GA'])/updated['SoTA']
+            updated['Raw_Save%'] = save.fillna(0)
+
+        existing = delta.index.difference(new_ids)
+        self.stats.loc[existing] = updated.loc[existing]
+        if len(new_ids) > 0:
+            self.stats = pd.concat([self.stats, updated.loc[new_ids]])
+
+        # keep the running totals, summing the table again if it was empty
+        # or a stat is infinite, since inf - inf is NaN
+        before = old.reindex(columns=self.totals.index).fillna(0)
+        after = updated.reindex(columns=self.totals.index).fillna(0)
+        if (empty or not np.isfinite(before.to_numpy(dtype=float)).all() or
+                not np.isfinite(after.to_numpy(dtype=float)).all()):
+            self.totals = self.stats_sum(self.stats)
+        else:
+            self.totals = self.totals + (after - before).sum()
+
+        # keep the running lowest and highest goal differential, finding
+        # them again only if the player who held one moved away from it
+        gd = self.goal_differential(updated)
+        old_gd = self.gd.reindex(gd.index)
+        self.gd.loc[existing] = gd.loc[existing]
+        if len(new_ids) > 0:
+            self.gd = pd.concat([self.gd, gd.loc[new_ids]])
+        moved_low = (self.low_id in gd.index and
+                     not gd[self.low_id] <= old_gd[self.low_id])
+        moved_high = (self.high_id in gd.index and
+                      not gd[self.high_id] >= old_gd[self.high_id])
+        if self.low_id == None or moved_low or moved_high:
+            self.find_bounds()
+        elif gd.notnull().any():
+            if gd.min() < self.gd[self.low_id]:
+                self.low_id = gd.idxmin()
+            if gd.max() > self.gd[self.high_id]:
+                self.high_id = gd.idxmax()
+        return new_ids
+
+    def score(self, coef, player_ids):
+        '''
+        Computes the WAR of some of the table's players
+
+        Inputs:
+            coef (float): wins per goal of differential
+            player_ids (Index): the players to score
+
+        Returns:
+            A DataFrame of SCORES indexed by player_id
+        '''
+        average_gd, replace_gd, shift = self.baseline_gd()
+        low_gd, high_gd = self.bounds()
+        gd = self.gd[player_ids].to_numpy(dtype=float)
+
+        # the same range of raw WAR war_calc.normalize finds over the table
+        candidates = [coef*(low_gd - replace_gd), coef*(high_gd - replace_gd),
+                      coef*(average_gd - replace_gd), 0]
+        low = np.fmin.reduce(candidates)
+        spread = np.fmax.reduce(candidates) - low
+        scale = 1/spread if spread != 0 else 1
+
+        raw_war = coef*(gd - replace_gd)
+        normed_war = raw_war*scale - low*scale
+        return pd.DataFrame({'Raw_GD': gd - shift, 'Raw_WAR': raw_war,
+                             'Normed_WAR': normed_war,
+                             'WAR': normed_war*6}, index=player_ids)
+
+class LiveWAR:
+    '''
+    Ingests match logs into the player_season table of a database
+
+    Inputs:
+        db (str): the players database
+        coef (float): wins per goal of differential, defaults to the saved
+            regression
+    '''
+    def __init__(self, db='players.db', coef=None):
+        self.writer = db_writer.get_writer(db)
+        player_career.create_table(self.writer)
+        if coef == None:
+            cached = war.read_regr_cache(war.REGR_CACHE)
+            coef = cached['coef'] if cached != None else war.find_regr()[0]
+        self.coef = coef
+        self.groups = {}
+
+    def group(self, season, position_group):
+        '''
+        The state of a season and position group, read from player_season
+        the first time it is needed
+        '''
+        key = (season, position_group)
+        if key not in self.groups:
+            columns = ['rowid', 'player_id'] + INFO + ADDITIVE + ['Raw_Save%']
+            select = ', '.join([db_writer.quote(col) for col in columns])
+            stats = pd.read_sql_query(
+                'SELECT ' + select + ' FROM ' + player_season.TABLE +
+                ''' WHERE season = ? AND position_group = ?;''',
+                self.writer.connection, params=key)
+            missing = stats['player_id'].isnull()
+            stats.loc[missing, 'player_id'] = -np.arange(1, missing.sum() + 1)
+            stats = stats.set_index(stats['player_id'].astype(int))
+            self.groups[key] = GroupState(season, position_group,
+                                          stats.drop(columns='player_id'))
+        return self.groups[key]
+
+    def prepare(self, log):
+        '''
+        Sums a log's rows by season, position group and player
+
+        Inputs:
+            log (DataFrame): the match log
+
+        Returns:
+            A DataFrame indexed by season, position_group and player_id
+        '''
+        log = log.copy()
+        if 'player_id' not in log.columns:
+            log['player_id'] = pd.Series(pd.NA, index=log.index,
+                                         dtype='Int64')
+        if 'fbref_id' in log.columns:
+            unknown = log['player_id'].isnull()
+            player.create_table(self.writer)
+            ids = player.player_ids(self.writer, log.loc[unknown, 'fbref_id'],
+                                    log.loc[unknown, 'Player'])
+            log['player_id'] = log['player_id'].astype('Int64').fillna(ids)
+        keys = ['season', 'position_group', 'player_id']
+        stats = [col for col in ADDITIVE if col in log.columns]
+        info = [col for col in INFO if col in log.columns]
+        aggregates = dict([(col, 'sum') for col in stats] +
+                          [(col, 'last') for col in info])
+        log[stats] = log[stats].apply(pd.to_numeric, errors='coerce')
+        return log.groupby(keys).agg(aggregates)
+
+    def rows(self, state, player_ids, scores):
+        '''
+        The player_season rows of some players of a table
+        '''
+        df = state.stats.loc[player_ids].join(scores)
+        df['player_id'] = df.index.where(df.index >= 0)
+        rows = df.reset_index(drop=True).reindex(columns=player_season.COLUMNS)
+        rows['season'] = state.season
+        rows['position_group'] = state.position_group
+        return rows
+
+    def write_players(self, state, player_ids, new_ids):
+        '''
+        Writes the stats and WAR of some players of a table, adding the new
+        ones. Their bootstrap bounds no longer hold and are cleared.
+        '''
+        rows = self.rows(state, player_ids,
+                         state.score(self.coef, player_ids))
+        new = rows['player_id'].isin(new_ids).to_numpy(dtype=bool)
+        existing = rows[~new].assign(
+            rowid=state.stats.loc[player_ids[~new], 'rowid'].to_numpy())
+        columns = INFO + ADDITIVE + ['Raw_Save%'] + SCORES
+        assignments = ', '.join([db_writer.quote(col) + ' = ?'
+                                 for col in columns])
+        self.writer.connection.executemany(
+            'UPDATE ' + player_season.TABLE + ' SET ' + assignments +
+            ', WAR_lower = NULL, WAR_upper = NULL WHERE rowid = ?;',
+            db_writer.to_rows(existing[columns + ['rowid']]))
+
+        if len(new_ids) > 0:
+            self.writer.insert(rows[new], player_season.TABLE)
+            rowids = pd.read_sql_query(
+                'SELECT rowid, player_id FROM ' + player_season.TABLE +
+                ''' WHERE season = ? AND position_group = ? AND player_id IN
+                (''' + ', '.join(['?']*len(new_ids)) + ');',
+                self.writer.connection,
+                params=[state.season, state.position_group] +
+                [int(player_id) for player_id in new_ids])
+            state.stats.loc[rowids['player_id'], 'rowid'] = \
+                rowids['rowid'].to_numpy()
+
+    def write_scores(self, state, player_ids):
+        '''
+        Writes the WAR of some players of a table whose stats did not change
+        '''
+        scores = state.score(self.coef, player_ids)
+        scores['rowid'] = state.stats.loc[player_ids, 'rowid']
+        self.writer.connection.executemany(
+            'UPDATE ' + player_season.TABLE + ' SET ' +
+            ', '.join([col + ' = ?' for col in SCORES]) +
+            ', WAR_lower = NULL, WAR_upper = NULL WHERE rowid = ?;',
+            db_writer.to_rows(scores))
+
+    def ingest(self, log):
+        '''
+        Adds a match log to the season to date of its players and updates
+        their WAR
+
+        Inputs:
+            log (DataFrame): the match log, see the module docstring
+
+        Returns:
+            (players, rescored), the number of players in the log and the
+            number of tables that were scored again because their range
+            moved
+        '''
+        deltas = self.prepare(log)
+        rescored = 0
+        changed_players = set(deltas.index.get_level_values('player_id'))
+        with self.writer.transaction():
+            for (season, position_group), delta in deltas.groupby(
+                    level=['season', 'position_group']):
+                state = self.group(season, position_group)
+                delta = delta.droplevel(['season', 'position_group'])
+
+                before_gd = state.baseline_gd()
+                before_bounds = state.bounds()
+                new_ids = state.update(delta)
+
+                if state.bounds() != before_bounds:
+                    # the range moved, so every player of the table gets
+                    # new WAR
+                    rescored += 1
+                    self.write_scores(state, state.stats.index.difference(
+                        delta.index))
+                    changed_players |= set(state.stats.index[
+                        state.stats.index >= 0])
+                else:
+                    # the players who did not play keep their WAR, and
+                    # their raw values move with the Replacement player
+                    after_gd = state.baseline_gd()
+                    self.writer.connection.execute(
+                        'UPDATE ' + player_season.TABLE + ''' SET
+                        Raw_GD = Raw_GD - ?, Raw_WAR = Raw_WAR - ?
+                        WHERE season = ? AND position_group = ?;''',
+                        (float(after_gd[2] - before_gd[2]),
+                         float(self.coef*(after_gd[1] - before_gd[1])),
+                         season, position_group))
+                self.write_players(state, delta.index, new_ids)
+
+                baselines.write_group(self.writer, state.baseline_df(),
+                                      season, position_group)
+            # the updates above write player_season directly, so caches
+            # built from it must see that it changed
+            player_season.bump_version(self.writer)
+            player_career.update(self.writer, changed_players)
+        return (len(deltas), rescored)
+
+def main():
+    parser = argparse.ArgumentParser(description='Add a match log to the '
+                                     'season to date and update WAR')
+    parser.add_argument('log', help='a csv file of match log rows')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to update')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    players, rescored = LiveWAR(args.db).ingest(pd.read_csv(args.log))
+    print('Updated', players, 'players in',
+          round(time.perf_counter() - start, 3), 'seconds,', rescored,
+          'tables scored again')
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
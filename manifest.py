@@ -0,0 +1,236 @@
+import json
+import time
+import sqlite3
+
+import seasons
+import db_writer
+
+class ScrapeManifest:
+    '''
+    A record of every season page the scraper has written to the database:
+    when it was last fetched, the hash of its stats table and how many rows
+    it had. Kept in the scrape_manifest table of the players database.
+
+    In incremental mode the manifest tells the crawl to only fetch seasons
+    that can still change or have never been scraped, and to skip parsing
+    and writing a page whose stats table has not changed since last time.
+
+    A season can be reached from more than one url, like the current season
+    from both the competition's landing page and its season url, so the
+    hash of every page is also kept by url in the scrape_pages table. Pages
+    are compared against their own last hash there, not against whichever
+    url last wrote the season.
+
+    Entries are written through the build's writer, so one is committed in
+    the same transaction as the page's tables and never waits on the
+    writer's lock from another connection. Lookups read through a
+    connection of the manifest's own, which WAL lets read while the writer
+    holds a transaction.
+    '''
+    def __init__(self, db='players.db', incremental=False):
+        self.incremental = incremental
+        self.writer = db_writer.get_writer(db)
+        connection = self.writer.connection
+        with self.writer.transaction():
+            connection.execute('''CREATE TABLE IF NOT EXISTS scrape_manifest (
+                                  sub TEXT,
+                                  season TEXT,
+                                  url TEXT,
+                                  last_fetched REAL,
+                                  content_hash TEXT,
+                                  row_count INTEGER,
+                                  PRIMARY KEY (sub, season));''')
+            connection.execute('''CREATE INDEX IF NOT EXISTS
+                                  ix_scrape_manifest_url
+                                  ON scrape_manifest (sub, url);''')
+            connection.execute('''CREATE TABLE IF NOT EXISTS scrape_pages (
+                                  sub TEXT,
+                                  url TEXT,
+                                  content_hash TEXT,
+                                  PRIMARY KEY (sub, url));''')
+            # manifests from before scrape_pages know the url that last
+            # wrote each season
+            connection.execute('''INSERT OR IGNORE INTO scrape_pages
+                                  SELECT sub, url, content_hash
+                                  FROM scrape_manifest;''')
+        self.connection = sqlite3.connect(db)
+
+    def get(self, sub, season):
+        '''
+        Reads the manifest entry for a subcrawl's season
+
+        Returns:
+            A dict of the entry's columns, or None if it was never scraped
+        '''
+        cursor = self.connection.execute('''SELECT * FROM scrape_manifest
+                                            WHERE sub = ? AND season = ?;''',
+                                         (sub, season))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return dict(zip([col[0] for col in cursor.description], row))
+
+    def needs_fetch(self, sub, season):
+        '''
+        Should the page for a subcrawl's season be fetched?
+
+        Inputs:
+            sub (str): the subcrawl
+            season (str): the season the page is for, or None for pages that
+                do not name a season (the current season)
+
+        Returns:
+            True unless running incrementally and the season is finished
+            and already in the manifest
+        '''
+        if not self.incremental or season == None:
+            return True
+        if seasons.season_is_open(season):
+            return True
+        return self.get(sub, season) == None
+
+    def is_unchanged(self, sub, url, content_hash):
+        '''
+        Has the stats table at url been scraped before with the same hash?
+        Always False when not running incrementally.
+        '''
+        if not self.incremental:
+            return False
+        row = self.connection.execute('''SELECT 1 FROM scrape_pages
+                                         WHERE sub = ? AND url = ?
+                                         AND content_hash = ?;''',
+                                      (sub, url, content_hash)).fetchone()
+        return row != None
+
+    def known_hashes(self):
+        '''
+        Reads the table hash of every page in the manifest, for stages that
+        run on other threads and cannot share the manifest's connection
+
+        Returns:
+            A dict of (sub, url) to content hash
+        '''
+        rows = self.connection.execute('''SELECT sub, url, content_hash
+                                          FROM scrape_pages;''')
+        return {(sub, url): content_hash for sub, url, content_hash in rows}
+
+    def record(self, sub, season, url, content_hash, row_count):
+        '''
+        Saves the manifest entry for a season page that was just written,
+        inside the writer's transaction around it if there is one
+        '''
+        with self.writer.transaction():
+            self.writer.connection.execute('''INSERT OR REPLACE INTO
+                                              scrape_manifest
+                                              VALUES (?, ?, ?, ?, ?, ?);''',
+                                           (sub, season, url, time.time(),
+                                            content_hash, row_count))
+            self.writer.connection.execute('''INSERT OR REPLACE INTO
+                                              scrape_pages
+                                              VALUES (?, ?, ?);''',
+                                           (sub, url, content_hash))
+
+    def close(self):
+        self.connection.close()
+
+class JoinManifest:
+    '''
+    A record of what every -JOIN table was built from: the content hashes
+    of the season's stats tables and the hash of the WAR parameters. Kept
+    in the join_manifest table of the players database.
+
+    A season's joined tables are stale when any of them is missing from the
+    manifest or was built from different tables or parameters, and only
+    stale seasons need to be joined again.
+
+    Each entry also keeps the number of bootstrap resamples the table's WAR
+    intervals were computed from, 0 until they are added. It is not part of
+    the parameters, so asking for a different number of resamples only
+    computes the intervals again instead of joining the season again.
+
+    The manifest writes through the build's writer so that an entry is
+    committed in the same transaction as the table it describes.
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+        self.connection = writer.connection
+        with writer.transaction():
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS join_manifest (
+                                       name TEXT PRIMARY KEY,
+                                       season TEXT,
+                                       source_hashes TEXT,
+                                       params_hash TEXT,
+                                       built_at REAL,
+                                       resamples INTEGER);''')
+            existing = [row[1] for row in self.connection.execute(
+                'PRAGMA table_info(join_manifest);')]
+            if 'resamples' not in existing:
+                self.connection.execute('ALTER TABLE join_manifest '
+                                        'ADD COLUMN resamples INTEGER;')
+
+    def is_stale(self, season, tables, source_hashes, params_hash):
+        '''
+        Do a season's joined tables need to be built again?
+
+        Inputs:
+            season (str): the season
+            tables (list): the names of the season's -JOIN tables
+            source_hashes (dict): source table name to its content hash now
+            params_hash (str): the hash of the WAR parameters now
+
+        Returns:
+            True if any of the tables was never built, or was built from
+            other source tables or parameters
+        '''
+        sources = json.dumps(source_hashes, sort_keys=True)
+        rows = self.connection.execute('''SELECT name FROM join_manifest
+                                          WHERE season = ?
+                                          AND source_hashes = ?
+                                          AND params_hash = ?;''',
+                                       (season, sources, params_hash))
+        built = set([row[0] for row in rows])
+        existing = set([row[0] for row in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table';")])
+        return not set(tables).issubset(built & existing)
+
+    def intervals_stale(self, season, resamples):
+        '''
+        Do the WAR intervals of a season's joined tables need to be computed
+        again?
+
+        Inputs:
+            season (str): the season
+            resamples (int): the number of bootstrap resamples wanted
+
+        Returns:
+            True if any of the season's tables in the manifest has no
+            intervals or has them from another number of resamples
+        '''
+        row = self.connection.execute('''SELECT 1 FROM join_manifest
+                                         WHERE season = ?
+                                         AND (resamples IS NULL
+                                              OR resamples != ?)
+                                         LIMIT 1;''',
+                                      (season, resamples)).fetchone()
+        return row != None
+
+    def record(self, name, season, source_hashes, params_hash):
+        '''
+        Saves the manifest entry for a -JOIN table that was just written,
+        which has no WAR intervals yet
+        '''
+        with self.writer.transaction():
+            self.connection.execute('''INSERT OR REPLACE INTO join_manifest
+                                       VALUES (?, ?, ?, ?, ?, 0);''',
+                                    (name, season,
+                                     json.dumps(source_hashes, sort_keys=True),
+                                     params_hash, time.time()))
+
+    def record_intervals(self, name, resamples):
+        '''
+        Notes the number of resamples the WAR intervals of a -JOIN table were
+        just computed from
+        '''
+        with self.writer.transaction():
+            self.connection.execute('''UPDATE join_manifest SET resamples = ?
+                                       WHERE name = ?;''', (resamples, name))
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import sqlite3
+import threading
+
+import seasons
+
+# how long in seconds a page that can still change stays fresh
+DEFAULT_MAX_AGE = 6 * 60 * 60
+
+def default_freshness(url):
+    '''
+    The freshness policy for an url. Pages for finished seasons never change,
+    so they never expire. Everything else expires after DEFAULT_MAX_AGE.
+
+    Inputs:
+        url (str): an absolute url
+
+    Returns:
+        The number of seconds a cached copy stays fresh, or None if it never
+        expires
+    '''
+    season = seasons.season_of(url)
+    if season != None and not seasons.season_is_open(season):
+        return None
+    return DEFAULT_MAX_AGE
+
+class CachedPage:
+    '''
+    A page read out of the cache. Has the same url, status_code, content and
+    text attributes that the scraper reads off a requests Response.
+    '''
+    def __init__(self, url, content, encoding=None, status_code=200):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.status_code = status_code
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+class PageCache:
+    '''
+    A persistent cache of web pages keyed by url. Page bodies are stored
+    compressed and addressed by the hash of their contents, so identical
+    pages are only stored once. An index database records each url's
+    validators so stale pages can be revalidated with a conditional request,
+    and the links the crawl found on the page, so a page that has not
+    changed need not be parsed again to follow them.
+
+    Modes:
+        'online': serve fresh pages from the cache, revalidate stale ones
+        'replay': never touch the network, serve whatever is cached
+    '''
+    def __init__(self, path='page_cache', mode='online',
+                 freshness=default_freshness):
+        if mode not in ('online', 'replay'):
+            raise ValueError('unknown page cache mode: ' + str(mode))
+
+        self.path = path
+        self.mode = mode
+        self.freshness = freshness
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, 'index.db'),
+                                          check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS pages (
+                                   url TEXT PRIMARY KEY,
+                                   final_url TEXT,
+                                   digest TEXT,
+                                   encoding TEXT,
+                                   etag TEXT,
+                                   last_modified TEXT,
+                                   fetched_at REAL,
+                                   links TEXT);''')
+        columns = [row[1] for row in
+                   self.connection.execute('PRAGMA table_info(pages);')]
+        if 'links' not in columns:
+            self.connection.execute('ALTER TABLE pages ADD COLUMN links TEXT;')
+        self.connection.commit()
+
+    def object_path(self, digest):
+        '''
+        The file a page body with the given content hash is stored in
+        '''
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.z')
+
+    def lookup(self, url):
+        '''
+        Reads the index entry for an url
+
+        Inputs:
+            url (str): an absolute url
+
+        Returns:
+            A dict of the entry's columns, or None if the url is not cached
+        '''
+        with self.lock:
+            cursor = self.connection.execute(
+                'SELECT * FROM pages WHERE url = ?;', (url,))
+            row = cursor.fetchone()
+            if row == None:
+                return None
+            columns = [col[0] for col in cursor.description]
+        return dict(zip(columns, row))
+
+    def read(self, entry):
+        '''
+        Loads the page an index entry points to
+
+        Inputs:
+            entry (dict): an entry returned by lookup
+
+        Returns:
+            A CachedPage, or None if its body is missing from disk
+        '''
+        try:
+            with open(self.object_path(entry['digest']), 'rb') as f:
+                content = zlib.decompress(f.read())
+        except OSError:
+            return None
+        return CachedPage(entry['final_url'], content, entry['encoding'])
+
+    def store(self, url, response):
+        '''
+        Saves a downloaded page to the cache
+
+        Inputs:
+            url (str): the url that was requested
+            response (Response): the successful response for url
+
+        Returns:
+            A CachedPage of the stored page
+        '''
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self.object_path(digest)
+
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = object_path + '.' + str(threading.get_ident())
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(content))
+            os.replace(tmp_path, object_path)
+
+        with self.lock:
+            self.connection.execute(
+                '''INSERT OR REPLACE INTO pages (url, final_url, digest,
+                   encoding, etag, last_modified, fetched_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?);''',
+                (url, response.url, digest, response.encoding,
+                 response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), time.time()))
+            self.connection.commit()
+
+        return CachedPage(response.url, content, response.encoding)
+
+    def touch(self, url):
+        '''
+        Marks a cached url as just revalidated
+        '''
+        with self.lock:
+            self.connection.execute(
+                'UPDATE pages SET fetched_at = ? WHERE url = ?;',
+                (time.time(), url))
+            self.connection.commit()
+
+    def save_links(self, final_url, links):
+        '''
+        Saves the links the crawl found on a page, until the page is next
+        downloaded with new contents
+
+        Inputs:
+            final_url (str): the url the page was served from
+            links (list): the absolute urls the crawl follows from the page
+
+        Returns:
+            None
+        '''
+        with self.lock:
+            self.connection.execute(
+                'UPDATE pages SET links = ? WHERE final_url = ?;',
+                (json.dumps(links), final_url))
+            self.connection.commit()
+
+    def links(self, final_url):
+        '''
+        The links saved for a page by save_links
+
+        Returns:
+            A list of urls, or None if the page's links were not saved
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                '''SELECT links FROM pages WHERE final_url = ?
+                   AND links IS NOT NULL LIMIT 1;''', (final_url,)).fetchone()
+        if row == None:
+            return None
+        return json.loads(row[0])
+
+    def is_fresh(self, entry):
+        '''
+        Checks an index entry against the freshness policy
+        '''
+        max_age = self.freshness(entry['url'])
+        if max_age == None:
+            return True
+        return time.time() - entry['fetched_at'] < max_age
+
+    def fetch(self, url, session, timeout=None):
+        '''
+        Gets a page from the cache if possible and from the network otherwise
+
+        Inputs:
+            url (str): an absolute url
+            session (Session): the requests session used on a cache miss
+            timeout (float): seconds to wait for the network
+
+        Returns:
+            A CachedPage, or None if the page could not be found
+        '''
+        entry = self.lookup(url)
+        page = None
+        if entry != None:
+            page = self.read(entry)
+
+        if self.mode == 'replay':
+            return page
+
+        if page != None and self.is_fresh(entry):
+            return page
+
+        headers = {}
+        if page != None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and page != None:
+            self.touch(url)
+            return page
+        if response.status_code != 200:
+            return None
+
+        return self.store(url, response)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,330 @@
+'''
+A pipelined crawl of https://fbref.com. Pages move through three stages
+joined by bounded queues:
+
+    fetch: threads that download pages
+    parse: a process pool that builds each page's tables, so parsing can use
+           every core instead of sharing the GIL with the fetch threads
+    write: a single thread that writes tables to the database in batches
+
+The main thread coordinates the stages. It hands urls from each subcrawl's
+frontier to the fetch stage and follows the links the parse stage finds. The
+write stage records each page in the scrape manifest in the same transaction
+as its tables.
+'''
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import scraper
+import frontier
+import manifest
+import seasons
+import table_extract
+import table_schemas as schemas
+import db_writer
+import player
+
+def parse_worker(sub, url, html):
+    '''
+    Parses one fetched page in a worker process
+
+    Inputs:
+        sub (str): the subcrawl the page belongs to
+        url (str): the true url of the page
+        html (bytes): the page's html
+
+    Returns:
+        (season, n_rows, rows_per_sec, links, tables) for the page
+    '''
+    spec = scraper.SUBCRAWLS[sub][1]
+    page = scraper.parse_page(html, spec.table_id)
+    links = scraper.get_links(page, url, sub)
+    tables = scraper.parse_tables(page, spec)
+    return (page.season[:9], page.n_rows, page.rows_per_sec, links, tables)
+
+class Pipeline:
+    '''
+    Runs subcrawls through the fetch, parse and write stages
+
+    Inputs:
+        fetch_workers (int): the number of fetch threads
+        parse_workers (int): the number of parse processes, defaults to
+            the number of cores
+        queue_size (int): the most pages waiting between two stages
+        write_batch (int): the most pages written in one batch
+        db (str): the database to write to
+        checkpoint_dir (str): a directory to checkpoint crawl progress in
+        incremental (bool): only fetch seasons that can still change
+        report_every (float): seconds between queue depth reports
+    '''
+    def __init__(self, fetch_workers=8, parse_workers=None, queue_size=32,
+                 write_batch=8, db='players.db', checkpoint_dir=None,
+                 incremental=False, report_every=5.0):
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count()
+        self.write_batch = write_batch
+        self.db = db
+        self.checkpoint_dir = checkpoint_dir
+        self.report_every = report_every
+        self.scrape_manifest = manifest.ScrapeManifest(db, incremental)
+
+        self.url_q = queue.Queue()
+        self.fetched_q = queue.Queue(maxsize=queue_size)
+        self.write_q = queue.Queue(maxsize=queue_size)
+        self.results_q = queue.Queue()
+        self.parse_slots = threading.Semaphore(self.parse_workers * 2)
+        self.parsing = 0
+        self.parsing_lock = threading.Lock()
+
+        # set when the coordinator fails, so every stage drops its work
+        # instead of finishing the pages queued behind it
+        self.stop = threading.Event()
+
+        self.max_depths = {}
+        self.counts = {'fetched': 0, 'parsed': 0, 'written': 0,
+                       'unchanged': 0, 'failed': 0}
+
+    def queue_depths(self):
+        '''
+        The number of pages waiting at each stage right now
+
+        Returns:
+            A dict of stage name to queue depth
+        '''
+        depths = {'fetch': self.url_q.qsize(),
+                  'parse': self.fetched_q.qsize() + self.parsing,
+                  'write': self.write_q.qsize()}
+        for stage, depth in depths.items():
+            self.max_depths[stage] = max(depth, self.max_depths.get(stage, 0))
+        return depths
+
+    def report(self):
+        depths = self.queue_depths()
+        print('Queue depths:', depths, 'pages:', self.counts)
+
+    def fetch_stage(self, known_hashes):
+        '''
+        Downloads urls from url_q and passes the pages on to the parse stage.
+        Pages whose stats table is unchanged go straight back to the
+        coordinator with their links, see scraper.unchanged_links.
+        '''
+        while True:
+            item = self.url_q.get()
+            if item == None:
+                break
+            sub, url = item
+
+            request = scraper.get_request(url)
+            if request == None:
+                self.results_q.put(('failed', sub, url, None))
+                continue
+
+            true_url = scraper.get_request_url(request)
+            html = scraper.read_request(request)
+            if self.stop.is_set():
+                break
+            spec = scraper.SUBCRAWLS[sub][1]
+            content_hash = table_extract.fingerprint(html, spec.table_id)
+            if known_hashes.get((sub, true_url)) == content_hash:
+                links = scraper.unchanged_links(html, true_url, sub)
+                self.results_q.put(('unchanged', sub, url, (true_url, links)))
+                continue
+
+            self.fetched_q.put((sub, url, true_url, html, content_hash))
+
+    def parse_stage(self, pool):
+        '''
+        Sends fetched pages to the process pool, keeping at most two pages
+        per worker in flight
+        '''
+        while True:
+            item = self.fetched_q.get()
+            if item == None:
+                break
+            if self.stop.is_set():
+                continue
+            sub, url, true_url, html, content_hash = item
+
+            self.parse_slots.acquire()
+            with self.parsing_lock:
+                self.parsing += 1
+            future = pool.submit(parse_worker, sub, true_url, html)
+
+            def done(future, sub=sub, url=url, true_url=true_url,
+                     content_hash=content_hash):
+                with self.parsing_lock:
+                    self.parsing -= 1
+                self.parse_slots.release()
+                self.results_q.put(('parsed', sub, url,
+                                    (true_url, content_hash, future)))
+
+            future.add_done_callback(done)
+
+    def write_stage(self):
+        '''
+        Writes parsed tables and their scrape manifest entries to the
+        database, taking up to write_batch pages from write_q at a time and
+        committing each batch in one transaction
+        '''
+        finished = False
+        while not finished:
+            batch = [self.write_q.get()]
+            while len(batch) < self.write_batch:
+                try:
+                    batch.append(self.write_q.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                finished = True
+                batch = [item for item in batch if item != None]
+            if self.stop.is_set():
+                continue
+
+            writer = db_writer.get_writer(self.db)
+            written = []
+            try:
+                with writer.transaction():
+                    for sub, url, tables, entry in batch:
+                        spec = scraper.SUBCRAWLS[sub][1]
+                        true_url, season, content_hash, n_rows = entry
+                        with writer.transaction():
+                            for name, df in tables.items():
+                                df = player.add_ids(writer, df)
+                                scraper.to_sql(df, name, self.db,
+                                               schemas.sql_types(df.columns,
+                                                                 spec))
+                            self.scrape_manifest.record(sub, season, true_url,
+                                                        content_hash, n_rows)
+                        written.append((sub, url, entry))
+            except Exception as e:
+                sub, url = batch[len(written)][:2]
+                self.results_q.put(('error', sub, url, e))
+                continue
+
+            for sub, url, entry in written:
+                self.results_q.put(('written', sub, url, entry))
+
+    def run(self, subs):
+        '''
+        Crawls the given subcrawls
+
+        Inputs:
+            subs (list): the subcrawls to run (keys of scraper.SUBCRAWLS)
+
+        Returns:
+            None
+        '''
+        start = time.perf_counter()
+        scraper.SESSION = scraper.make_session(
+            pool_size=max(self.fetch_workers, 10))
+        frontiers = {}
+        for sub in subs:
+            link_q = frontier.Frontier(
+                scraper.checkpoint_path(self.checkpoint_dir, sub))
+            link_q.put(scraper.SUBCRAWLS[sub][0])
+            frontiers[sub] = link_q
+
+        known_hashes = {}
+        if self.scrape_manifest.incremental:
+            known_hashes = self.scrape_manifest.known_hashes()
+
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        fetchers = [threading.Thread(target=self.fetch_stage,
+                                     args=(known_hashes,))
+                    for _ in range(self.fetch_workers)]
+        parser = threading.Thread(target=self.parse_stage, args=(pool,))
+        writer = threading.Thread(target=self.write_stage)
+        for thread in fetchers + [parser, writer]:
+            thread.start()
+
+        outstanding = 0
+        try:
+            while True:
+                for sub, link_q in frontiers.items():
+                    while not link_q.empty():
+                        url = link_q.get()
+                        season = seasons.season_of(url)
+                        if not self.scrape_manifest.needs_fetch(sub, season):
+                            link_q.mark_crawled(url)
+                            continue
+                        self.url_q.put((sub, url))
+                        outstanding += 1
+
+                if outstanding == 0:
+                    break
+
+                try:
+                    kind, sub, url, payload = self.results_q.get(
+                        timeout=self.report_every)
+                except queue.Empty:
+                    self.report()
+                    continue
+
+                link_q = frontiers[sub]
+                self.queue_depths()
+                if kind == 'failed':
+                    self.counts['failed'] += 1
+                    link_q.mark_failed(url)
+                    outstanding -= 1
+                elif kind == 'unchanged':
+                    self.counts['unchanged'] += 1
+                    true_url, links = payload
+                    print('Unchanged', true_url)
+                    for link in links:
+                        link_q.put(link)
+                    link_q.mark_crawled(url, true_url)
+                    outstanding -= 1
+                elif kind == 'error':
+                    raise payload
+                elif kind == 'parsed':
+                    self.counts['fetched'] += 1
+                    self.counts['parsed'] += 1
+                    true_url, content_hash, future = payload
+                    season, n_rows, rate, links, tables = future.result()
+                    if link_q.is_crawled(true_url):
+                        link_q.mark_crawled(url, true_url)
+                        outstanding -= 1
+                        continue
+                    print('Parsed', n_rows, 'rows from', season, 'at',
+                          int(rate), 'rows/sec')
+                    scraper.remember_links(true_url, links)
+                    for link in links:
+                        link_q.put(link)
+                    entry = (true_url, season, content_hash, n_rows)
+                    self.write_q.put((sub, url, tables, entry))
+                elif kind == 'written':
+                    self.counts['written'] += 1
+                    true_url = payload[0]
+                    link_q.mark_crawled(url, true_url)
+                    outstanding -= 1
+        except BaseException:
+            # on an error or Ctrl-C, drop the urls not fetched yet rather
+            # than fetching the rest of the frontier before stopping
+            self.stop.set()
+            while True:
+                try:
+                    self.url_q.get_nowait()
+                except queue.Empty:
+                    break
+            raise
+        finally:
+            for _ in fetchers:
+                self.url_q.put(None)
+            for thread in fetchers:
+                thread.join()
+            self.fetched_q.put(None)
+            parser.join()
+            pool.shutdown(cancel_futures=self.stop.is_set())
+            self.write_q.put(None)
+            writer.join()
+            self.scrape_manifest.close()
+
+        for link_q in frontiers.values():
+            link_q.finish()
+
+        print('Pipeline finished in', round(time.perf_counter() - start, 1),
+              'seconds. Max queue depths:', self.max_depths,
+              'pages:', self.counts)
@@ -0,0 +1,166 @@
+'''
+The player dimension table: one row per player with an integer player_id,
+keyed on the id fbref gives every player in the link to their page. The
+stats tables, the -JOIN tables and player_season carry the player_id, so
+they join on an integer instead of on the player's name, and players who
+share a name stay apart.
+
+Rows scraped without an fbref id, like those of tables written by older
+builds, get a player_id of their own keyed on the player's name.
+
+To look up every season of a player's career, run:
+
+    python player.py FBREF_ID [DB]
+'''
+import argparse
+
+import pandas as pd
+
+import db_writer
+import player_season
+
+TABLE = 'player'
+
+# the most fbref ids or names bound to one statement
+CHUNK_SIZE = 500
+
+def create_table(writer):
+    '''
+    Creates the player table if it does not exist
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+
+    Returns:
+        None
+    '''
+    with writer.transaction():
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' + TABLE + ''' (
+                                   player_id INTEGER PRIMARY KEY,
+                                   fbref_id TEXT UNIQUE,
+                                   name TEXT);''')
+        # players without an fbref id are told apart by name alone
+        writer.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS '
+                                  'ix_player_unkeyed ON ' + TABLE +
+                                  ' (name) WHERE fbref_id IS NULL;')
+
+def read_ids(connection, keys, unkeyed=False):
+    '''
+    Looks up the player_id of some players, CHUNK_SIZE at a time, through
+    the index on fbref_id or, for players without one, on name
+
+    Inputs:
+        connection (Connection): the players database
+        keys (list): fbref ids, or names if unkeyed
+        unkeyed (bool): look up players without an fbref id by name
+
+    Returns:
+        A dict of fbref id or name to player_id
+    '''
+    column = 'fbref_id'
+    condition = ''
+    if unkeyed:
+        column = 'name'
+        condition = 'fbref_id IS NULL AND '
+    keys = list(keys)
+    ids = {}
+    for i in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[i:i + CHUNK_SIZE]
+        ids.update(connection.execute(
+            'SELECT ' + column + ', player_id FROM ' + TABLE + ' WHERE ' +
+            condition + column + ' IN (' + ', '.join(['?']*len(chunk)) +
+            ');', chunk))
+    return ids
+
+def player_ids(writer, fbref_ids, names):
+    '''
+    Finds the player_id of every player, adding the players the table does
+    not have yet. Only the given players are read from the table.
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        fbref_ids (Series): fbref's id for each player, or None
+        names (Series): each player's name
+
+    Returns:
+        A Series of player_id with the index of names
+    '''
+    keyed = fbref_ids.notnull()
+    new_keyed = pd.DataFrame({'fbref_id': fbref_ids[keyed],
+                              'name': names[keyed]}).drop_duplicates('fbref_id')
+    new_unkeyed = names[~keyed].drop_duplicates()
+
+    with writer.transaction():
+        writer.connection.executemany('INSERT OR IGNORE INTO ' + TABLE +
+                                      ' (fbref_id, name) VALUES (?, ?);',
+                                      db_writer.to_rows(new_keyed))
+        writer.connection.executemany('INSERT OR IGNORE INTO ' + TABLE +
+                                      ' (fbref_id, name) VALUES (NULL, ?);',
+                                      [(name,) for name in new_unkeyed])
+
+        by_fbref_id = read_ids(writer.connection, new_keyed['fbref_id'])
+        by_name = read_ids(writer.connection, new_unkeyed, unkeyed=True)
+
+    ids = pd.Series(None, index=names.index, dtype='Int64')
+    ids[keyed] = fbref_ids[keyed].map(by_fbref_id)
+    ids[~keyed] = names[~keyed].map(by_name)
+    return ids
+
+def add_ids(writer, df):
+    '''
+    Replaces the fbref_id column of a stats table with the player_id of
+    each player
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        df (DataFrame): a stats table with a Player column
+
+    Returns:
+        The DataFrame with a player_id column in place of fbref_id
+    '''
+    if 'Player' not in df.columns:
+        return df
+    if 'fbref_id' in df.columns:
+        fbref_ids = df['fbref_id']
+    else:
+        fbref_ids = pd.Series(None, index=df.index, dtype=object)
+
+    create_table(writer)
+    ids = player_ids(writer, fbref_ids, df['Player'])
+    df = df.copy()
+    if 'fbref_id' in df.columns:
+        df.insert(df.columns.get_loc('fbref_id'), 'player_id', ids)
+        df = df.drop(columns='fbref_id')
+    else:
+        df['player_id'] = ids
+    return df
+
+def career(connection, fbref_id):
+    '''
+    Every player_season row of one player, a single probe of the
+    player_id index
+
+    Inputs:
+        connection (Connection): the players database
+        fbref_id (str): fbref's id for the player
+
+    Returns:
+        A DataFrame of the player's rows, oldest season first
+    '''
+    query = ('SELECT ps.* FROM ' + TABLE + ' AS p JOIN ' +
+             player_season.TABLE + ''' AS ps ON ps.player_id = p.player_id
+             WHERE p.fbref_id = ? ORDER BY ps.season;''')
+    return pd.read_sql_query(query, connection, params=(fbref_id,))
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a player's career")
+    parser.add_argument('fbref_id', help="fbref's id for the player")
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to read')
+    args = parser.parse_args()
+    connection = db_writer.get_writer(args.db).connection
+    print(career(connection, args.fbref_id).to_string(index=False))
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
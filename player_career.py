@@ -0,0 +1,317 @@
+'''
+Career and rolling window WAR. The player_career table has one row per
+player with their minutes and WAR over every season they played. The
+player_rolling table has one row per player, window length and season they
+played, with their minutes and WAR over the window of that many seasons
+ending there. A leaderboard over a career or a window is then one indexed
+read instead of an aggregate over every -JOIN table.
+
+WAR is normalized within each season and position group, so a player's WAR
+over many seasons is the sum of their seasons', over every position group
+and squad they played for. Rows without a player_id, from tables older
+builds wrote, are left out until the next join_years gives them one.
+
+join_years and live_war update the rows of the players whose seasons they
+change. To build both tables for an existing database, run:
+
+    python player_career.py [DB]
+'''
+import argparse
+
+import pandas as pd
+
+import db_writer
+import player_season
+
+TABLE = 'player_career'
+
+ROLLING_TABLE = 'player_rolling'
+
+# the lengths, in seasons, of the rolling windows
+SPANS = [3, 5]
+
+# the most player_ids bound to one statement
+CHUNK_SIZE = 500
+
+# index name to its columns, one for each leaderboard
+INDEXES = {
+    'ix_player_career_war': ['WAR DESC'],
+    'ix_player_career_per_90': ['WAR_per_90 DESC'],
+}
+
+ROLLING_INDEXES = {
+    'ix_player_rolling_season': ['span', 'last_season', 'WAR DESC'],
+    'ix_player_rolling_season_per_90': ['span', 'last_season',
+                                        'WAR_per_90 DESC'],
+    'ix_player_rolling_war': ['span', 'WAR DESC'],
+    'ix_player_rolling_per_90': ['span', 'WAR_per_90 DESC'],
+}
+
+def create_table(writer):
+    '''
+    Creates the player_career and player_rolling tables and their indexes if
+    they do not exist
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+
+    Returns:
+        None
+    '''
+    with writer.transaction():
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' + TABLE + ''' (
+                                   player_id INTEGER PRIMARY KEY,
+                                   Player TEXT,
+                                   first_season TEXT,
+                                   last_season TEXT,
+                                   seasons INTEGER,
+                                   Min INTEGER,
+                                   WAR REAL,
+                                   WAR_per_90 REAL);''')
+        # a window runs from first_season to last_season, the season the
+        # player played that it ends on
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' +
+                                  ROLLING_TABLE + ''' (
+                                   player_id INTEGER,
+                                   span INTEGER,
+                                   first_season TEXT,
+                                   last_season TEXT,
+                                   Player TEXT,
+                                   seasons INTEGER,
+                                   Min INTEGER,
+                                   WAR REAL,
+                                   WAR_per_90 REAL,
+                                   PRIMARY KEY (player_id, span,
+                                                last_season));''')
+        for table, indexes in [(TABLE, INDEXES),
+                               (ROLLING_TABLE, ROLLING_INDEXES)]:
+            for name, index_columns in indexes.items():
+                writer.connection.execute('CREATE INDEX IF NOT EXISTS ' +
+                                          name + ' ON ' + table + ' (' +
+                                          ', '.join(index_columns) + ');')
+
+def chunks(player_ids):
+    '''
+    Splits player_ids into lists of at most CHUNK_SIZE
+    '''
+    player_ids = sorted(player_ids)
+    return [player_ids[i:i + CHUNK_SIZE]
+            for i in range(0, len(player_ids), CHUNK_SIZE)]
+
+def season_players(connection, season_names):
+    '''
+    The player_id of every player with a player_season row in some seasons
+
+    Inputs:
+        connection (Connection): the players database
+        season_names (list): season names like '2019-2020'
+
+    Returns:
+        A set of player_ids
+    '''
+    if len(season_names) == 0:
+        return set()
+    rows = connection.execute(
+        'SELECT DISTINCT player_id FROM ' + player_season.TABLE +
+        ' WHERE player_id IS NOT NULL AND season IN (' +
+        ', '.join(['?']*len(season_names)) + ');', list(season_names))
+    return set([row[0] for row in rows])
+
+def read_seasons(connection, player_ids):
+    '''
+    Every season of some players, over all of their position groups and
+    squads
+
+    Inputs:
+        connection (Connection): the players database
+        player_ids (set): the players to read
+
+    Returns:
+        A DataFrame of player_id, season, Player, Min and WAR
+    '''
+    dfs = []
+    for chunk in chunks(player_ids):
+        dfs.append(pd.read_sql_query(
+            'SELECT player_id, season, MAX(Player) AS Player, '
+            'SUM(Min) AS Min, SUM(WAR) AS WAR FROM ' + player_season.TABLE +
+            ' WHERE player_id IN (' + ', '.join(['?']*len(chunk)) + ''')
+            GROUP BY player_id, season;''', connection, params=chunk))
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=['player_id', 'season', 'Player', 'Min',
+                                     'WAR'])
+    return pd.concat(dfs, ignore_index=True)
+
+def totals(df, keys):
+    '''
+    Sums the minutes and WAR of player-seasons, keeping WAR NULL when none
+    of them have it, and adds WAR_per_90
+
+    Inputs:
+        df (DataFrame): player-seasons with Player, Min and WAR, sorted by
+            season so a player's latest name is last
+        keys (list): the columns to group by
+
+    Returns:
+        A DataFrame with keys, Player, seasons, Min, WAR and WAR_per_90
+    '''
+    grouped = df.groupby(keys, as_index=False).agg(
+        Player=('Player', 'last'), seasons=('Player', 'size'),
+        Min=('Min', 'sum'), WAR=('WAR', 'sum'), scored=('WAR', 'count'))
+    grouped['WAR'] = grouped['WAR'].where(grouped['scored'] > 0)
+    minutes = grouped['Min'].where(grouped['Min'] > 0)
+    grouped['WAR_per_90'] = grouped['WAR']/minutes*90
+    return grouped.drop(columns='scored')
+
+def career_rows(df):
+    '''
+    The player_career rows of players
+
+    Inputs:
+        df (DataFrame): every season of the players, from read_seasons
+
+    Returns:
+        A DataFrame with the player_career columns
+    '''
+    df = df.sort_values(['player_id', 'season'])
+    rows = totals(df, ['player_id'])
+    seasons = df.groupby('player_id')['season']
+    rows['first_season'] = seasons.min().to_numpy()
+    rows['last_season'] = seasons.max().to_numpy()
+    return rows
+
+def rolling_rows(df):
+    '''
+    The player_rolling rows of players, a window of each of SPANS ending at
+    every season they played
+
+    Inputs:
+        df (DataFrame): every season of the players, from read_seasons
+
+    Returns:
+        A DataFrame with the player_rolling columns
+    '''
+    df = df.assign(year=df['season'].str[:4].astype(int))
+    pairs = df[['player_id', 'season', 'year']].merge(df, on='player_id',
+                                                      suffixes=('_end', ''))
+    pairs['back'] = pairs['year_end'] - pairs['year']
+    pairs = pairs[(pairs['back'] >= 0) & (pairs['back'] < max(SPANS))]
+    pairs = pairs.sort_values(['player_id', 'season_end', 'season'])
+
+    windows = []
+    for span in SPANS:
+        rows = totals(pairs[pairs['back'] < span],
+                      ['player_id', 'season_end', 'year_end'])
+        first_year = rows['year_end'] - span + 1
+        rows['first_season'] = (first_year.astype(str) + '-' +
+                                (first_year + 1).astype(str))
+        rows['span'] = span
+        windows.append(rows.rename(columns={'season_end': 'last_season'}))
+    return pd.concat(windows, ignore_index=True).drop(columns='year_end')
+
+def update(writer, player_ids):
+    '''
+    Rebuilds the player_career and player_rolling rows of some players from
+    player_season. Players who no longer have any seasons lose their rows.
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        player_ids (set): the players whose seasons changed
+
+    Returns:
+        None
+    '''
+    player_ids = set([int(player_id) for player_id in player_ids
+                      if pd.notnull(player_id)])
+    df = read_seasons(writer.connection, player_ids)
+    careers = career_rows(df)
+    windows = rolling_rows(df)
+
+    with writer.transaction():
+        for chunk in chunks(player_ids):
+            for table in [TABLE, ROLLING_TABLE]:
+                writer.connection.execute(
+                    'DELETE FROM ' + table + ' WHERE player_id IN (' +
+                    ', '.join(['?']*len(chunk)) + ');', chunk)
+        writer.insert(careers, TABLE)
+        writer.insert(windows, ROLLING_TABLE)
+
+def leaderboard_query(span=None, last_season=None, order_by='WAR',
+                      min_minutes=0, limit=50):
+    '''
+    The query for a leaderboard of careers or rolling windows
+
+    Inputs:
+        span (int): the window length, one of SPANS, or None for careers
+        last_season (str): for windows, the season they end on, or None for
+            windows ending on any season
+        order_by (str): 'WAR' or 'WAR_per_90'
+        min_minutes (int): the fewest minutes a player needs to be listed
+        limit (int): the number of players
+
+    Returns:
+        (query, args), the query and the arguments it binds
+    '''
+    if order_by not in ['WAR', 'WAR_per_90']:
+        raise ValueError('Cannot order a leaderboard by ' + str(order_by))
+    table = TABLE
+    conditions = []
+    args = []
+    if span != None:
+        table = ROLLING_TABLE
+        conditions.append('span = ?')
+        args.append(span)
+        if last_season != None:
+            conditions.append('last_season = ?')
+            args.append(last_season)
+    if min_minutes > 0:
+        conditions.append('Min >= ?')
+        args.append(min_minutes)
+
+    query = 'SELECT * FROM ' + table
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY ' + order_by + ' DESC LIMIT ?;'
+    return (query, args + [limit])
+
+def leaderboard(connection, **kwargs):
+    '''
+    A leaderboard of careers or rolling windows, see leaderboard_query
+
+    Returns:
+        A DataFrame of the leaderboard's rows
+    '''
+    query, args = leaderboard_query(**kwargs)
+    return pd.read_sql_query(query, connection, params=args)
+
+def build(db):
+    '''
+    Builds the player_career and player_rolling rows of every player in a
+    database's player_season table
+
+    Inputs:
+        db (str): the players database
+
+    Returns:
+        None
+    '''
+    writer = db_writer.get_writer(db)
+    player_season.create_table(writer)
+    create_table(writer)
+    player_ids = set([row[0] for row in writer.connection.execute(
+        'SELECT DISTINCT player_id FROM ' + player_season.TABLE +
+        ' WHERE player_id IS NOT NULL;')])
+    update(writer, player_ids)
+    print('Wrote ', len(player_ids), ' careers to ', TABLE, ' and ',
+          ROLLING_TABLE)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the player_career '
+                                     'and player_rolling tables')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to build them in')
+    args = parser.parse_args()
+    build(args.db)
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+'''
+The player_season table: one row per player, season and position group with
+the stats the site searches on and the player's WAR. It holds the same rows
+as every season's -JOIN tables, so the site can answer a question about any
+number of seasons with one indexed query instead of a UNION over 28 tables.
+
+join_years writes it as it builds the -JOIN tables. To build it from the
+-JOIN tables of an existing database, run:
+
+    python player_season.py [DB]
+'''
+import re
+import argparse
+
+import pandas as pd
+
+import db_writer
+import table_schemas as schemas
+
+TABLE = 'player_season'
+
+COLUMNS = ['season', 'position_group', 'player_id', 'Player', 'Nation',
+           'Pos_1', 'Pos_2', 'Squad', 'Age', 'MP', 'Starts', 'Min', 'Gls', 'Ast', 'PK', 'PKatt',
+           'CrdY', 'CrdR', 'Sh', 'SoT', 'GA', 'SoTA', 'Saves', 'CS',
+           'Raw_Save%', 'Raw_GD', 'Raw_WAR', 'Normed_WAR', 'WAR', 'WAR_lower',
+           'WAR_upper']
+
+# index name to its columns, one for each way the site looks players up
+INDEXES = {
+    'ix_player_season_group': ['position_group', 'season', 'WAR DESC'],
+    'ix_player_season_war': ['position_group', 'WAR DESC'],
+    'ix_player_season_player': ['Player'],
+    'ix_player_season_player_id': ['player_id', 'season'],
+}
+
+# the rows older builds added to each -JOIN table for the WAR baselines,
+# which are now kept in the baselines table
+BASELINE_ROWS = ['Average', 'Replacement']
+
+JOIN_TABLE = re.compile(r'^(\d{4}-\d{4})-([A-Z]+)-JOIN$')
+
+# a counter of the changes to the player_season and baselines tables, for
+# caches built from them
+VERSION_TABLE = 'data_version'
+
+def bump_version(writer):
+    '''
+    Notes that the player_season or baselines table changed. Every write to
+    either calls it inside the write's transaction.
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+
+    Returns:
+        None
+    '''
+    with writer.transaction():
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' +
+                                  VERSION_TABLE + ''' (
+                                   name TEXT PRIMARY KEY,
+                                   version INTEGER);''')
+        writer.connection.execute('INSERT INTO ' + VERSION_TABLE + ''' VALUES
+                                  (?, 1) ON CONFLICT (name) DO UPDATE
+                                  SET version = version + 1;''', (TABLE,))
+
+def data_version(connection):
+    '''
+    The number of times the player_season and baselines tables changed, or
+    None if they never were written through bump_version
+    '''
+    exists = connection.execute('''SELECT 1 FROM sqlite_master
+                                   WHERE type = 'table' AND name = ?;''',
+                                (VERSION_TABLE,)).fetchone()
+    if exists == None:
+        return None
+    row = connection.execute('SELECT version FROM ' + VERSION_TABLE +
+                             ' WHERE name = ?;', (TABLE,)).fetchone()
+    if row == None:
+        return None
+    return row[0]
+
+def column_type(column):
+    '''
+    The SQLite type of a player_season column
+    '''
+    if column in ['season', 'position_group']:
+        return 'TEXT'
+    return schemas.sql_types([column])[column]
+
+def create_table(writer):
+    '''
+    Creates the player_season table and its indexes if they do not exist,
+    adding any columns a table from an older build lacks
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+
+    Returns:
+        None
+    '''
+    columns = [db_writer.quote(col) + ' ' + column_type(col) for col in COLUMNS]
+    with writer.transaction():
+        writer.connection.execute('CREATE TABLE IF NOT EXISTS ' + TABLE + ' (' +
+                                  ', '.join(columns) + ');')
+        existing = [row[1] for row in writer.connection.execute(
+            'PRAGMA table_info(' + TABLE + ');')]
+        for col in COLUMNS:
+            if col not in existing:
+                writer.connection.execute('ALTER TABLE ' + TABLE +
+                                          ' ADD COLUMN ' + db_writer.quote(col)
+                                          + ' ' + column_type(col) + ';')
+        for name, index_columns in INDEXES.items():
+            writer.connection.execute('CREATE INDEX IF NOT EXISTS ' + name +
+                                      ' ON ' + TABLE + ' (' +
+                                      ', '.join(index_columns) + ');')
+
+def position_group(pos):
+    '''
+    The position group of a -JOIN table's position, '-FW' becomes 'FW'
+    '''
+    return pos.strip('-')
+
+def to_player_season(df, season, pos):
+    '''
+    Turns a joined season table into player_season rows
+
+    Inputs:
+        df (DataFrame): a season's -JOIN table for one position
+        season (str): the season, like '2019-2020'
+        pos (str): the position the table is for, like '-FW'
+
+    Returns:
+        A DataFrame with the player_season columns, without the baseline rows
+    '''
+    df = df[~df['Player'].isin(BASELINE_ROWS)]
+    # goalkeeping tables have a single position column, any Pos_1 and Pos_2
+    # come from the passing table joined to them
+    if pos == '-GK':
+        df = df.drop(columns=['Pos_1', 'Pos_2'], errors='ignore')
+        df = df.rename(columns={'Pos': 'Pos_1'})
+
+    rows = df.reindex(columns=COLUMNS)
+    rows['season'] = season
+    rows['position_group'] = position_group(pos)
+    for column in COLUMNS:
+        if column_type(column) != 'TEXT':
+            rows[column] = pd.to_numeric(rows[column], errors='coerce')
+    return rows
+
+def write_group(writer, df, season, pos):
+    '''
+    Replaces the player_season rows of one season and position
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        df (DataFrame): the season's -JOIN table for the position
+        season (str): the season, like '2019-2020'
+        pos (str): the position the table is for, like '-FW'
+
+    Returns:
+        None
+    '''
+    rows = to_player_season(df, season, pos)
+    with writer.transaction():
+        writer.connection.execute('DELETE FROM ' + TABLE + ''' WHERE season = ?
+                                  AND position_group = ?;''',
+                                  (season, position_group(pos)))
+        writer.insert(rows, TABLE)
+        bump_version(writer)
+
+def write_intervals(writer, df, season, pos):
+    '''
+    Updates the WAR_lower and WAR_upper of the player_season rows of one
+    season and position from its -JOIN table, leaving the rest of each row
+    alone
+
+    Inputs:
+        writer (SQLiteWriter): the writer for the database
+        df (DataFrame): the season's -JOIN table for the position, with
+            WAR_lower and WAR_upper
+        season (str): the season, like '2019-2020'
+        pos (str): the position the table is for, like '-FW'
+
+    Returns:
+        None
+    '''
+    rows = to_player_season(df, season, pos)
+    keys = ['season', 'position_group', 'player_id', 'Player', 'Squad']
+    rows = db_writer.to_rows(rows[['WAR_lower', 'WAR_upper'] + keys])
+    with writer.transaction():
+        writer.connection.executemany('UPDATE ' + TABLE + ''' SET
+                                      WAR_lower = ?, WAR_upper = ?
+                                      WHERE season = ? AND position_group = ?
+                                      AND player_id IS ? AND Player = ?
+                                      AND Squad = ?;''', rows)
+
+def migrate(db):
+    '''
+    Builds the player_season table from the -JOIN tables already in a
+    database
+
+    Inputs:
+        db (str): the database to migrate
+
+    Returns:
+        None
+    '''
+    writer = db_writer.get_writer(db)
+    create_table(writer)
+    tables = [row[0] for row in writer.connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table';")]
+    for table in sorted(tables):
+        match = JOIN_TABLE.match(table)
+        if match == None:
+            continue
+        season, pos = match.group(1), '-' + match.group(2)
+        df = pd.read_sql_query('SELECT * FROM ' + db_writer.quote(table) + ';',
+                               writer.connection)
+        df = df.loc[:,~df.columns.duplicated()]
+        write_group(writer, df, season, pos)
+        print('Wrote ', table, ' to ', TABLE)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the player_season '
+                                     'table from the -JOIN tables')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to migrate')
+    args = parser.parse_args()
+    migrate(args.db)
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
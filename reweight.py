@@ -0,0 +1,306 @@
+'''
+Recomputes WAR under new weights without rebuilding the database. The
+features every player's WAR is computed from are read out of player_season
+and the baselines table once and saved as a memory-mapped matrix, already
+measured against each table's replacement player. Trying a weight set is
+then a matrix product over the matrix, CHUNK_SIZE rows at a time, and a
+grouped min-max over the whole history.
+
+Usage:
+    python reweight.py [DB] [--cache DIR] [--set -FW:SoT=0.4 ...]
+
+    import reweight
+    cache = reweight.load(db='players.db')
+    weights = reweight.weights_with({'-FW': {'SoT': 0.4, 'Ast': 0.9}})
+    df = reweight.reweight(weights, cache)
+
+    # many weight sets at once, one WAR column per set
+    df = reweight.reweight(np.stack([war.WEIGHTS, weights]), cache)
+
+The cache is rebuilt by load whenever player_season or the baselines changed
+after it was built, by join_years or by live_war, as counted by
+player_season.data_version.
+'''
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import war_calc as war
+import db_writer
+import baselines
+import player_season
+
+# the directory the feature cache is written to
+CACHE = 'war_features'
+
+# the player_season columns the features are computed from
+STATS = ['Gls', 'SoT', 'PK', 'PKatt', 'Ast', 'CrdY', 'Min', 'Raw_Save%', 'CS']
+
+# the most rows of the memory-mapped features read into memory at once
+CHUNK_SIZE = 65536
+
+class FeatureCache:
+    '''
+    The cached features of every player-season and baseline
+
+    Attributes:
+        centered (memmap): the feature matrix from war_calc.center, each
+            table's players followed by its Average and Replacement rows
+        group_pos (array): the index in war_calc.POSITIONS of each table
+        lengths (array): the number of rows of each table
+        row_pos (array): the index in war_calc.POSITIONS of every row
+        player_rows (array): True for the rows that are players
+        keys (DataFrame): season, position_group, player_id and Player of
+            every player row
+        coef (float): wins per goal of differential the cache was built with
+        data_version (int): the player_season.data_version it was built
+            from
+    '''
+    def __init__(self, path=CACHE):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['features'] != war.FEATURES:
+            raise ValueError(path + ' was built for other features')
+
+        self.centered = np.load(os.path.join(path, 'features.npy'),
+                                mmap_mode='r')
+        groups = np.load(os.path.join(path, 'groups.npz'))
+        self.group_pos = groups['group_pos']
+        self.lengths = groups['lengths']
+        self.row_pos = self.group_pos[war.segments(self.lengths)[2]]
+        self.player_rows = np.ones(len(self.centered), dtype=bool)
+        self.player_rows[np.cumsum(self.lengths) - 1] = False
+        self.player_rows[np.cumsum(self.lengths) - 2] = False
+
+        keys = np.load(os.path.join(path, 'keys.npz'))
+        self.keys = pd.DataFrame({name: keys[name] for name in
+                                  ['season', 'position_group', 'player_id',
+                                   'Player']})
+        player_ids = self.keys['player_id']
+        self.keys['player_id'] = player_ids.where(player_ids != -1).astype(
+            'Int64')
+        self.coef = meta['coef']
+        self.data_version = meta['data_version']
+
+def read_features(connection):
+    '''
+    Reads every player-season and the baselines of every table
+
+    Inputs:
+        connection (Connection): the players database
+
+    Returns:
+        players (DataFrame): player_season rows, grouped by season and
+            position group
+        baseline_rows (DataFrame): the Average and Replacement rows of every
+            season and position group of players, in the same order
+    '''
+    columns = ', '.join([db_writer.quote(col) for col in
+                         ['season', 'position_group', 'player_id', 'Player']
+                         + STATS])
+    players = pd.read_sql_query('SELECT ' + columns + ' FROM ' +
+                                player_season.TABLE + ''' ORDER BY season,
+                                position_group, rowid;''', connection)
+
+    rows = pd.read_sql_query('SELECT * FROM ' + baselines.TABLE + ';',
+                             connection)
+    baseline_rows = rows.pivot_table(index=['season', 'position_group',
+                                            'baseline'],
+                                     columns='stat', values='value',
+                                     aggfunc='first')
+    groups = players[['season', 'position_group']].drop_duplicates()
+    index = pd.MultiIndex.from_tuples(
+        [(season, group, baseline)
+         for season, group in groups.itertuples(index=False)
+         for baseline in war.BASELINES])
+    return (players, baseline_rows.reindex(index))
+
+def build(db='players.db', path=CACHE):
+    '''
+    Writes the feature cache of a database
+
+    Inputs:
+        db (str): the players database, after join_years
+        path (str): the directory to write the cache to
+
+    Returns:
+        None
+    '''
+    connection = db_writer.get_writer(db).connection
+    version = player_season.data_version(connection)
+    players, baseline_rows = read_features(connection)
+
+    # each table's players, then its two baseline rows
+    groups = players.groupby(['season', 'position_group'], sort=False).size()
+    lengths = groups.to_numpy() + len(war.BASELINES)
+    group_pos = np.array([war.POSITIONS.index('-' + group)
+                          for season, group in groups.index], dtype=int)
+    starts, replacement_rows, row_groups = war.segments(lengths)
+    player_dest = np.arange(len(players)) + len(war.BASELINES)*np.repeat(
+        np.arange(len(groups)), groups.to_numpy())
+    baseline_dest = np.column_stack([replacement_rows - 1,
+                                     replacement_rows]).ravel()
+
+    X = np.empty((lengths.sum(), len(war.FEATURES)))
+    X[player_dest] = war.features(players)
+    X[baseline_dest] = war.features(baseline_rows)
+    centered = war.center(X, group_pos, lengths)
+
+    cached = war.read_regr_cache(war.REGR_CACHE)
+    coef = cached['coef'] if cached != None else war.find_regr()[0]
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'features.npy'), centered)
+    np.savez(os.path.join(path, 'groups.npz'), group_pos=group_pos,
+             lengths=lengths)
+    np.savez(os.path.join(path, 'keys.npz'),
+             season=players['season'].to_numpy(dtype=str),
+             position_group=players['position_group'].to_numpy(dtype=str),
+             player_id=players['player_id'].fillna(-1).to_numpy(dtype=int),
+             Player=players['Player'].fillna('').to_numpy(dtype=str))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'features': war.FEATURES, 'coef': coef,
+                   'data_version': version}, f)
+    print('Wrote ', len(players), ' player-seasons to ', path)
+
+def load(path=CACHE, db=None):
+    '''
+    Loads the feature cache, memory mapping its matrix
+
+    Inputs:
+        path (str): the cache's directory
+        db (str): the players database to build the cache from if it is
+            missing or player_season or the baselines changed since it was
+            built, or None to load the cache as it is
+
+    Returns:
+        A FeatureCache
+    '''
+    if db != None:
+        version = player_season.data_version(
+            db_writer.get_writer(db).connection)
+        try:
+            fresh = FeatureCache(path).data_version == version
+        except (OSError, ValueError, KeyError):
+            fresh = False
+        if not fresh:
+            build(db, path)
+    return FeatureCache(path)
+
+def weights_with(changes, weights=None):
+    '''
+    A copy of a weight matrix with some weights changed
+
+    Inputs:
+        changes (dict): position, like '-FW', to a dict of feature, like
+            'SoT', to its new weight, see war_calc.FEATURES
+        weights (array): the weights to start from, war_calc.WEIGHTS by
+            default
+
+    Returns:
+        The new weight matrix
+    '''
+    if weights is None:
+        weights = war.WEIGHTS
+    weights = np.array(weights, dtype=float)
+    for pos, features in changes.items():
+        for feature, weight in features.items():
+            weights[war.POSITIONS.index(pos), war.FEATURES.index(feature)] = \
+                weight
+    return weights
+
+def goal_differential(centered, row_pos, weights):
+    '''
+    war_calc.goal_differential over the memory-mapped features, CHUNK_SIZE
+    rows at a time. It copies the rows it indexes, so only a chunk of the
+    matrix is ever in memory.
+
+    Inputs:
+        centered (memmap): the cache's feature matrix
+        row_pos (array): the index in war_calc.POSITIONS of every row
+        weights (array): a weight matrix like war_calc.WEIGHTS, or a stack
+            of them
+
+    Returns:
+        An array like war_calc.goal_differential's
+    '''
+    weights = np.asarray(weights, dtype=float)
+    raw_gd = np.empty((len(centered),) + weights.shape[:-2])
+    for start in range(0, len(centered), CHUNK_SIZE):
+        rows = slice(start, start + CHUNK_SIZE)
+        raw_gd[rows] = war.goal_differential(centered[rows], row_pos[rows],
+                                             weights)
+    return raw_gd
+
+def reweight(weights, cache=None, coef=None):
+    '''
+    Recomputes the WAR of every player-season under new weights
+
+    Inputs:
+        weights (array): a weight matrix like war_calc.WEIGHTS, or a stack
+            of them
+        cache (FeatureCache): the cache from load, or None to load the
+            default one
+        coef (float): wins per goal of differential, or None for the one
+            the cache was built with
+
+    Returns:
+        The cache's keys with a WAR column, or with WAR_0, WAR_1, ... one
+        column per weight set when weights is a stack
+    '''
+    if cache == None:
+        cache = load()
+    if coef == None:
+        coef = cache.coef
+
+    raw_gd = goal_differential(cache.centered, cache.row_pos, weights)
+    normed_war = war.normalize(raw_gd, cache.lengths, coef)[1]
+    war_values = normed_war[cache.player_rows]*6
+
+    df = cache.keys.copy()
+    if war_values.ndim == 1:
+        df['WAR'] = war_values
+    else:
+        for i in range(war_values.shape[1]):
+            df['WAR_' + str(i)] = war_values[:, i]
+    return df
+
+def parse_change(text):
+    '''
+    Reads a --set argument like -FW:SoT=0.4 into (position, feature, weight)
+    '''
+    pos, rest = text.split(':', 1)
+    feature, weight = rest.rsplit('=', 1)
+    return (pos, feature, float(weight))
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute WAR under new '
+                                     'weights from the feature cache')
+    parser.add_argument('db', nargs='?', default='players.db',
+                        help='the database to build the cache from')
+    parser.add_argument('--cache', default=CACHE,
+                        help='the directory of the feature cache')
+    parser.add_argument('--set', dest='changes', action='append', default=[],
+                        type=parse_change, metavar='POS:FEATURE=WEIGHT',
+                        help='change a weight, like -FW:SoT=0.4')
+    args = parser.parse_args()
+
+    cache = load(args.cache, args.db)
+    changes = {}
+    for pos, feature, weight in args.changes:
+        changes.setdefault(pos, {})[feature] = weight
+
+    start = time.perf_counter()
+    df = reweight(weights_with(changes), cache)
+    print('Reweighted', len(df), 'player-seasons in',
+          round((time.perf_counter() - start)*1000, 1), 'ms')
+    print(df.sort_values('WAR', ascending=False).head(20).to_string(
+        index=False))
+    db_writer.close_writers()
+
+if __name__ == '__main__':
+    main()
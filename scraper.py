@@ -1,29 +1,89 @@
 import re
-import queue
+import asyncio
+import argparse
 import sys
 import string
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import bs4
-from bs4 import Comment
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import urllib.parse
 
 import pandas as pd
 import numpy as np
-import sqlite3
-import sqlalchemy
-
-import sklearn
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
 
 import war_calc as war
+import page_cache
+import frontier
+import manifest
+import seasons
+import table_extract
+import table_schemas as schemas
+import pipeline
+import db_writer
+import player
+import player_season
+import player_career
+import db_indexes
+import season_join
+import baselines
+import bootstrap
+
+REQUEST_TIMEOUT = 30
 
 ###############################################################################
                     # GENERAL PURPOSE WEB SCRAPING FUNCTIONS #
 ###############################################################################
 
+def make_session(pool_size=10, retries=5, backoff=0.5):
+    '''
+    Build a keep-alive HTTP session that reuses connections and retries
+    throttled or failed requests with exponential backoff
+
+    Inputs:
+        pool_size (int): the most connections kept open to a single host
+        retries (int): the most times a request is retried
+        backoff (float): the base delay in seconds between retries, which
+            doubles after every retry
+
+    Returns:
+        A requests Session object
+    '''
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+SESSION = make_session()
+
+# the on-disk PageCache that get_request reads through, if any
+PAGE_CACHE = None
+
+def use_page_cache(path='page_cache', mode='online'):
+    '''
+    Route every page fetch through a persistent on-disk cache
+
+    Inputs:
+        path (str): the directory the cache is stored in
+        mode (str): 'online' to revalidate stale pages over the network or
+            'replay' to only ever serve pages that are already cached
+
+    Returns:
+        The PageCache object
+    '''
+    global PAGE_CACHE
+    PAGE_CACHE = page_cache.PageCache(path, mode)
+    return PAGE_CACHE
+
 def get_request(url):
     '''
     Open a connection to the specified URL and read the connection if successful
@@ -39,8 +99,11 @@ def get_request(url):
         r = None
     elif urllib.parse.urlparse(url).netloc != '':
         try:
-            r = requests.get(url)
-            if r.status_code == 404 or r.status_code == 403:
+            if PAGE_CACHE != None:
+                r = PAGE_CACHE.fetch(url, SESSION, REQUEST_TIMEOUT)
+            else:
+                r = SESSION.get(url, timeout=REQUEST_TIMEOUT)
+            if r != None and (r.status_code == 404 or r.status_code == 403):
                 r = None
         except Exception:
             r = None
@@ -116,6 +179,19 @@ def convert_if_relative_url(current_url, new_url):
     else:
         return urllib.parse.urljoin(current_url, new_url)
 
+def make_soup(request):
+    '''
+    Takes a Request object and returns a bs4 object of its contents
+
+    Inputs:
+        request (Request): a successful request from get_request
+
+    Returns:
+        A BeautifulSoup object
+    '''
+    text = read_request(request)
+    return bs4.BeautifulSoup(text, 'html.parser')
+
 def get_soup(url):
     '''
     Takes a url string and returns a bs4 object
@@ -130,58 +206,127 @@ def get_soup(url):
     request = get_request(url)
 
     if request != None:
-        text = read_request(request)
-        return bs4.BeautifulSoup(text, 'html.parser')
+        return make_soup(request)
 
-def queue_links(soup, starting_url, link_q, sub='main'):
+def get_links(page, starting_url, sub='main'):
     '''
-    Given a bs4 object, pull out all the links that need to be crawled
+    Given a parsed page, pull out all the links that a subcrawl should follow
 
     Inputs:
-        soup (bs4): a bs4 objec tat all link tags (a) can be pulled from
-        starting_url (str): the initial url that created the soup object
-        link_q (Queue): the current queue of links to crawl
+        page (TablePage): a page parsed by table_extract
+        starting_url (str): the initial url of the page
         sub (str): the subcrawl
 
     Returns:
-        Updated link_q with all link tags that need to be crawled
+        A list of absolute urls, in the order they appear on the page
     '''
 
-    links = soup.find_all('a', href = True)
+    clean_links = []
 
-    for link in links:
-        href = link.get('href')
+    for href in page.links:
         no_frag = remove_fragment(href)
         clean_link = convert_if_relative_url(starting_url, no_frag)
 
         if is_absolute_url(clean_link):
             if okay_url_fbref(clean_link, sub):
                 if clean_link != starting_url:
-                    if clean_link not in link_q.queue:
-                        link_q.put(clean_link)
+                    clean_links.append(clean_link)
+
+    return clean_links
+
+def queue_links(page, starting_url, link_q, sub='main'):
+    '''
+    Given a parsed page, pull out all the links that need to be crawled
+
+    Inputs:
+        page (TablePage): a page parsed by table_extract
+        starting_url (str): the initial url of the page
+        link_q (Frontier): the current frontier of links to crawl, which
+            skips links it has already seen
+        sub (str): the subcrawl
+
+    Returns:
+        Updated link_q with all link tags that need to be crawled
+    '''
+
+    links = get_links(page, starting_url, sub)
+    remember_links(starting_url, links)
+    for clean_link in links:
+        link_q.put(clean_link)
 
     return link_q
 
-def to_sql(df, name, db):
+def remember_links(url, links):
+    '''
+    Saves the links found on a page in the page cache, if there is one, for
+    unchanged_links
+    '''
+    if PAGE_CACHE != None:
+        PAGE_CACHE.save_links(url, links)
+
+def unchanged_links(html, url, sub='main'):
+    '''
+    The links of a page whose stats table has not changed, which is not
+    parsed or written again. The pages it links to still have to be
+    crawled, so its links come from the page cache, or from parsing the page
+    when the cache does not have them.
+
+    Inputs:
+        html (bytes): the page's html
+        url (str): the true url of the page
+        sub (str): the subcrawl
+
+    Returns:
+        A list of absolute urls, see get_links
+    '''
+    if PAGE_CACHE != None:
+        links = PAGE_CACHE.links(url)
+        if links != None:
+            return links
+    page = parse_page(html, SUBCRAWLS[sub][1].table_id)
+    links = get_links(page, url, sub)
+    remember_links(url, links)
+    return links
+
+def parse_page(html, table_id):
+    '''
+    Parses a fetched fbref page in a single pass
+
+    Inputs:
+        html (bytes): the page's html, from read_request
+        table_id (str): the html id of the page's player stats table
+
+    Returns:
+        A TablePage with the page's links, season and stats table
+    '''
+    return table_extract.extract(html, table_id)
+
+def report_parse(page):
+    '''
+    Prints how quickly a page's stats table was parsed
+    '''
+    print('Parsed', page.n_rows, 'rows from', page.season, 'at',
+          int(page.rows_per_sec), 'rows/sec')
+
+def to_sql(df, name, db, types=None):
     '''
     Converts a pandas DataFrame to an SQLite table and adds it to a database.
+    Writes go through the database's shared writer, so tables written
+    inside one of its transactions are committed together.
 
     Inputs:
-        df (DataFrame): a pandas DataFrame created by a get_tables function
+        df (DataFrame): a pandas DataFrame created by parse_tables
         title (str): the name of the SQL table we're creating
         db (database): a SQL database
+        types (dict): column name to the SQLite type to declare for it, see
+            table_schemas.sql_types
 
     Returns:
         None
     '''
 
-    connection = sqlite3.connect(db)
-    cursor = connection.cursor()
-
-    df.to_sql(name, connection, if_exists = "replace")
+    db_writer.get_writer(db).write(df, name, types=types)
     print('Wrote ', name, 'to', str(db))
-    cursor.close()
-    connection.close()
 
 ###############################################################################
                     # SPECIFIC CRAWLERS FOR SITES #
@@ -189,6 +334,8 @@ def to_sql(df, name, db):
 
 #################################wikipedia.com#################################
 
+WIKI_URL = 'https://en.wikipedia.org/wiki/Premier_League_records_and_statistics#Goals_2'
+
 def get_wiki_table():
     '''
     Scrapes https://en.wikipedia.org/wiki/Premier_League_records_and_statistics
@@ -198,11 +345,24 @@ def get_wiki_table():
     Inputs:
         None
     Returns:
-        gd_per_win (float): The average number of goals per win in the
-                               Premier League
+        goals (DataFrame): one row per club with its per season wins and
+            goal statistics
+    '''
+    soup = get_soup(WIKI_URL)
+    return parse_wiki_table(soup)
+
+def parse_wiki_table(soup):
+    '''
+    Builds the all-time goal and wins table out of the Premier League records
+    and statistics Wikipedia page
+
+    Inputs:
+        soup (bs4): BeautifulSoup for the Wikipedia page
+
+    Returns:
+        goals (DataFrame): one row per club with its per season wins and
+            goal statistics
     '''
-    url = 'https://en.wikipedia.org/wiki/Premier_League_records_and_statistics#Goals_2'
-    soup = get_soup(url)
     tables = soup.find_all('table', class_ = "wikitable sortable")
     goal_table = tables[4]
 
@@ -244,12 +404,14 @@ def okay_url_fbref(url, sub='main'):
 
     Inputs:
         url (str): an absolute url
-        sub (str): which subcrawl are we okaying
+        sub (str): which subcrawl are we okaying, its TableSpec says which
+            paths and seasons it follows
 
     Returns:
         True if the protocol for the url is http(s), the domain is in the
-            limiting_domain, and the path is either a directory or a file that
-            has no extension or ends in .html.
+            limiting_domain, the path is one of the subcrawl's pages and is
+            either a directory or a file that has no extension or ends in
+            .html.
         False otherwise or if the url includes a '@'
     '''
 
@@ -260,8 +422,6 @@ def okay_url_fbref(url, sub='main'):
     ld = len(limiting_domain)
     trunc_loc = loc[-(ld+1):]
 
-    adv_years = ['2018-2019', '2017-2018']
-
     if url == None:
         return False
 
@@ -283,409 +443,284 @@ def okay_url_fbref(url, sub='main'):
     if not (limiting_domain in loc+parsed_url.path):
         return False
 
-    if sub == 'main':
-        if not '/stats/' in parsed_url.path:
-            return False
-
-    if sub == 'keep_adv':
-        if not '/keepersadv' in parsed_url.path:
-            return False
-
-        good_year = False
-
-        for year in adv_years:
-            if year in parsed_url.path:
-                good_year = True
-                break
-
-        if good_year == False:
-            return False
-
-    if sub == 'keep_basic':
-        if not '/keepers/' in parsed_url.path:
-            return False
-
-    if sub == 'shooting':
-        if not '/shooting/' in parsed_url.path:
-            return False
-
-    if sub == 'passing':
-        if not '/passing/' in parsed_url.path:
-            return False
-
-        good_year = False
-
-        for year in adv_years:
-            if year in parsed_url.path:
-                good_year = True
-                break
+    # the pages of the subcrawl's table, for the seasons it has
+    spec = SUBCRAWLS[sub][1]
+    if not spec.path in parsed_url.path:
+        return False
 
-        if good_year == False:
+    if spec.seasons != None:
+        if not any([season in parsed_url.path for season in spec.seasons]):
             return False
 
     (filename, ext) = os.path.splitext(parsed_url.path)
 
     return (ext == '' or ext == '.html')
 
-def get_tables_fbref(soup, db='players.db'):
+def coerce_types(data, spec):
     '''
-    Takes a https://fbref.com/en/comps/9/####/stats/ page and updates the
-    players.db sqlite3 database using the tables from the page.
+    Converts the text cells of a stats table to the types its spec declares,
+    one whole column at a time
 
     Inputs:
-        soup (bs4): BeautifulSoup for a fbref.com yearly stats page
-        db (database): sqlite3 database
+        data (DataFrame): a stats table of cell text
+        spec (TableSpec): the table's spec
 
     Returns:
-        None
+        A DataFrame with INTEGER and REAL columns stored as numbers
     '''
-    tables = soup.find_all('div', class_ = "table_outer_container")
-
-     # get players data in commented out table
-    players = soup.find_all(text = lambda text: isinstance(text, Comment))
-
-    # commented fbref table is the 11th in the list of comments
-    plays = bs4.BeautifulSoup(players[11], 'html.parser').find('tbody')
-    table_rows = plays.find_all('tr')
-
-    col_tags = bs4.BeautifulSoup(players[11], 'html.parser').find_all('th', scope = 'col')
-    columns = []
-    for col in col_tags:
-        columns.append(col.get_text())
-    columns = columns[1:]
-
-    # get year that data is from on FBref
-    year = soup.find('li', class_='full').get_text()[:9]
-
-    # rename columns
-    columns[15] = 'Gls_per_game'
-    columns[16] = 'Ast_per_game'
-    if len(columns) >= 23:
-        columns[23] = 'xG_per_game'
-        columns[24] = 'xA_per_game'
-        columns[25] = 'xG+xA_per_game'
-        columns[26] = 'npxG_per_game'
-        columns[27] = 'npxG+xA_per_game'
-
-    # construct the player_data DataFrame
-    data = []
-    for tr in table_rows:
-        td = tr.find_all('td')
-        row = [tr.text for tr in td]
-        data.append(row)
-    player_data = pd.DataFrame(data, columns = columns)
-    player_data = player_data.dropna()
-
-    # drop matches column beacuse it is just a link to matches played
-    if 'Matches' in player_data.columns:
-        player_data = player_data.drop(columns = 'Matches')
+    typed = {}
+    for i, column in enumerate(data.columns):
+        values = data.iloc[:, i]
+        col_type = spec.column_type(column)
+        if col_type != 'text':
+            values = values.astype(str).str.replace(',', '', regex=False)
+            values = pd.to_numeric(values, errors='coerce')
+            if col_type == 'integer' and (values.dropna() % 1 == 0).all():
+                values = values.astype('Int64')
+            else:
+                values = values.astype(float)
+        typed[i] = values
 
-    # clean and parse position column
-    player_data = player_data.rename(columns={'Pos': 'Pos_1'})
-    player_data.insert(3, 'Pos_2', None)
-    player_data[['Pos_1', 'Pos_2']] = player_data.Pos_1.str.split(',', expand=True)
+    typed = pd.DataFrame(typed, index=data.index)
+    typed.columns = data.columns
+    return typed
 
-    # clean nation column
-    player_data['Nation'] = player_data['Nation'].str.strip().str[-3:]
-
-    # write the main year table to the database
-    to_sql(player_data, year, db)
-
-    #  generate 3 additional tables for each year that contain players
-    # from each of the major positions
-    positions = ['DF', 'FW', 'MF']
-    for pos in positions:
-        pos_1 = player_data.loc[(player_data['Pos_1']==pos) \
-                                & (player_data['Pos_2'].isnull())]
-        title = year + '-' + pos
-        to_sql(pos_1, title, db)
-
-    # generate the the wingback table and write to the database
-    df_mf = player_data[(player_data['Pos_1'] == 'DF') \
-                        & (player_data['Pos_2'] == 'MF')]
-    mf_df = player_data[(player_data['Pos_1'] == 'MF') \
-                        & (player_data['Pos_2'] == 'DF')]
-    wb = pd.concat([df_mf, mf_df])
-    title = year + '-WB'
-    to_sql(wb, title, db)
-
-    # generate the the winger table and write to the database
-    fw_mf = player_data[(player_data['Pos_1'] == 'FW') \
-                        & (player_data['Pos_2'] == 'MF')]
-    mf_fw = player_data[(player_data['Pos_1'] == 'MF') \
-                        & (player_data['Pos_2'] == 'FW')]
-    wb = pd.concat([fw_mf, mf_fw])
-    title = year + '-WING'
-    to_sql(wb, title, db)
-
-    return player_data
-
-def get_keeper_adv_tables(soup, db='players.db'):
-    '''
-    Takes a https://fbref.com/en/comps/9/##/####/keepersadv/ page and updates
-    the players.db sqlite3 database using the tables from the page.
+def parse_tables(page, spec):
+    '''
+    Builds the tables that a fbref.com yearly stats page holds, as declared
+    by the page's TableSpec
 
     Inputs:
-        soup (bs4): BeautifulSoup for a fbref.com yearly stats page
-        db (database): sqlite3 database
+        page (TablePage): a fbref.com yearly stats page from table_extract
+        spec (TableSpec): the spec for the page's stats table
 
     Returns:
-        None
+        tables (dict): table name to DataFrame, starting with the main table
+            for the season followed by any tables derived from it
     '''
-    tables = soup.find_all('div', class_ = "table_outer_container")
-
-     # get players data in commented out table
-    players = soup.find_all(text = lambda text: isinstance(text, Comment))
-
-    # commented fbref table is the 11th in the list of comments
-    plays = bs4.BeautifulSoup(players[11], 'html.parser').find('tbody')
-    table_rows = plays.find_all('tr')
-
-    col_tags = bs4.BeautifulSoup(players[11], 'html.parser').find_all('th', scope = 'col')
-    columns = []
-    for col in col_tags:
-        columns.append(col.get_text())
-    columns = columns[1:]
+    # rename the columns fbref gives the same name twice
+    columns = list(page.columns)
+    for index, name in spec.renames.items():
+        if index < len(columns):
+            columns[index] = name
 
     # get year that data is from on FBref
-    year = soup.find('li', class_='full').get_text()[:9]
-
-    # rename columns
-    columns[16] = 'Launched_Cmp'
-    columns[17] = 'Launched_Att'
-    columns[18] = 'Launched_Cmp%'
-    columns[19] = 'Pass_Att'
-    columns[23] = 'GK_Att'
-    columns[24] = 'GK_Launch%'
-    columns[25] = 'GK_AvgLen'
-    columns[26] = 'Cross_Att'
-    columns[27] = 'Cross_Stp'
-    columns[28] = 'Cross_Stp%'
-    columns[31] = 'Avg_Def_Dist'
+    year = page.season[:9]
 
-    data = []
-    for tr in table_rows:
-        td = tr.find_all('td')
-        row = [tr.text for tr in td]
-        data.append(row)
-    keeper_data = pd.DataFrame(data, columns = columns)
-    keeper_data = keeper_data.dropna()
+    data = page.to_frame(columns)
+    data = data.dropna()
+
+    # keep fbref's id for each player, player.add_ids turns it into the
+    # player's id in the database
+    data['fbref_id'] = pd.Series(page.player_ids, dtype=object)
 
     # drop matches column beacuse it is just a link to matches played
-    if 'Matches' in keeper_data.columns:
-        keeper_data = keeper_data.drop(columns = 'Matches')
+    if 'Matches' in data.columns:
+        data = data.drop(columns = 'Matches')
+
+    # clean and parse position column
+    if spec.split_pos:
+        split = data['Pos'].str.split(',', n=1, expand=True)
+        split = split.reindex(columns=[0, 1])
+        data = data.rename(columns={'Pos': 'Pos_1'})
+        data.insert(3, 'Pos_2', None)
+        data['Pos_1'] = split[0]
+        data['Pos_2'] = split[1]
 
     # clean nation column
-    keeper_data['Nation'] = keeper_data['Nation'].str.strip().str[-3:]
-    name = year+'-GK-ADV'
+    data['Nation'] = data['Nation'].str.strip().str[-3:]
+
+    data = coerce_types(data, spec)
+    tables = {year + spec.suffix: data}
+
+    # generate the tables for each position group
+    for suffix, pairs in spec.position_splits.items():
+        tables[year + suffix] = split_positions(data, pairs)
 
-    # write the main year table to the database
-    to_sql(keeper_data, name, db)
+    return tables
 
-def get_keeper_basic_tables(soup, db='players.db'):
+def split_positions(data, pairs):
     '''
-    Takes a https://fbref.com/en/comps/9/####/keepers/ page and updates
-    the players.db sqlite3 database using the tables from the page.
+    Picks out the players of one position group
 
     Inputs:
-        soup (bs4): BeautifulSoup for a fbref.com yearly stats page
-        db (database): sqlite3 database
+        data (DataFrame): a table with Pos_1 and Pos_2 columns
+        pairs (list): the (Pos_1, Pos_2) pairs of the group's players, see
+            table_schemas.POSITION_SPLITS
 
     Returns:
-        None
+        A DataFrame of the group's rows, in the order of pairs
     '''
-    tables = soup.find_all('div', class_ = "table_outer_container")
-
-     # get players data in commented out table
-    players = soup.find_all(text = lambda text: isinstance(text, Comment))
-
-    # commented fbref table is the 11th in the list of comments
-    plays = bs4.BeautifulSoup(players[11], 'html.parser').find('tbody')
-    table_rows = plays.find_all('tr')
-
-    col_tags = bs4.BeautifulSoup(players[11], 'html.parser').find_all('th', scope = 'col')
-    columns = []
-    for col in col_tags:
-        columns.append(col.get_text())
-    columns = columns[1:]
-
-    # get year that data is from on FBref
-    year = soup.find('li', class_='full').get_text()[:9]
-
-    data = []
-    for tr in table_rows:
-        td = tr.find_all('td')
-        row = [tr.text for tr in td]
-        data.append(row)
-    keeper_data = pd.DataFrame(data, columns = columns)
-    keeper_data = keeper_data.dropna()
-
-    # drop matches column beacuse it is just a link to matches played
-    if 'Matches' in keeper_data.columns:
-        keeper_data = keeper_data.drop(columns = 'Matches')
-
-    # clean nation column
-    keeper_data['Nation'] = keeper_data['Nation'].str.strip().str[-3:]
-
-    name = year+'-GK'
-
-    # write the main year table to the database
-    to_sql(keeper_data, name, db)
+    groups = []
+    for pos_1, pos_2 in pairs:
+        if pos_2 == None:
+            group = data[(data['Pos_1'] == pos_1) & data['Pos_2'].isnull()]
+        else:
+            group = data[(data['Pos_1'] == pos_1) & (data['Pos_2'] == pos_2)]
+        groups.append(group)
+    return pd.concat(groups)
 
-def get_shooting_tables(soup, db='players.db'):
+def get_tables(page, spec, db='players.db'):
     '''
-    Takes a https://fbref.com/en/comps/9/####/shooting/ page and updates
-    the players.db sqlite3 database using the tables from the page.
+    Takes a parsed fbref.com yearly stats page and updates the players.db
+    sqlite3 database using the tables from the page.
 
     Inputs:
-        soup (bs4): BeautifulSoup for a fbref.com yearly stats page
+        page (TablePage): a fbref.com yearly stats page from table_extract
+        spec (TableSpec): the spec for the page's stats table
         db (database): sqlite3 database
 
     Returns:
-        None
+        tables (dict): table name to DataFrame of every table written
     '''
-    tables = soup.find_all('div', class_ = "table_outer_container")
-
-     # get players data in commented out table
-    players = soup.find_all(text = lambda text: isinstance(text, Comment))
-
-    # commented fbref table is the 11th in the list of comments
-    plays = bs4.BeautifulSoup(players[11], 'html.parser').find('tbody')
-    table_rows = plays.find_all('tr')
-
-    col_tags = bs4.BeautifulSoup(players[11], 'html.parser').find_all('th', scope = 'col')
-    columns = []
-    for col in col_tags:
-        columns.append(col.get_text())
-    columns = columns[1:]
-
-    # get year that data is from on FBref
-    year = soup.find('li', class_='full').get_text()[:9]
-
-    data = []
-    for tr in table_rows:
-        td = tr.find_all('td')
-        row = [tr.text for tr in td]
-        data.append(row)
-    shooting_data = pd.DataFrame(data, columns = columns)
-    shooting_data = shooting_data.dropna()
-
-    # drop matches column beacuse it is just a link to matches played
-    if 'Matches' in shooting_data.columns:
-        shooting_data = shooting_data.drop(columns = 'Matches')
-
-    # clean and parse position column
-    shooting_data = shooting_data.rename(columns={'Pos': 'Pos_1'})
-    shooting_data.insert(3, 'Pos_2', None)
-    shooting_data[['Pos_1', 'Pos_2']] = shooting_data.Pos_1.str.split(',', expand=True)
-
-    # clean nation column
-    shooting_data['Nation'] = shooting_data['Nation'].str.strip().str[-3:]
-
-    name = year+'-SHOOT'
-
-    # write the main year table to the database
-    to_sql(shooting_data, name, db)
-
-def get_passing_tables(soup, db='players.db'):
+    report_parse(page)
+    tables = parse_tables(page, spec)
+    writer = db_writer.get_writer(db)
+    with writer.transaction():
+        for name, df in tables.items():
+            tables[name] = player.add_ids(writer, df)
+            to_sql(tables[name], name, db,
+                   schemas.sql_types(tables[name].columns, spec))
+    return tables
+
+def write_page(page, spec, sub, url, content_hash, scrape_manifest,
+               db='players.db'):
     '''
-    Takes a https://fbref.com/en/comps/9/##/####/passing/ page and updates
-    the players.db sqlite3 database using the tables from the page.
+    Writes a page's tables and its scrape manifest entry in one transaction,
+    so a page is never recorded without its tables
 
     Inputs:
-        soup (bs4): BeautifulSoup for a fbref.com yearly stats page
-        db (database): sqlite3 database
+        page (TablePage): the parsed page
+        spec (TableSpec): the spec of the page's stats table
+        sub (str): the subcrawl the page belongs to
+        url (str): the true url of the page
+        content_hash (str): the fingerprint of the page's stats table
+        scrape_manifest (ScrapeManifest): the manifest to record the page in
+        db (str): the database to write to
 
     Returns:
-        None
+        tables (dict): table name to DataFrame of every table written
     '''
-    tables = soup.find_all('div', class_ = "table_outer_container")
-
-     # get players data in commented out table
-    players = soup.find_all(text = lambda text: isinstance(text, Comment))
-
-    # commented fbref table is the 11th in the list of comments
-    plays = bs4.BeautifulSoup(players[11], 'html.parser').find('tbody')
-    table_rows = plays.find_all('tr')
-
-    col_tags = bs4.BeautifulSoup(players[11], 'html.parser').find_all('th', scope = 'col')
-    columns = []
-    for col in col_tags:
-        columns.append(col.get_text())
-    columns = columns[1:]
-
-    # get year that data is from on FBref
-    year = soup.find('li', class_='full').get_text()[:9]
-
-    # rename columns
-    columns[11] = 'Total_Cmp'
-    columns[12] = 'Total_Att'
-    columns[13] = 'Total_Cmp%'
-    columns[14] = 'Short_Cmp'
-    columns[15] = 'Short_Att'
-    columns[16] = 'Short_Cmp%'
-    columns[17] = 'Med_Cmp'
-    columns[18] = 'Med_Att'
-    columns[19] = 'Med_Cmp%'
-    columns[20] = 'Long_Cmp'
-    columns[21] = 'Long_Att'
-    columns[22] = 'Long_Cmp%'
-
-    data = []
-    for tr in table_rows:
-        td = tr.find_all('td')
-        row = [tr.text for tr in td]
-        data.append(row)
-    passing_data = pd.DataFrame(data, columns = columns)
-    passing_data = passing_data.dropna()
-
-    # drop matches column beacuse it is just a link to matches played
-    if 'Matches' in passing_data.columns:
-        passing_data = passing_data.drop(columns = 'Matches')
-
-    # clean and parse position column
-    passing_data = passing_data.rename(columns={'Pos': 'Pos_1'})
-    passing_data.insert(3, 'Pos_2', None)
-    passing_data[['Pos_1', 'Pos_2']] = passing_data.Pos_1.str.split(',', expand=True)
-
-    # clean nation column
-    passing_data['Nation'] = passing_data['Nation'].str.strip().str[-3:]
-
-    name = year+'-PASS'
-
-    # write the main year table to the database
-    to_sql(passing_data, name, db)
-
-def crawl(link_q, sub, get_tables, pages_crawled):
+    writer = db_writer.get_writer(db)
+    with writer.transaction():
+        tables = get_tables(page, spec, db)
+        scrape_manifest.record(sub, page.season[:9], url, content_hash,
+                               page.n_rows)
+    return tables
+
+def crawl(link_q, sub, scrape_manifest=None):
     '''
     Crawls a link_q using an url checker function and a get tables function
 
     Inputs:
-        link_q (Queue): queue of links to crawl
-        sub (str): passed to okay_url_fbref to add additional checks for subcrawlers
-        get_tables (function): a function that gets the tables for a soup object
-        pages_crawled (list): a list of pages that have been crawled so far
+        link_q (Frontier): frontier of links to crawl
+        sub (str): passed to okay_url_fbref to add additional checks for
+            subcrawlers, and picks the spec of the tables to get from each page
+        scrape_manifest (ScrapeManifest): records every season page written,
+            and in incremental mode decides which pages to skip
 
     Returns:
         None
     '''
+    if scrape_manifest == None:
+        scrape_manifest = manifest.ScrapeManifest()
+    spec = SUBCRAWLS[sub][1]
     while not link_q.empty():
         year_page = link_q.get()
 
+        if not scrape_manifest.needs_fetch(sub, seasons.season_of(year_page)):
+            link_q.mark_crawled(year_page)
+            continue
+
+        # fetch each page once and use the response both to find the true
+        # url after redirects and to parse
         request = get_request(year_page)
-        if request != None:
-            year_page = get_request_url(request)
+        if request == None:
+            link_q.mark_failed(year_page)
+            continue
+        true_url = get_request_url(request)
+
+        if link_q.is_crawled(true_url):
+            link_q.mark_crawled(year_page, true_url)
+            continue
+
+        html = read_request(request)
+        content_hash = table_extract.fingerprint(html, spec.table_id)
+        if scrape_manifest.is_unchanged(sub, true_url, content_hash):
+            print('Unchanged', true_url)
+            for link in unchanged_links(html, true_url, sub):
+                link_q.put(link)
+            link_q.mark_crawled(year_page, true_url)
+            continue
+
+        page = parse_page(html, spec.table_id)
+        link_q = queue_links(page, true_url, link_q, sub)
+        write_page(page, spec, sub, true_url, content_hash, scrape_manifest)
+        link_q.mark_crawled(year_page, true_url)
+
+def add_war_intervals(db, coef, resamples, jobs=1):
+    '''
+    Adds WAR_lower and WAR_upper to the -JOIN tables and player_season rows
+    of every season whose intervals are missing or came from another number
+    of resamples, as recorded in the join manifest. Only the intervals are
+    written, a player's WAR is left as it is. The seasons join_years just
+    joined already have theirs, so only seasons that were not rejoined are
+    read back and rewritten here.
 
-        if year_page not in pages_crawled:
-            pages_crawled.append(year_page)
-            year_soup = get_soup(year_page)
-            link_q = queue_links(year_soup, year_page, link_q, sub)
-            get_tables(year_soup)
+    Inputs:
+        db (str): the players database
+        coef (float): wins per goal of differential, from find_regr
+        resamples (int): the number of bootstrap resamples
+        jobs (int): the number of processes to spread the players over
 
-def join_years(db='players.db'):
+    Returns:
+        None
+    '''
+    start = time.perf_counter()
+    writer = db_writer.get_writer(db)
+    join_manifest = manifest.JoinManifest(writer)
+    names = season_join.table_names(writer.connection)
+
+    tables = {}
+    for season in seasons.get_seasons():
+        if not join_manifest.intervals_stale(season, resamples):
+            continue
+        tables[season] = []
+        for pos in season_join.POSITIONS:
+            title = season+pos+'-JOIN'
+            if title not in names:
+                continue
+            df = pd.read_sql_query('SELECT * FROM ' + db_writer.quote(title) +
+                                   ';', writer.connection)
+            # restore the index the table was written with, so writing it
+            # back gives the same columns
+            label = 'level_0' if 'level_0' in df.columns else 'index'
+            df = df.set_index(label).rename_axis(None)
+            baseline_df = baselines.read_group(
+                writer.connection, season, player_season.position_group(pos))
+            tables[season].append((df, pos, baseline_df))
+    print(len(tables), 'seasons to bootstrap:', list(tables))
+
+    bootstrap.add_intervals([table for season_tables in tables.values()
+                             for table in season_tables],
+                            coef, resamples, jobs)
+    for season, season_tables in tables.items():
+        with writer.transaction():
+            for df, pos, baseline_df in season_tables:
+                title = season+pos+'-JOIN'
+                to_sql(df, title, db, schemas.sql_types(df.columns))
+                player_season.write_intervals(writer, df, season, pos)
+                join_manifest.record_intervals(title, resamples)
+    print('Bootstrapped WAR over', resamples, 'resamples in',
+          round(time.perf_counter() - start, 1), 'seconds')
+
+def join_years(db='players.db', jobs=1, stale_only=False, resamples=0):
     '''
     Joins all of the year tables scraped from fbref.com and joins them on
-    players by position. Adds the 4 new tables per year to the database.
+    players by position. Adds the 4 new tables per year to the database,
+    every joined row to the player_season table and the WAR baselines of
+    each table to the baselines table, updates the career and rolling WAR
+    of the players of the joined seasons, then creates the search indexes.
 
     Inputs:
         db (Database): the database of player tables that contains tables for:
@@ -706,158 +741,387 @@ def join_years(db='players.db'):
                 ** Basic only before 2016-2017 **
             5. Passing
                 ** Available from 2017-2018 onwards **
+        jobs (int): the number of processes to join seasons on. Every
+            season's tables are still written from this process.
+        stale_only (bool): only join the seasons whose stats tables or
+            WAR parameters changed since their tables were last built, as
+            recorded in the join manifest
+        resamples (int): the number of bootstrap resamples to compute each
+            player's WAR_lower and WAR_upper from, or 0 to skip them. The
+            joined seasons are bootstrapped before they are written, and of
+            the rest only those without intervals from that many resamples
+            are, see add_war_intervals.
     Returns:
         None
     '''
-    connection = sqlite3.connect(db)
-    c = connection.cursor()
-
-    years = list(range(1992, 2020))
-    seasons = []
-    for year in years:
-        next_year = year+1
-        season = str(year)+'-'+str(next_year)
-        seasons.append(season)
-
-    # Join the tables for the non-goalkeeping positions
-    positions = ['-DF', '-FW', '-MF', '-WB', '-WING']
-    for season in seasons:
-        for pos in positions:
-            main_table = season+pos
-            if season in seasons[-3:]:
-                pass_table = season+'-PASS'
-                shoot_table = season+'-SHOOT'
-                query = '''SELECT * FROM '{}' LEFT JOIN '{}' ON '{}'.Player='{}'.Player
-                           LEFT JOIN '{}' ON '{}'.Player='{}'.Player;'''
-                query = query.format(main_table, pass_table, main_table, pass_table,
-                        shoot_table, main_table, shoot_table)
-            else:
-                shoot_table = season+'-SHOOT'
-                query = '''SELECT * FROM '{}' LEFT JOIN '{}' ON '{}'.Player='{}'.Player;'''
-                query = query.format(main_table, shoot_table, main_table, shoot_table)
-            df = pd.read_sql_query(query, connection)
-            df = df.loc[:,~df.columns.duplicated()]
-            df["Min"] = df["Min"].str.replace(",","")
-            df = df.apply(pd.to_numeric, errors='ignore')
-            df.fillna(0, inplace=True)
-
-            avg_index = df.index[-1]+1
-            df.loc[avg_index] = df.mean()
-            df.at[avg_index, 'index'] = df.at[avg_index-1, 'index']+1
-            df.at[avg_index, 'Player'] = 'Average'
-            df.at[avg_index, 'Pos_1'] = df.at[avg_index-1, 'Pos_1']
-            df.at[avg_index, 'Pos_2'] = df.at[avg_index-1, 'Pos_2']
-            df.at[avg_index, 'Squad'] = 'Average'
-
-            replace_index = df.index[-1]+1
-            df.loc[replace_index] = df.mean()*.75
-            df.at[replace_index, 'index'] = df.at[replace_index-1, 'index']+1
-            df.at[replace_index, 'Player'] = 'Replacement'
-            df.at[replace_index, 'Pos_1'] = df.at[replace_index-1, 'Pos_1']
-            df.at[replace_index, 'Pos_2'] = df.at[replace_index-1, 'Pos_2']
-            df.at[replace_index, 'Squad'] = 'Replacement'
-
-            title = main_table+'-JOIN'
-            df = war.add_war(df, pos)
-
-            to_sql(df, title, db)
-
-    # Join the goalkeeping tables
-    for season in seasons:
-        main_table = season+'-GK'
-        if season in seasons[-3:]:
-            adv_table = season+'-GK-ADV'
-            pass_table = season+'-PASS'
-            query = '''SELECT * FROM '{}' LEFT JOIN '{}' ON '{}'.Player='{}'.Player
-                       LEFT JOIN '{}' ON '{}'.Player='{}'.Player;'''
-            query = query.format(main_table, adv_table, main_table, adv_table,
-                    pass_table, main_table, pass_table)
-        else:
-            query = '''SELECT * FROM '{}';'''.format(main_table)
-        df = pd.read_sql_query(query, connection)
-        df = df.loc[:,~df.columns.duplicated()]
-        df["Min"] = df["Min"].str.replace(",","")
-        df = df.apply(pd.to_numeric, errors='ignore')
-
-        df['Raw_Save%'] = (df['SoTA']-df['GA'])/df['SoTA']
-        df.fillna(0, inplace=True)
-
-
-        avg_index = df.index[-1]+1
-        df.loc[avg_index] = df.mean()
-        df.at[avg_index, 'index'] = df.at[avg_index-1, 'index']+1
-        df.at[avg_index, 'Player'] = 'Average'
-        df.at[avg_index, 'Pos'] = df.at[avg_index-1, 'Pos']
-        df.at[avg_index, 'Squad'] = 'Average'
-
-        replace_index = df.index[-1]+1
-        df.loc[replace_index] = df.mean()*.75
-        df.at[replace_index, 'index'] = df.at[replace_index-1, 'index']+1
-        df.at[replace_index, 'Player'] = 'Replacement'
-        df.at[replace_index, 'Pos'] = df.at[replace_index-1, 'Pos']
-        df.at[replace_index, 'Squad'] = 'Replacement'
-
-        df = war.add_war(df, '-GK')
-
-        title = main_table+'-JOIN'
-        to_sql(df, title, db)
-
-    c.close()
-    connection.close()
-
-def go_helper(sub):
-    '''
-    Crawls a subset of https://fbref.com and updates the players.db
-    '''
-    link_q = queue.Queue()
-
-    if sub == 'main':
-        starting_url = 'https://fbref.com/en/comps/9/stats/Premier-League-Stats'
-    elif sub == 'keep_adv':
-        starting_url = 'https://fbref.com/en/comps/9/keepersadv/Premier-League-Stats'
-    elif sub == 'keep_basic':
-        starting_url = 'https://fbref.com/en/comps/9/keepers/Premier-League-Stats'
-    elif sub == 'shooting':
-        starting_url = 'https://fbref.com/en/comps/9/shooting/Premier-League-Stats'
-    elif sub == 'passing':
-        starting_url = 'https://fbref.com/en/comps/9/passing/Premier-League-Stats'
-
-    pages_crawled = [starting_url]
-    soup = get_soup(starting_url)
-    link_q = queue_links(soup, starting_url, link_q, sub)
-
-    if sub == 'main':
-        get_tables_fbref(soup)
-        crawl(link_q, 'main', get_tables_fbref, pages_crawled)
-    elif sub == 'keep_adv':
-        get_keeper_adv_tables(soup)
-        crawl(link_q, 'keep_adv', get_keeper_adv_tables, pages_crawled)
-    elif sub == 'keep_basic':
-        get_keeper_basic_tables(soup)
-        crawl(link_q, 'keep_basic', get_keeper_basic_tables, pages_crawled)
-    elif sub == 'shooting':
-        get_shooting_tables(soup)
-        crawl(link_q, 'shooting', get_shooting_tables, pages_crawled)
-    elif sub == 'passing':
-        get_passing_tables(soup)
-        crawl(link_q, 'passing', get_passing_tables, pages_crawled)
-
-def go():
+    start = time.perf_counter()
+
+    # read through the writer's connection and write each season's tables
+    # in one transaction
+    writer = db_writer.get_writer(db)
+    player_season.create_table(writer)
+    baselines.create_table(writer)
+    player_career.create_table(writer)
+
+    # fit the goal differential to wins regression once for the whole build
+    coef = war.find_regr()[0]
+
+    # find the seasons whose tables or parameters changed
+    join_manifest = manifest.JoinManifest(writer)
+    params = season_join.params_hash(coef)
+    sources = {}
+    season_names = []
+    for season in seasons.get_seasons():
+        sources[season] = season_join.source_hashes(writer.connection, season)
+        if not stale_only or join_manifest.is_stale(
+                season, season_join.joined_tables(season), sources[season],
+                params):
+            season_names.append(season)
+    if stale_only:
+        print(len(season_names), 'stale seasons to join:', season_names)
+
+    # read and join each season once
+    built = {}
+    for season, joined, baseline_dfs, seconds in season_join.join_seasons(
+            db, season_names, jobs):
+        built[season] = (joined, baseline_dfs)
+        print('Joined', season, 'in', round(seconds, 2), 'seconds')
+
+    # score every season and position in one pass
+    score_start = time.perf_counter()
+    tables = [(df, pos, baseline_dfs[pos])
+              for joined, baseline_dfs in built.values()
+              for pos, df in joined.items()]
+    war.add_war_batch(tables, coef)
+    print('Scored', len(built), 'seasons in',
+          round(time.perf_counter() - score_start, 3), 'seconds')
+
+    # bootstrap the joined seasons before they are written, so each of
+    # their tables is written once
+    if resamples > 0:
+        bootstrap_start = time.perf_counter()
+        bootstrap.add_intervals(tables, coef, resamples, jobs)
+        print('Bootstrapped', len(built), 'seasons over', resamples,
+              'resamples in',
+              round(time.perf_counter() - bootstrap_start, 1), 'seconds')
+
+    # write each season's table for every position, noting the players the
+    # seasons had before so those who left them are updated too
+    changed_players = player_career.season_players(writer.connection,
+                                                   list(built))
+    for season, (joined, baseline_dfs) in built.items():
+        write_start = time.perf_counter()
+        with writer.transaction():
+            for pos, df in joined.items():
+                title = season+pos+'-JOIN'
+                to_sql(df, title, db, schemas.sql_types(df.columns))
+                player_season.write_group(writer, df, season, pos)
+                baselines.write_group(writer, baseline_dfs[pos], season,
+                                      player_season.position_group(pos))
+                join_manifest.record(title, season, sources[season], params)
+                if resamples > 0:
+                    join_manifest.record_intervals(title, resamples)
+        print('Wrote', season, 'in',
+              round(time.perf_counter() - write_start, 2), 'seconds')
+    print('Joined', len(season_names), 'seasons with', jobs, 'jobs in',
+          round(time.perf_counter() - start, 1), 'seconds')
+
+    # bootstrap the seasons that were not rejoined but whose intervals are
+    # missing or came from another number of resamples
+    if resamples > 0:
+        add_war_intervals(db, coef, resamples, jobs)
+
+    # rebuild the careers and rolling windows of the joined seasons' players
+    career_start = time.perf_counter()
+    changed_players |= player_career.season_players(writer.connection,
+                                                    list(built))
+    player_career.update(writer, changed_players)
+    print('Updated the careers of', len(changed_players), 'players in',
+          round(time.perf_counter() - career_start, 2), 'seconds')
+
+    # index the tables for the site's searches and check the query plans
+    db_indexes.create_indexes(db)
+    db_indexes.write_report(db, db_indexes.REPORT)
+
+# the starting url and the stats table spec for each subcrawl
+SUBCRAWLS = {
+    'main': ('https://fbref.com/en/comps/9/stats/Premier-League-Stats',
+             schemas.STANDARD),
+    'keep_adv': ('https://fbref.com/en/comps/9/keepersadv/Premier-League-Stats',
+                 schemas.KEEPER_ADV),
+    'keep_basic': ('https://fbref.com/en/comps/9/keepers/Premier-League-Stats',
+                   schemas.KEEPER_BASIC),
+    'shooting': ('https://fbref.com/en/comps/9/shooting/Premier-League-Stats',
+                 schemas.SHOOTING),
+    'passing': ('https://fbref.com/en/comps/9/passing/Premier-League-Stats',
+                schemas.PASSING),
+}
+
+def checkpoint_path(checkpoint_dir, sub):
     '''
-    Crawl https://fbref.com and update the players.db
+    The file a subcrawl's frontier is checkpointed to, or None if crawls
+    are not being checkpointed
+    '''
+    if checkpoint_dir == None:
+        return None
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return os.path.join(checkpoint_dir, sub + '.json')
+
+def go_helper(sub, checkpoint_dir=None, incremental=False):
+    '''
+    Crawls a subset of https://fbref.com and updates the players.db.
+    If checkpoint_dir is given the crawl's progress is saved there, and a
+    crawl that was interrupted resumes where it stopped. If incremental is
+    True only seasons that can still change are fetched.
+    '''
+    starting_url = SUBCRAWLS[sub][0]
+    scrape_manifest = manifest.ScrapeManifest(incremental=incremental)
+
+    link_q = frontier.Frontier(checkpoint_path(checkpoint_dir, sub))
+    link_q.put(starting_url)
+
+    crawl(link_q, sub, scrape_manifest)
+    link_q.finish()
+    scrape_manifest.close()
+
+###############################################################################
+                    # CONCURRENT CRAWLER #
+###############################################################################
+
+async def async_crawl(sub, fetch, parse_executor, checkpoint=None,
+                      scrape_manifest=None, parse_pool=None):
+    '''
+    Crawls one subset of https://fbref.com, fetching every season page that
+    has been discovered so far at the same time
+
+    Inputs:
+        sub (str): which subcrawl to run (a key of SUBCRAWLS)
+        fetch (coroutine function): takes an url and returns a Request object
+            or None, respecting the crawl's concurrency limits
+        parse_executor (Executor): a single worker executor that the
+            get_tables calls run on so that writes to the database
+            never overlap
+        checkpoint (str): a file to save the crawl's progress to and to
+            resume an interrupted crawl from
+        scrape_manifest (ScrapeManifest): records every season page written,
+            and in incremental mode decides which pages to skip
+        parse_pool (Executor): the executor pages are parsed on, so that
+            parsing never holds up the event loop. None parses them on the
+            loop's default thread pool.
+
+    Returns:
+        pages_crawled (set): the canonical urls of every page that was crawled
+    '''
+    if scrape_manifest == None:
+        scrape_manifest = manifest.ScrapeManifest()
+    loop = asyncio.get_running_loop()
+    starting_url, spec = SUBCRAWLS[sub]
+    link_q = frontier.Frontier(checkpoint)
+    link_q.put(starting_url)
+    tasks = set()
+    # the pages written so far, only used on the single write thread
+    written = set()
+
+    def write_new(page, page_url, content_hash):
+        # two urls in flight can redirect to the same page, so only the
+        # first of them to reach the write thread writes it
+        key = frontier.canonicalize(page_url)
+        if link_q.is_crawled(page_url) or key in written:
+            return
+        write_page(page, spec, sub, page_url, content_hash, scrape_manifest)
+        written.add(key)
+
+    def schedule():
+        while not link_q.empty():
+            tasks.add(asyncio.ensure_future(visit(link_q.get())))
+
+    async def visit(url):
+        if not scrape_manifest.needs_fetch(sub, seasons.season_of(url)):
+            link_q.mark_crawled(url)
+            return
+
+        request = await fetch(url)
+        if request is None:
+            link_q.mark_failed(url)
+            return
+
+        page_url = get_request_url(request)
+        if link_q.is_crawled(page_url):
+            link_q.mark_crawled(url, page_url)
+            return
+
+        html = read_request(request)
+        content_hash = table_extract.fingerprint(html, spec.table_id)
+        if scrape_manifest.is_unchanged(sub, page_url, content_hash):
+            print('Unchanged', page_url)
+            links = await loop.run_in_executor(None, unchanged_links, html,
+                                               page_url, sub)
+            for link in links:
+                link_q.put(link)
+            schedule()
+            link_q.mark_crawled(url, page_url)
+            return
+
+        page = await loop.run_in_executor(parse_pool, parse_page, html,
+                                          spec.table_id)
+        queue_links(page, page_url, link_q, sub)
+        schedule()
+
+        await loop.run_in_executor(parse_executor, write_new, page,
+                                   page_url, content_hash)
+        link_q.mark_crawled(url, page_url)
+
+    schedule()
+    while tasks:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        tasks.difference_update(done)
+        for task in done:
+            task.result()
+
+    link_q.finish()
+    return link_q.crawled
+
+async def async_go(subs, max_concurrency=8, per_host=4, checkpoint_dir=None,
+                   incremental=False):
+    '''
+    Runs the given subcrawls of https://fbref.com at the same time
 
     Inputs:
+        subs (list): the subcrawls to run (keys of SUBCRAWLS)
+        max_concurrency (int): the most requests that can be open at once
+        per_host (int): the most requests that can be open at once to a
+            single host
+        checkpoint_dir (str): a directory to checkpoint each subcrawl's
+            progress in
+        incremental (bool): only fetch seasons that can still change
+
+    Returns:
         None
+    '''
+    global SESSION
+    SESSION = make_session(pool_size=max(per_host, 10))
+
+    loop = asyncio.get_running_loop()
+    global_limit = asyncio.Semaphore(max_concurrency)
+    host_limits = {}
+    scrape_manifest = manifest.ScrapeManifest(incremental=incremental)
+    fetch_executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    parse_executor = ThreadPoolExecutor(max_workers=1)
+    # parsing is CPU bound, so it runs on processes to use every core
+    parse_pool = ProcessPoolExecutor()
+
+    async def fetch(url):
+        host = urllib.parse.urlparse(url).netloc
+        if host not in host_limits:
+            host_limits[host] = asyncio.Semaphore(per_host)
+        async with global_limit, host_limits[host]:
+            return await loop.run_in_executor(fetch_executor, get_request, url)
+
+    try:
+        await asyncio.gather(*[async_crawl(sub, fetch, parse_executor,
+                                           checkpoint_path(checkpoint_dir, sub),
+                                           scrape_manifest, parse_pool)
+                               for sub in subs])
+    finally:
+        scrape_manifest.close()
+        fetch_executor.shutdown()
+        parse_pool.shutdown()
+        parse_executor.shutdown()
+
+def go(concurrent=False, max_concurrency=8, per_host=4, checkpoint_dir=None,
+       incremental=False, pipelined=False, fetch_workers=8, parse_workers=None,
+       jobs=1, resamples=0):
+    '''
+    Crawl https://fbref.com and update the players.db
+
+    Inputs:
+        concurrent (bool): run every subcrawl and season page at once
+            instead of one after another
+        max_concurrency (int): the most requests open at once in
+            concurrent mode
+        per_host (int): the most requests open at once to one host in
+            concurrent mode
+        checkpoint_dir (str): a directory to checkpoint crawl progress in so
+            that an interrupted crawl can be resumed
+        incremental (bool): only fetch seasons that can still change or were
+            never scraped, skip pages whose stats table is unchanged, and
+            only join the seasons that changed
+        pipelined (bool): run the crawl as a pipeline of fetch threads, parse
+            processes and a single writer
+        fetch_workers (int): the number of fetch threads when pipelined
+        parse_workers (int): the number of parse processes when pipelined,
+            defaults to the number of cores
+        jobs (int): the number of processes to join seasons on
+        resamples (int): the number of bootstrap resamples for the WAR
+            intervals, or 0 to skip them
 
     Returns:
         None
     '''
-    go_helper('main')
-    go_helper('keep_adv')
-    go_helper('keep_basic')
-    go_helper('shooting')
-    go_helper('passing')
-    join_years()
+    if pipelined:
+        crawl_pipeline = pipeline.Pipeline(fetch_workers, parse_workers,
+                                           checkpoint_dir=checkpoint_dir,
+                                           incremental=incremental)
+        crawl_pipeline.run(list(SUBCRAWLS))
+    elif concurrent:
+        asyncio.run(async_go(list(SUBCRAWLS), max_concurrency, per_host,
+                             checkpoint_dir, incremental))
+    else:
+        for sub in SUBCRAWLS:
+            go_helper(sub, checkpoint_dir, incremental)
+    join_years(jobs=jobs, stale_only=incremental, resamples=resamples)
+
+def main():
+    '''
+    Runs the scraper from the command line
+    '''
+    parser = argparse.ArgumentParser(description='Crawl fbref.com and '
+                                     'rebuild players.db')
+    parser.add_argument('--async', dest='concurrent', action='store_true',
+                        help='run all subcrawls and season pages at once')
+    parser.add_argument('--max-concurrency', type=int, default=8,
+                        help='most requests open at once with --async')
+    parser.add_argument('--per-host', type=int, default=4,
+                        help='most requests open at once to one host '
+                        'with --async')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='read and store pages in an on-disk cache')
+    parser.add_argument('--replay', action='store_true',
+                        help='only use pages already in the cache, '
+                        'never the network')
+    parser.add_argument('--checkpoint', metavar='DIR',
+                        help='save crawl progress in DIR and resume an '
+                        'interrupted crawl from it')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch seasons that can still change')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='fetch, parse and write pages in parallel stages')
+    parser.add_argument('--fetch-workers', type=int, default=8,
+                        help='fetch threads with --pipeline')
+    parser.add_argument('--parse-workers', type=int,
+                        help='parse processes with --pipeline, defaults to '
+                        'the number of cores')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='processes to join seasons and compute WAR on')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='skip the crawl and only rebuild the joined '
+                        'tables that are stale')
+    parser.add_argument('--bootstrap', dest='resamples', type=int, default=0,
+                        metavar='N', help='add WAR confidence intervals from '
+                        'N bootstrap resamples')
+    args = parser.parse_args()
+    if args.rebuild:
+        join_years(jobs=args.jobs, stale_only=True, resamples=args.resamples)
+        return
+    if args.cache or args.replay:
+        use_page_cache(args.cache or 'page_cache',
+                       'replay' if args.replay else 'online')
+    go(args.concurrent, args.max_concurrency, args.per_host, args.checkpoint,
+       args.incremental, args.pipeline, args.fetch_workers, args.parse_workers,
+       args.jobs, args.resamples)
 
 if __name__== "__main__":
-  go()
+    # run through the imported module so that the modules scraper imports
+    # see the same globals (the session and page cache) as the command line
+    import scraper
+    scraper.main()
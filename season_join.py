@@ -0,0 +1,251 @@
+'''
+The join stage of the build. A season's stats tables are read from the
+database once and joined on Player once, and the tables for each position
+group are cut from the joined season in memory, instead of each position
+table being read and joined to the shooting and passing tables on its own.
+
+Seasons are independent of each other, so join_seasons can build them on a
+pool of processes. WAR is added afterwards by war_calc.add_war_batch, for
+every season at once.
+'''
+import time
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import scraper
+import war_calc as war
+import db_writer
+import baselines
+import table_schemas as schemas
+
+# the stats tables a season can have, by the suffix of their name. The
+# standard stats table is named for the season alone.
+SEASON_TABLES = ['', '-SHOOT', '-PASS', '-GK', '-GK-ADV']
+
+# the positions a season has a joined table for
+POSITIONS = list(schemas.POSITION_SPLITS) + ['-GK']
+
+# bump when a change to how seasons are joined or scored changes the joined
+# tables without changing any of the parameters params_hash reads
+JOIN_VERSION = 1
+
+def table_names(connection):
+    '''
+    The names of every table in a database
+    '''
+    return set([row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table';")])
+
+def joined_tables(season):
+    '''
+    The names of the -JOIN tables built for a season
+    '''
+    return [season+pos+'-JOIN' for pos in POSITIONS]
+
+def table_hash(connection, name):
+    '''
+    Hashes the contents of a table: its columns and every row, in order
+    '''
+    digest = hashlib.sha256()
+    cursor = connection.execute('SELECT * FROM ' + db_writer.quote(name) + ';')
+    digest.update(repr([col[0] for col in cursor.description]).encode('utf8'))
+    for row in cursor:
+        digest.update(repr(row).encode('utf8'))
+    return digest.hexdigest()
+
+def source_hashes(connection, season):
+    '''
+    The content hash of every stats table a season's joined tables are
+    built from. That is the hash the scrape manifest recorded for the page
+    the table was scraped from, so no table is read. Only a table with no
+    manifest entry, written before the scraper kept one, is hashed from its
+    rows.
+
+    Returns:
+        A dict of table name to content hash
+    '''
+    names = table_names(connection)
+    recorded = {}
+    if 'scrape_manifest' in names:
+        rows = connection.execute('''SELECT sub, content_hash
+                                     FROM scrape_manifest
+                                     WHERE season = ?;''', (season,))
+        for sub, content_hash in rows:
+            if sub in scraper.SUBCRAWLS:
+                suffix = scraper.SUBCRAWLS[sub][1].suffix
+                recorded[season + suffix] = content_hash
+
+    hashes = {}
+    for suffix in SEASON_TABLES:
+        name = season + suffix
+        if name in names:
+            hashes[name] = recorded.get(name) or table_hash(connection, name)
+    return hashes
+
+def params_hash(coef):
+    '''
+    Hashes everything the joined tables depend on besides their source
+    tables: the regression coefficient, the WAR features, positions, weights
+    and centering, the replacement level and JOIN_VERSION. Changing any of
+    them makes every season stale. The WAR intervals are kept out of it,
+    see manifest.JoinManifest.
+    '''
+    params = [float(coef), list(war.FEATURES),
+              list(war.POSITIONS), war.WEIGHTS.tolist(), war.CENTERED.tolist(),
+              float(baselines.REPLACEMENT_LEVEL), JOIN_VERSION]
+    return hashlib.sha256(repr(params).encode('utf8')).hexdigest()
+
+def load_season(connection, season):
+    '''
+    Reads every stats table of a season
+
+    Inputs:
+        connection (Connection): the players database
+        season (str): the season, like '2019-2020'
+
+    Returns:
+        tables (dict): suffix to DataFrame for every table of the season in
+            the database, see SEASON_TABLES
+    '''
+    names = table_names(connection)
+    tables = {}
+    for suffix in SEASON_TABLES:
+        if season + suffix in names:
+            query = 'SELECT * FROM ' + db_writer.quote(season + suffix) + ';'
+            tables[suffix] = pd.read_sql_query(query, connection)
+    return tables
+
+def join_on_player(main, others):
+    '''
+    Left joins tables onto a main table by player_id, or by Player for
+    tables written before the scraper kept player ids. As with SELECT * over
+    the joins and then dropping repeated columns, a column keeps the values
+    of the first table that has it.
+
+    Inputs:
+        main (DataFrame): the table every row of the result comes from
+        others (list): the tables to join on, in order
+
+    Returns:
+        The joined DataFrame
+    '''
+    key = 'Player'
+    if all(['player_id' in df.columns for df in [main] + others]):
+        key = 'player_id'
+
+    joined = main
+    for other in others:
+        columns = [key] + [col for col in other.columns
+                           if col not in joined.columns]
+        joined = joined.merge(other[columns], on=key, how='left')
+    return joined
+
+def join_outfield(tables):
+    '''
+    Builds the joined table of every outfield position group of a season
+
+    Inputs:
+        tables (dict): the season's tables from load_season
+
+    Returns:
+        joined (dict): position, like '-FW', to its joined table
+        baseline_dfs (dict): position to its baselines
+    '''
+    others = [tables[suffix] for suffix in ['-PASS', '-SHOOT']
+              if suffix in tables]
+    season_df = join_on_player(tables[''], others)
+    season_df = season_df.apply(pd.to_numeric, errors='ignore')
+
+    joined = {}
+    baseline_dfs = {}
+    for pos, pairs in schemas.POSITION_SPLITS.items():
+        df = scraper.split_positions(season_df, pairs)
+        df = df.reset_index(drop=True).fillna(0)
+        baseline_dfs[pos] = baselines.compute(df)
+        joined[pos] = df
+    return (joined, baseline_dfs)
+
+def join_keepers(tables):
+    '''
+    Builds the joined goalkeeping table of a season
+
+    Inputs:
+        tables (dict): the season's tables from load_season
+
+    Returns:
+        (df, baseline_df), the joined goalkeeping table and its baselines
+    '''
+    others = [tables[suffix] for suffix in ['-GK-ADV', '-PASS']
+              if suffix in tables]
+    df = join_on_player(tables['-GK'], others)
+    df = df.apply(pd.to_numeric, errors='ignore')
+
+    df['Raw_Save%'] = (df['SoTA']-df['GA'])/df['SoTA']
+    df = df.fillna(0)
+    return (df, baselines.compute(df))
+
+def join_season(connection, season):
+    '''
+    Builds every joined table of a season
+
+    Inputs:
+        connection (Connection): the players database
+        season (str): the season, like '2019-2020'
+
+    Returns:
+        joined (dict): position, like '-FW' or '-GK', to its joined table
+        baseline_dfs (dict): position to the baselines of its table
+    '''
+    tables = load_season(connection, season)
+    joined, baseline_dfs = join_outfield(tables)
+    joined['-GK'], baseline_dfs['-GK'] = join_keepers(tables)
+    return (joined, baseline_dfs)
+
+def join_season_timed(db, season):
+    '''
+    Builds every joined table of a season through a connection of its own,
+    so it can run in a worker process
+
+    Inputs:
+        db (str): the players database
+        season (str): the season, like '2019-2020'
+
+    Returns:
+        (season, joined, baseline_dfs, seconds), the season's joined tables
+        and baselines from join_season and how long they took to build
+    '''
+    start = time.perf_counter()
+    connection = sqlite3.connect(db)
+    try:
+        joined, baseline_dfs = join_season(connection, season)
+    finally:
+        connection.close()
+    return (season, joined, baseline_dfs, time.perf_counter() - start)
+
+def join_seasons(db, season_names, jobs=1):
+    '''
+    Builds the joined tables of many seasons, on a pool of jobs processes
+    when jobs is more than one
+
+    Inputs:
+        db (str): the players database
+        season_names (list): the seasons to build
+        jobs (int): the number of processes to build seasons on
+
+    Returns:
+        A generator of (season, joined, baseline_dfs, seconds) from
+        join_season_timed, in the order the seasons finish
+    '''
+    if jobs <= 1:
+        for season in season_names:
+            yield join_season_timed(db, season)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(join_season_timed, db, season)
+                   for season in season_names]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,59 @@
+import re
+import datetime
+
+FIRST_SEASON = 1992
+
+# the last season the project has data for
+LAST_SEASON = 2019
+
+# a season is finished once the summer after it begins
+SEASON_END_MONTH = 7
+
+def get_seasons(first=FIRST_SEASON, last=LAST_SEASON):
+    '''
+    Builds the list of season names the project covers
+
+    Inputs:
+        first (int): the year the first season starts
+        last (int): the year the last season starts
+
+    Returns:
+        seasons (list): season names like '1992-1993', oldest first
+    '''
+    seasons = []
+    for year in range(first, last + 1):
+        seasons.append(str(year) + '-' + str(year + 1))
+    return seasons
+
+def season_of(url):
+    '''
+    Finds the season an url is for
+
+    Inputs:
+        url (str): an url that may contain a season like '2018-2019'
+
+    Returns:
+        The season name, or None if the url does not name a season
+    '''
+    match = re.search(r'(\d{4})-(\d{4})', url)
+    if match == None:
+        return None
+    if int(match.group(2)) != int(match.group(1)) + 1:
+        return None
+    return match.group(0)
+
+def season_is_open(season, today=None):
+    '''
+    Checks whether a season's stats can still change
+
+    Inputs:
+        season (str): a season name like '2018-2019'
+        today (date): the date to check against, defaults to today
+
+    Returns:
+        True if the season has not finished yet, False otherwise
+    '''
+    if today == None:
+        today = datetime.date.today()
+    end_year = int(season[5:9])
+    return today < datetime.date(end_year, SEASON_END_MONTH, 1)
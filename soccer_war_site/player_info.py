@@ -8,13 +8,8 @@ import os
 DATA_DIR = os.path.dirname(__file__)
 DATABASE_FILENAME = os.path.join(DATA_DIR, 'player_data.db')
 
-# list of numerical fields
-year = 1992
-tables = []
-while year <= 2019:
-    s = str(year) + '-' + str(year + 1)
-    tables.append(s)
-    year += 1
+# every player's season is a row of this table, see player_season.py
+TABLE = 'player_season'
 
 def create_connection():
     # create the connection object
@@ -24,99 +19,42 @@ def create_connection():
     return db_cursor
 
 def find_players(args_from_ui):
-    return build_query(args_from_ui)
-
-def build_query(args_from_ui):
     '''
-    build an actual query statement based on user input to be used in the 
-    execute statement
+    Finds the players that match the user's search
 
     Input:
         args_from_ui: a dictionary of arguments and their corresponding values
     Output:
-        string, a query statement to be passed to an execute statement to query the 
-        database
+        (headers, players), the column names and the rows that matched
     '''
-    season = get_table(args_from_ui)
-    # create two cases, one for all all seasons and one for single seasons
-    query = ''
-    args = []
-    if args_from_ui['season'] != 'All':
-        select_str = get_fields(args_from_ui)
-        select_str += ('FROM ' + season + ' ')
-        where_clause, args = get_where_clause(args_from_ui)
-        query = select_str + where_clause
-    else:
-        select_str = get_fields(args_from_ui)
-        where_str, args = get_where_clause(args_from_ui)
-        print('args:', args_from_ui)
-        print('where:', where_str)
-        # remove semi-colon from where clause
-        where_str = where_str[:len(where_str)-1]
-        count = 1
-        for szn in season:
-            szn_str = szn[:10] + '"'
-            select_str += ', ' + szn_str + ' as Season '
-            from_str = ('FROM ' + szn + ' ')
-            if count < len(tables):
-                query += (select_str + from_str + where_str + ' UNION ')
-                count += 1
-            else:
-                if args_from_ui['order_by'] == 'None':
-                    query += (select_str + from_str + where_str + ';')
-                else:
-                    query += (select_str + from_str + where_str)
-                    query += order_by(args_from_ui) + ';'
-            select_str = get_fields(args_from_ui)
-        args = args * len(tables)
-
+    query, args = build_query(args_from_ui)
     cursor = create_connection()
-
-    # return all palyers if no args explicitly selected
-    if (args_from_ui['order_by'] == "None" and args_from_ui['season'] == 'All' 
-        and 'Squad' not in args_from_ui):
-        args = []
-        count = 1
-        select_str = get_fields(args_from_ui)
-        query = ''
-        for szn in season:
-            szn_str = szn[:10] +'"'
-            select_str += ', ' + szn_str + ' as Season '
-            from_str = ('FROM ' + szn + ' ')
-            if count < len(tables):
-                query += select_str + from_str + ' UNION '
-                count += 1
-            else:
-                query += select_str + from_str + 'ORDER BY season DESC' + ';'
-            select_str = get_fields(args_from_ui)
-        args = args * len(tables)
-        # return (['Please select values to '], []) 
-
     r = cursor.execute(query, args)
     players = r.fetchall()
     headers = clean_header(get_header(r))
 
     return (headers, players)
 
-def get_table(args_from_ui):
+def build_query(args_from_ui):
     '''
-    given the args from ui, return the correct table (season) that should be quried
+    build an actual query statement based on user input to be used in the 
+    execute statement
 
-    Inputs:
-        args_from_ui: a dictionary of arguments and their corresponding values 
-    Outputs:
-        returns a string to be used as the table in the query
+    Input:
+        args_from_ui: a dictionary of arguments and their corresponding values
+    Output:
+        (query, args), a query statement and the values for its parameters,
+        to be passed to an execute statement to query the database
     '''
-    season = args_from_ui['season']
-    pos = args_from_ui['Pos']
-    if season != 'All':
-        return '"' + season + '-' + pos + '-' + 'JOIN' + '"' 
-    else:
-        seasons = []
-        for szn in tables:
-            full_table = '"' + szn + '-' + pos + '-' + 'JOIN' + '"' 
-            seasons.append(full_table)
-        return seasons
+    select_str = get_fields(args_from_ui)
+    # a search over all seasons says which season each row is from
+    if args_from_ui['season'] == 'All':
+        select_str += ', season AS Season '
+    where_str, args = get_where_clause(args_from_ui)
+    query = (select_str + 'FROM ' + TABLE + ' ' + where_str + ' ' +
+             order_by(args_from_ui) + ';')
+
+    return (query, args)
 
 def get_fields(args_from_ui):
     '''
@@ -155,13 +93,11 @@ def get_fields(args_from_ui):
                         select_str += (arg + ', ')
                         added_fields.append(arg)
                     else:
-                        if val != 'GK':
-                            if val not in hyrbid_pos:
-                                select_str += ('Pos_1 as Pos' + ', ')
-                            else:
-                                select_str += 'Pos_1, Pos_2, '
+                        # goalkeepers' Pos is stored as Pos_1 too
+                        if val not in hyrbid_pos:
+                            select_str += ('Pos_1 as Pos' + ', ')
                         else:
-                            select_str += ' Pos, '
+                            select_str += 'Pos_1, Pos_2, '
                         added_fields.append('Pos')
 
     # cut off hanging comma
@@ -176,103 +112,39 @@ def get_where_clause(args_from_ui):
 
     Inputs:
         args_from_ui: a dictionary of arguments and their corresponding values
-        added_fields: a list of fields that need to be queried  
     Outputs:
         returns a string of corresponding where conditions based on user input
+        and a list of the values for its parameters
     '''
-    args = []
-    first = True
-    where_str = ''
-    goals_flag = True
-    for key, val in args_from_ui.items():
-        if first:
-            if key == 'Player':
-                where_str += 'WHERE Player = ? '
-                args.append(val)
-                first = False
-            elif key == 'age_upper':
-                lb = args_from_ui['age_lower']
-                where_str += 'WHERE Age <= ? '
-                args.append(val)
-                where_str += ' AND Age >= ?'
-                args.append(lb)
-                first = False
-            if args_from_ui['Pos'] != 'GK':
-                if key == 'gls_upper' or key == 'gls_lower':
-                    lb = args_from_ui['gls_lower']
-                    ub = args_from_ui['gls_upper']
-                    where_str += 'WHERE Gls <= ? '
-                    args.append(ub)
-                    where_str += ' AND Gls >= ? '
-                    args.append(lb)
-                    first = False
-                    goals_flag = False
-                elif key == 'Ast':
-                    lb = val[0]
-                    ub = val[1]
-                    where_str += 'WHERE Ast <= ? AND Ast >= ? '
-                    args.append(ub)
-                    args.append(lb)
-                    first = False
-            if key == 'Nation':
-                if val != 'All':
-                    where_str += 'WHERE Nation = ? '
-                    args.append(val)
-                    first = False
-            if key == 'Squad':
-                count = 1
-                where_str += 'WHERE ('
-                for squad in val:
-                    where_str += 'Squad = ?'
-                    args.append(squad)
-                    if count < len(val):
-                        where_str += (' OR ')
-                        count += 1
-                where_str += ')'
-                first = False
-        else:
-            if key == 'Player':
-                where_str += ' AND Player = ? '
-                args.append(val)
-            elif key == 'age_upper':
-                lb = args_from_ui['age_lower']
-                where_str += ' AND Age <= ? '
-                args.append(val)
-                where_str += ' AND Age >= ?'
-                args.append(lb)
-            if args_from_ui['Pos'] != 'GK':
-                if key == 'gls_upper':
-                    if goals_flag:
-                        ub = args_from_ui['gls_upper']
-                        lb = args_from_ui['gls_lower']
-                        where_str += ' AND Gls <= ? '
-                        args.append(ub)
-                        where_str += ' AND Gls >= ? '
-                        args.append(lb)
-                elif key == 'Ast':
-                    lb = val[0]
-                    ub = val[1]
-                    where_str += ' AND Ast <= ? AND Ast >= ? '
-                    args.append(ub)
-                    args.append(lb)
-            if key == 'Nation':
-                if val != 'All':
-                    where_str += ' AND Nation = ? '
-                    args.append(val)
-            if key == 'Squad':
-                count = 1
-                where_str += ' AND ('
-                for squad in val:
-                    where_str += ' Squad = ?'
-                    args.append(squad)
-                    if count < len(val):
-                        where_str += (' OR')
-                        count += 1
-                where_str += ')'
-
+    pos = args_from_ui['Pos']
+    conditions = ['position_group = ?']
+    args = [pos]
     if args_from_ui['season'] != 'All':
-        where_str += order_by(args_from_ui)
-    where_str += ';'
+        conditions.append('season = ?')
+        args.append(args_from_ui['season'])
+    if 'Player' in args_from_ui:
+        conditions.append('Player = ?')
+        args.append(args_from_ui['Player'])
+    if 'age_upper' in args_from_ui:
+        conditions.append('Age <= ? AND Age >= ?')
+        args += [args_from_ui['age_upper'], args_from_ui['age_lower']]
+    if pos != 'GK':
+        if 'gls_upper' in args_from_ui:
+            conditions.append('Gls <= ? AND Gls >= ?')
+            args += [args_from_ui['gls_upper'], args_from_ui['gls_lower']]
+        if 'Ast' in args_from_ui:
+            lb, ub = args_from_ui['Ast']
+            conditions.append('Ast <= ? AND Ast >= ?')
+            args += [ub, lb]
+    if args_from_ui.get('Nation', 'All') != 'All':
+        conditions.append('Nation = ?')
+        args.append(args_from_ui['Nation'])
+    if 'Squad' in args_from_ui:
+        squads = args_from_ui['Squad']
+        conditions.append('Squad IN (' + ', '.join(['?'] * len(squads)) + ')')
+        args += list(squads)
+
+    where_str = 'WHERE ' + ' AND '.join(conditions)
     return (where_str, args)
 
 def order_by(args_from_ui):
@@ -296,12 +168,15 @@ def order_by(args_from_ui):
             elif args_from_ui['order_by'] == 'Nationality':
                 order_by += ' ORDER BY Nation'
             elif args_from_ui['order_by'] == 'Season':
-                if type(args_from_ui['season']) == list:
-                    order_by += 'ORDER BY Season DESC'
+                if args_from_ui['season'] == 'All':
+                    order_by += ' ORDER BY season DESC'
             elif args_from_ui['order_by'] != 'Season':
                 order_by += (' ORDER BY ' + args_from_ui['order_by'] + ' DESC')
         elif args_from_ui['order_by'] == 'WAR':
-                order_by += 'ORDER BY WAR DESC'
+                order_by += ' ORDER BY WAR DESC'
+    elif args_from_ui['season'] == 'All':
+        # list every season's players newest first
+        order_by += ' ORDER BY season DESC'
     return order_by
 
 ########### auxiliary functions #################
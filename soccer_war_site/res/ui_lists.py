@@ -12,24 +12,11 @@ def generate_lists():
     connection = sqlite3.connect('../player_data.db')
     c = connection.cursor()
 
-    # get all table names
-    year = 1992
-    tables = []
-    while year <= 2019:
-        s = str(year) + '-' + str(year + 1)
-        tables.append(s)
-        year += 1
-
-    squad = []
-    pos = []
-    age = []
-    nation = []
-    for table in tables:
-        # get lists of unique values from sql database
-        squad.append(c.execute('''SELECT DISTINCT Squad FROM ''' + '"' + table + '"').fetchall())
-        pos.append(c.execute('''SELECT DISTINCT Pos_1 FROM ''' + '"' + table + '"').fetchall())
-        age.append(c.execute('''SELECT DISTINCT Age FROM ''' + '"' + table + '"').fetchall())
-        nation.append(c.execute('''SELECT DISTINCT Nation FROM ''' + '"' + table + '"').fetchall())
+    # get lists of unique values from sql database
+    squad = [c.execute('''SELECT DISTINCT Squad FROM player_season''').fetchall()]
+    pos = [c.execute('''SELECT DISTINCT Pos_1 FROM player_season''').fetchall()]
+    age = [c.execute('''SELECT DISTINCT Age FROM player_season''').fetchall()]
+    nation = [c.execute('''SELECT DISTINCT Nation FROM player_season''').fetchall()]
 
     connection.close()
 
@@ -55,7 +42,7 @@ def generate_lists():
         i = len(row)
         for index in range(i):
             years_old = row[index][0]
-            if years_old != '':
+            if years_old != '' and years_old != None:
                 years_old = int(years_old)
                 if years_old not in ages:
                     ages.append(years_old)
@@ -0,0 +1,260 @@
+import re
+import time
+import hashlib
+from html.parser import HTMLParser
+
+import pandas as pd
+
+# the link to a player's page, which starts with fbref's id for the player
+PLAYER_HREF = re.compile(r'^/en/players/([^/]+)/')
+
+class TablePage:
+    '''
+    Everything the scraper needs from one fbref page, pulled out in a single
+    pass over its html
+
+    Attributes:
+        links (list): the href of every link on the page, outside comments
+        season (str): the text of the page's li.full tag (the season name)
+        columns (list): the column names of the stats table, one for every
+            td cell in a row
+        buffers (list): one list of cell text per column
+        player_ids (list): fbref's id for the player of each row, or None
+            for a row without one
+        n_rows (int): the number of rows in the stats table
+        seconds (float): how long the page took to parse
+    '''
+    def __init__(self):
+        self.links = []
+        self.season = None
+        self.columns = []
+        self.buffers = []
+        self.player_ids = []
+        self.n_rows = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_sec(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.n_rows / self.seconds
+
+    def to_frame(self, columns=None):
+        '''
+        Builds a DataFrame out of the stats table
+
+        Inputs:
+            columns (list): names to use for the columns instead of the
+                names in the table header
+
+        Returns:
+            A DataFrame with one row per player
+        '''
+        if columns == None:
+            columns = self.columns
+        frame = pd.DataFrame(dict(enumerate(self.buffers)),
+                             columns=range(len(columns)))
+        frame.columns = columns
+        return frame
+
+class TableExtractor(HTMLParser):
+    '''
+    Streams a page's html and collects its links, its season and the rows of
+    the table with the given id. fbref hides most of its tables in html
+    comments, so comments that contain the table are parsed as well.
+    '''
+    def __init__(self, table_id, page=None, in_comment=False):
+        super().__init__(convert_charrefs=True)
+        self.table_id = table_id
+        self.marker = 'id="' + table_id + '"'
+        self.page = page if page != None else TablePage()
+        self.in_comment = in_comment
+
+        self.found = False
+        self.table_depth = 0
+        self.section = None
+        self.header = []
+        self.row = None
+        self.row_th = 0
+        self.row_player_id = None
+        self.row_header_cells = None
+        self.cell = None
+        self.cell_is_col_header = False
+        self.season_text = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a' and not self.in_comment:
+            for name, value in attrs:
+                if name == 'href' and value != None:
+                    self.page.links.append(value)
+                    break
+
+        if tag == 'li' and self.page.season == None and not self.in_comment:
+            classes = dict(attrs).get('class') or ''
+            if 'full' in classes.split():
+                self.season_text = []
+
+        if tag == 'table':
+            if self.table_depth > 0:
+                self.table_depth += 1
+            elif not self.found and dict(attrs).get('id') == self.table_id:
+                self.found = True
+                self.table_depth = 1
+            return
+
+        if self.table_depth != 1:
+            return
+
+        if tag in ('thead', 'tbody', 'tfoot'):
+            self.section = tag
+        elif tag == 'tr' and self.section == 'tbody':
+            self.row = []
+            self.row_th = 0
+            self.row_player_id = None
+        elif tag == 'th':
+            if self.section == 'thead' and dict(attrs).get('scope') == 'col':
+                self.cell = []
+                self.cell_is_col_header = True
+            elif self.row != None and len(self.row) == 0:
+                self.row_th += 1
+        elif tag == 'td' and self.row != None:
+            self.cell = []
+            self.cell_is_col_header = False
+
+        if self.row != None and self.row_player_id == None:
+            self.find_player_id(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        if tag == 'li' and self.season_text != None:
+            self.page.season = ''.join(self.season_text).strip()
+            self.season_text = None
+
+        if tag == 'table' and self.table_depth > 0:
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self.finish_table()
+            return
+
+        if self.table_depth != 1:
+            return
+
+        if tag in ('th', 'td') and self.cell != None:
+            text = ''.join(self.cell)
+            if self.cell_is_col_header:
+                self.header.append(text)
+            else:
+                self.row.append(text)
+            self.cell = None
+        elif tag == 'tr' and self.row != None:
+            self.add_row(self.row)
+            self.row = None
+        elif tag in ('thead', 'tbody', 'tfoot'):
+            self.section = None
+
+    def handle_data(self, data):
+        if self.cell != None:
+            self.cell.append(data)
+        if self.season_text != None:
+            self.season_text.append(data)
+
+    def handle_comment(self, data):
+        if self.found or self.marker not in data:
+            return
+        inner = TableExtractor(self.table_id, self.page, in_comment=True)
+        inner.feed(data)
+        inner.close()
+        self.found = inner.found
+
+    def find_player_id(self, tag, attrs):
+        '''
+        Picks fbref's id for the player of the current row out of the player
+        cell, like <td data-stat="player" data-append-csv="d70ce98e">, or
+        failing that out of the link to the player's page
+        '''
+        if tag in ('th', 'td') and attrs.get('data-stat') == 'player':
+            self.row_player_id = attrs.get('data-append-csv') or None
+        elif tag == 'a':
+            match = PLAYER_HREF.match(attrs.get('href') or '')
+            if match != None:
+                self.row_player_id = match.group(1)
+
+    def add_row(self, row):
+        '''
+        Appends a row's cells to the column buffers. Rows without data cells
+        are the repeated header rows fbref puts in long tables and are skipped.
+        '''
+        if len(row) == 0:
+            return
+
+        page = self.page
+        if self.row_header_cells == None:
+            self.row_header_cells = self.row_th
+            page.buffers = [[] for _ in range(len(row))]
+
+        # short rows are padded so that pandas drops them like it always has
+        if len(row) < len(page.buffers):
+            row = row + [None] * (len(page.buffers) - len(row))
+        for buffer, value in zip(page.buffers, row):
+            buffer.append(value)
+        page.player_ids.append(self.row_player_id)
+        page.n_rows += 1
+
+    def finish_table(self):
+        '''
+        Lines the header up with the data cells, dropping the header of the
+        rank column that is a th in every row
+        '''
+        skip = self.row_header_cells or 0
+        self.page.columns = self.header[skip:]
+        if len(self.page.buffers) < len(self.page.columns):
+            for _ in range(len(self.page.columns) - len(self.page.buffers)):
+                self.page.buffers.append([None] * self.page.n_rows)
+        self.page.buffers = self.page.buffers[:len(self.page.columns)]
+
+def extract(html, table_id):
+    '''
+    Parses a page's html in one pass
+
+    Inputs:
+        html (str or bytes): the page's html
+        table_id (str): the id of the stats table to pull out
+
+    Returns:
+        A TablePage
+    '''
+    start = time.perf_counter()
+    if isinstance(html, bytes):
+        html = html.decode('utf8', errors='replace')
+
+    parser = TableExtractor(table_id)
+    parser.feed(html)
+    parser.close()
+
+    page = parser.page
+    page.seconds = time.perf_counter() - start
+    return page
+
+def fingerprint(html, table_id):
+    '''
+    Hashes the markup of a page's stats table without parsing the page, so
+    that a table that has not changed can be skipped before any work is
+    done on it
+
+    Inputs:
+        html (str or bytes): the page's html
+        table_id (str): the id of the stats table
+
+    Returns:
+        The hex sha256 of the table's markup, or of the whole page if the
+        table cannot be found
+    '''
+    if isinstance(html, str):
+        html = html.encode('utf8')
+
+    start = html.find(('id="' + table_id + '"').encode('utf8'))
+    if start == -1:
+        return hashlib.sha256(html).hexdigest()
+    end = html.find(b'</table>', start)
+    if end == -1:
+        end = len(html)
+    return hashlib.sha256(html[start:end]).hexdigest()
@@ -0,0 +1,147 @@
+'''
+Declarations of every fbref stats table the scraper reads: how each table
+is parsed and stored, and which of the links on its pages the crawl follows.
+Adding a new table to the scrape takes a new TableSpec here and a subcrawl
+in scraper.SUBCRAWLS.
+'''
+
+# columns that hold text, every other column of a stats table is numeric
+TEXT_COLUMNS = ['Player', 'Nation', 'Pos', 'Pos_1', 'Pos_2', 'Squad',
+                'fbref_id']
+
+# numeric columns that only ever hold whole numbers, the rest are real
+INTEGER_COLUMNS = ['Age', 'Born', 'MP', 'Starts', 'Min', 'Gls', 'Ast', 'G+A',
+                   'G-PK', 'G+A-PK', 'PK', 'PKatt', 'CrdY', 'CrdR', 'Sh',
+                   'SoT', 'FK', 'GA', 'SoTA', 'Saves', 'W', 'D', 'L', 'CS',
+                   'PKA', 'PKsv', 'PKm', 'CK', 'OG',
+                   'Launched_Cmp', 'Launched_Att', 'Pass_Att', 'GK_Att',
+                   'Cross_Att', 'Cross_Stp', 'Total_Cmp', 'Total_Att',
+                   'Short_Cmp', 'Short_Att', 'Med_Cmp', 'Med_Att',
+                   'Long_Cmp', 'Long_Att', 'KP', '1/3', 'PPA', 'CrsPA',
+                   'Prog', 'Opp', 'player_id']
+
+# the only seasons fbref has the advanced stats tables for
+ADVANCED_SEASONS = ['2017-2018', '2018-2019']
+
+# the tables derived from a season's standard stats, by the position pairs
+# (Pos_1, Pos_2) of the players that belong in them
+POSITION_SPLITS = {
+    '-DF': [('DF', None)],
+    '-FW': [('FW', None)],
+    '-MF': [('MF', None)],
+    '-WB': [('DF', 'MF'), ('MF', 'DF')],
+    '-WING': [('FW', 'MF'), ('MF', 'FW')],
+}
+
+class TableSpec:
+    '''
+    How to turn one fbref stats table into database tables
+
+    Attributes:
+        table_id (str): the html id of the player stats table on the page
+        suffix (str): added to the season to name the table, like '-SHOOT'
+        renames (dict): column index to new name, for the columns fbref
+            gives the same name twice. Indexes past the end of a season's
+            table are ignored, since older seasons have fewer columns.
+        split_pos (bool): split the 'Pos' column into 'Pos_1' and 'Pos_2'
+        position_splits (dict): extra tables to derive from the table, see
+            POSITION_SPLITS
+        integer_columns (list): numeric columns stored as INTEGER
+        path (str): the part of the path of every page of the table, the
+            crawl only follows links that have it
+        seasons (list): the only seasons the table has pages for, or None
+            for every season
+    '''
+    def __init__(self, table_id, suffix='', renames=None, split_pos=False,
+                 position_splits=None, integer_columns=INTEGER_COLUMNS,
+                 path='/stats/', seasons=None):
+        self.table_id = table_id
+        self.suffix = suffix
+        self.path = path
+        self.seasons = seasons
+        self.renames = renames or {}
+        self.split_pos = split_pos
+        self.position_splits = position_splits or {}
+        self.integer_columns = integer_columns
+
+    def column_type(self, column):
+        '''
+        The type of a column of this table: 'text', 'integer' or 'real'
+        '''
+        if column in TEXT_COLUMNS:
+            return 'text'
+        if column in self.integer_columns:
+            return 'integer'
+        return 'real'
+
+# the SQLite type declared for each type of column
+SQL_TYPES = {'text': 'TEXT', 'integer': 'INTEGER', 'real': 'REAL'}
+
+def sql_types(columns, spec=None):
+    '''
+    The SQLite type to declare for each column of a table
+
+    Inputs:
+        columns (list): the table's column names
+        spec (TableSpec): the table's spec, or None for a table built from
+            several stats tables, like the -JOIN tables
+
+    Returns:
+        A dict of column name to 'TEXT', 'INTEGER' or 'REAL'
+    '''
+    if spec == None:
+        spec = TableSpec(None)
+    return {column: SQL_TYPES[spec.column_type(column)] for column in columns}
+
+STANDARD = TableSpec(
+    'stats_standard',
+    renames={15: 'Gls_per_game',
+             16: 'Ast_per_game',
+             23: 'xG_per_game',
+             24: 'xA_per_game',
+             25: 'xG+xA_per_game',
+             26: 'npxG_per_game',
+             27: 'npxG+xA_per_game'},
+    split_pos=True,
+    position_splits=POSITION_SPLITS)
+
+KEEPER_ADV = TableSpec(
+    'stats_keeper_adv',
+    suffix='-GK-ADV',
+    path='/keepersadv',
+    seasons=ADVANCED_SEASONS,
+    renames={16: 'Launched_Cmp',
+             17: 'Launched_Att',
+             18: 'Launched_Cmp%',
+             19: 'Pass_Att',
+             23: 'GK_Att',
+             24: 'GK_Launch%',
+             25: 'GK_AvgLen',
+             26: 'Cross_Att',
+             27: 'Cross_Stp',
+             28: 'Cross_Stp%',
+             31: 'Avg_Def_Dist'})
+
+KEEPER_BASIC = TableSpec('stats_keeper', suffix='-GK', path='/keepers/')
+
+SHOOTING = TableSpec('stats_shooting', suffix='-SHOOT', split_pos=True,
+                     path='/shooting/')
+
+PASSING = TableSpec(
+    'stats_passing',
+    suffix='-PASS',
+    path='/passing/',
+    seasons=ADVANCED_SEASONS,
+    renames={11: 'Total_Cmp',
+             12: 'Total_Att',
+             13: 'Total_Cmp%',
+             14: 'Short_Cmp',
+             15: 'Short_Att',
+             16: 'Short_Cmp%',
+             17: 'Med_Cmp',
+             18: 'Med_Att',
+             19: 'Med_Cmp%',
+             20: 'Long_Cmp',
+             21: 'Long_Att',
+             22: 'Long_Cmp%'},
+    split_pos=True)
@@ -0,0 +1,114 @@
+'''
+Checks that an incremental crawl skips every page whose stats table has not
+changed, including the current season, which is reached both from the
+landing page and from its own season url. Runs offline against generated
+pages:
+
+    python -m pytest test_incremental.py
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import scraper
+import pipeline
+import seasons
+import db_writer
+
+COLUMNS = ['Rk', 'Player', 'Nation', 'Pos', 'Squad', 'Age', 'Born', 'MP',
+           'Starts', 'Min', 'Gls', 'Ast', 'PK', 'PKatt', 'CrdY', 'CrdR']
+
+LANDING = scraper.SUBCRAWLS['main'][0]
+
+SEASON_URL = ('https://fbref.com/en/comps/9/{0}/stats/'
+              '{0}-Premier-League-Stats')
+
+def make_page(season):
+    '''
+    A standard stats page for a season that links to two seasons, one of
+    them the landing page's
+    '''
+    rows = []
+    for i in range(5):
+        cells = ['<td data-stat="player" data-append-csv="id{0}">'
+                 '<a href="/en/players/id{0}/P">Player {0}</a></td>'.format(i),
+                 '<td>ENG</td>', '<td>FW</td>', '<td>Arsenal</td>']
+        cells += ['<td>' + str(i + j) + '</td>'
+                  for j in range(len(COLUMNS) - 5)]
+        rows.append('<tr><th scope="row">' + str(i + 1) + '</th>' +
+                    ''.join(cells) + '</tr>')
+    head = ''.join(['<th scope="col">' + col + '</th>' for col in COLUMNS])
+    links = ''.join(['<a href="/en/comps/9/{0}/stats/{0}-Premier-League-'
+                     'Stats">s</a>'.format(other)
+                     for other in ['2018-2019', '2019-2020']])
+    return ('<html><body><ul><li class="full">' + season +
+            ' Premier League</li></ul>' + links + '<div><!--\n'
+            '<table id="stats_standard"><thead><tr>' + head +
+            '</tr></thead><tbody>' + ''.join(rows) +
+            '</tbody></table>\n--></div></body></html>')
+
+class Response:
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+        self.content = text.encode('utf8')
+        self.status_code = 200
+
+class Session:
+    '''
+    Serves the same page for a url on every request
+    '''
+    def get(self, url, headers=None, timeout=None):
+        return Response(url, make_page(seasons.season_of(url) or
+                                       '2019-2020'))
+
+class IncrementalCrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        self.saved = (scraper.SESSION, scraper.make_session,
+                      scraper.write_page, seasons.season_is_open)
+        scraper.SESSION = Session()
+        scraper.make_session = lambda **kwargs: Session()
+        # every season can still change, so every page is fetched each run
+        seasons.season_is_open = lambda season, today=None: True
+
+        self.writes = []
+        write_page = scraper.write_page
+        def counted(page, spec, sub, url, *args, **kwargs):
+            self.writes.append(url)
+            return write_page(page, spec, sub, url, *args, **kwargs)
+        scraper.write_page = counted
+
+    def tearDown(self):
+        (scraper.SESSION, scraper.make_session, scraper.write_page,
+         seasons.season_is_open) = self.saved
+        db_writer.close_writers()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_second_crawl_writes_nothing(self):
+        scraper.go_helper('main', incremental=True)
+        self.assertIn(LANDING, self.writes)
+        self.assertIn(SEASON_URL.format('2019-2020'), self.writes)
+
+        self.writes.clear()
+        scraper.go_helper('main', incremental=True)
+        self.assertEqual(self.writes, [])
+
+    def test_second_pipeline_writes_nothing(self):
+        crawl = pipeline.Pipeline(fetch_workers=2, parse_workers=1,
+                                  incremental=True, report_every=0.5)
+        crawl.run(['main'])
+        self.assertEqual(crawl.counts['written'], 3)
+
+        crawl = pipeline.Pipeline(fetch_workers=2, parse_workers=1,
+                                  incremental=True, report_every=0.5)
+        crawl.run(['main'])
+        self.assertEqual(crawl.counts['written'], 0)
+        self.assertEqual(crawl.counts['unchanged'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
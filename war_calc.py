@@ -1,128 +1,368 @@
+import json
+import hashlib
+
 import scraper as s
 import numpy as np
-import sklearn
+import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
-from sklearn import preprocessing
 
-def find_regr():
+# the file the fitted regression is saved in between builds
+REGR_CACHE = 'regr_cache.json'
+
+# seed for the train/test split so every build fits the same regression
+RANDOM_SEED = 0
+
+# the features a player's goal differential is built from. Min/90 is the
+# number of full matches played and const is 1 for every player.
+FEATURES = ['Gls', 'SoT', 'PK-PKatt', 'Ast', 'CrdY', 'Min/90', 'Raw_Save%',
+            'CS', 'const']
+
+# the positions WAR is computed for, in the order of the rows of WEIGHTS
+POSITIONS = ['-FW', '-WING', '-MF', '-DF', '-WB', '-GK']
+
+# the goals of differential each feature is worth, one row per position.
+# Features a position does not use are 0 and ignored, even where the
+# position's tables do not have them.
+WEIGHTS = np.array([
+    # Gls  SoT  PK-PKatt  Ast  CrdY  Min/90  Raw_Save%  CS   const
+    [1,    0.3, -0.75,    0.75, -1,  0.1,    0,         0,   -6],  # -FW
+    [1,    0.3, -0.75,    0.9,  -1,  0.1,    0,         0,   -4],  # -WING
+    [1,    0.3, -1,       0.75, -1,  0.1,    0,         0,   1],   # -MF
+    [1,    0.3, -1,       3,    -1,  0.1,    0,         0,   1],   # -DF
+    [1,    0.3, -0.75,    0.75, -1,  0.1,    0,         0,   1],   # -WB
+    [0,    0,   0,        0,    0,   0.1,    10,        0.9, -2],  # -GK
+])
+
+# the features measured against the replacement player of the table
+# instead of from zero, one row per position
+CENTERED = np.zeros(WEIGHTS.shape, dtype=bool)
+CENTERED[POSITIONS.index('-GK'),
+         [FEATURES.index('Raw_Save%'), FEATURES.index('CS')]] = True
+
+# the baseline rows stacked after each table, the last one is the
+# replacement player
+BASELINES = ['Average', 'Replacement']
+
+def regr_inputs():
+    '''
+    Gets the goal differential and wins per season of every Premier League
+    club from the data scraped from wikipedia
+
+    Inputs:
+        None
+    Returns:
+        X (array): goal differential per season, one row per club
+        y (array): wins per season, one row per club
+    '''
+    goals = s.get_wiki_table()
+    X = np.array(goals['GD_per_season'], dtype=float).reshape(-1,1)
+    y = np.array(goals['Wins_per_season'], dtype=float).reshape(-1,1)
+    return (X, y)
+
+def inputs_hash(X, y):
+    '''
+    Hashes the inputs of the regression so a saved fit can be reused
+    '''
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    digest.update(str(RANDOM_SEED).encode('utf8'))
+    return digest.hexdigest()
+
+def read_regr_cache(cache_path):
+    '''
+    Reads a saved regression, or returns None if there isn't one
+    '''
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def find_regr(cache_path=REGR_CACHE):
     '''
     Calculates the linear regression between goal differential and wins
     from the Premier League data scraped from wikipedia.
 
+    The fit is saved to cache_path along with the hash of its inputs and
+    the rows it was trained on, and is reused as long as the inputs have not
+    changed. If the inputs cannot be scraped the saved fit is used.
+
     Inputs:
-        None
+        cache_path (str): the file the regression is saved in
     Returns:
         coef (float): the coefficient from the linear regression equation
         intercept (float): the y intercept from the linear regression equation
         score (float): the R^2 of the linear regression
     '''
-    goals = s.get_wiki_table()
-    X = np.array(goals['GD_per_season']).reshape(-1,1)
-    y = np.array(goals['Wins_per_season']).reshape(-1,1)
+    cached = read_regr_cache(cache_path)
+    try:
+        X, y = regr_inputs()
+    except Exception:
+        if cached == None:
+            raise
+        return (cached['coef'], cached['intercept'], cached['score'])
+
+    digest = inputs_hash(X, y)
+    if (cached != None and cached['inputs_hash'] == digest and
+            'X_train' in cached):
+        return (cached['coef'], cached['intercept'], cached['score'])
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=RANDOM_SEED)
 
     regr = LinearRegression()
     regr.fit(X_train, y_train)
 
-    coef = regr.coef_[0][0]
-    intercept = regr.intercept_[0]
-    score = regr.score(X_train, y_train)
+    coef = float(regr.coef_[0][0])
+    intercept = float(regr.intercept_[0])
+    score = float(regr.score(X_train, y_train))
+
+    with open(cache_path, 'w') as f:
+        json.dump({'inputs_hash': digest, 'coef': coef,
+                   'intercept': intercept, 'score': score,
+                   'X_train': X_train.ravel().tolist(),
+                   'y_train': y_train.ravel().tolist()}, f)
 
     return (coef, intercept, score)
 
-def add_war(df, pos):
+def regr_training_data(cache_path=REGR_CACHE):
     '''
-    Takes a joined yearly position table scraped from scraper.join_years()
-    and adds the war column to the data before being finally written to the db
+    The goal differentials and wins the regression was trained on, from
+    the saved fit
 
     Inputs:
-        table (DataFrame): the joined DataFrame for a given position and year
-        pos (str): the position that the table is for
+        cache_path (str): the file the regression is saved in
 
     Returns:
-        table (DataFrame): the table that includes WAR for each player
+        (X_train, y_train) as flat arrays, or None if the saved fit does
+        not have them
     '''
-    avg_index = df.index[-2]
-    replace_index = df.index[-1]
-    coef = find_regr()[0]
-    min_max_scaler = preprocessing.MinMaxScaler()
-
-    if pos == '-FW':
-        df['Raw_GD'] = ((df['Gls']) +
-                       (df['SoT'])*0.3 -
-                       ((df['PK']-df['PKatt'])*0.75) +
-                       (df['Ast']*0.75) -
-                       (df['CrdY']*0.2+df['CrdY']*0.8) +
-                       ((df['Min']/90)*0.1)-6).values.astype(float)
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
-
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
-        df['WAR'] = df['Normed_WAR']*6
+    cached = read_regr_cache(cache_path)
+    if cached == None or 'X_train' not in cached:
+        return None
+    return (np.array(cached['X_train'], dtype=float),
+            np.array(cached['y_train'], dtype=float))
 
-    elif pos == '-WING':
-        df['Raw_GD'] = ((df['Gls']) +
-                       (df['SoT'])*0.3 -
-                       ((df['PK']-df['PKatt'])*0.75) +
-                       (df['Ast']*0.9) -
-                       (df['CrdY']*0.2+df['CrdY']*0.8) +
-                       ((df['Min']/90)*0.1)-4).values.astype(float)
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
-
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
-        df['WAR'] = df['Normed_WAR']*6
+def features(df):
+    '''
+    The feature matrix of a table of players, see FEATURES
 
-    elif pos == '-MF':
-        df['Raw_GD'] = ((df['Gls']) +
-                       (df['SoT'])*0.3 -
-                       (df['PK']-df['PKatt']) +
-                       (df['Ast'])*0.75 -
-                       (df['CrdY']*0.2+df['CrdY']*0.8) +
-                       ((df['Min']/90)*0.1)+1).values.astype(float)
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
-
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
-        df['WAR'] = df['Normed_WAR']*6
+    Inputs:
+        df (DataFrame): a joined table, or a table of baselines
 
-    elif pos == '-DF':
-        df['Raw_GD'] = ((df['Gls']) +
-                       (df['SoT'])*0.3 -
-                       (df['PK']-df['PKatt']) +
-                       (df['Ast']*3) -
-                       (df['CrdY']*0.2+df['CrdY']*0.8) +
-                       ((df['Min']/90)*0.1)+1).values.astype(float)
+    Returns:
+        An array with a row per row of df and a column per feature. Features
+        the table does not have are NaN.
+    '''
+    stats = []
+    for column in ['Gls', 'SoT', 'PK', 'PKatt', 'Ast', 'CrdY', 'Min',
+                   'Raw_Save%', 'CS']:
+        if column not in df.columns:
+            stats.append(np.full(len(df), np.nan))
+        elif pd.api.types.is_numeric_dtype(df[column]):
+            stats.append(df[column].to_numpy(dtype=float))
+        else:
+            values = pd.to_numeric(df[column], errors='coerce')
+            stats.append(values.to_numpy(dtype=float))
+    gls, sot, pk, pkatt, ast, crdy, mins, save, cs = stats
+    return np.column_stack([gls, sot, pk-pkatt, ast, crdy, mins/90, save, cs,
+                            np.ones(len(df))])
 
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
+def segments(lengths):
+    '''
+    Where each table starts in a stack of tables, see score
 
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
-        df['WAR'] = df['Normed_WAR']*6
+    Inputs:
+        lengths (array): the number of rows of each table, with its
+            baseline rows
 
-    elif pos == '-WB':
-        df['Raw_GD'] = ((df['Gls']) +
-                       (df['SoT'])*0.3 -
-                       ((df['PK']-df['PKatt'])*0.75) +
-                       (df['Ast']*0.75) -
-                       (df['CrdY']*0.2+df['CrdY']*0.8) +
-                       ((df['Min']/90)*0.1)+1).values.astype(float)
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
-
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
-        df['WAR'] = df['Normed_WAR']*6
+    Returns:
+        starts (array): the first row of each table
+        replacement_rows (array): the Replacement row of each table
+        groups (array): the table of every row
+    '''
+    lengths = np.asarray(lengths)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int)
+    groups = np.repeat(np.arange(len(lengths)), lengths)
+    return (starts, starts + lengths - 1, groups)
+
+def center(X, group_pos, lengths):
+    '''
+    Measures the CENTERED features of every table from the table's
+    replacement player. A keeper who faced no shots on target has an
+    infinite Raw_Save%, so this can be inf - inf, which is NaN.
+
+    Inputs:
+        X (array): the stacked feature matrices of every table, see score
+        group_pos (array): the index in POSITIONS of each table's position
+        lengths (array): the number of rows of each table
+
+    Returns:
+        The centered feature matrix
+    '''
+    starts, replacement_rows, groups = segments(lengths)
+    offsets = np.where(CENTERED[group_pos], X[replacement_rows], 0)
+    with np.errstate(invalid='ignore'):
+        return X - offsets[groups]
+
+def goal_differential(centered, row_pos, weights=WEIGHTS):
+    '''
+    The raw goal differential of every row of a centered feature matrix
+
+    Inputs:
+        centered (array): the feature matrix from center
+        row_pos (array): the index in POSITIONS of each row's position
+        weights (array): a weight matrix like WEIGHTS, or a stack of them to
+            compute the goal differential under many weight sets at once
+
+    Returns:
+        An array with a value per row, or with a row per row and a column per
+        weight set when weights is a stack
+    '''
+    weights = np.asarray(weights, dtype=float)
+    batch = weights.ndim == 3
+    if not batch:
+        weights = weights[np.newaxis]
+
+    raw_gd = np.empty((len(centered), len(weights)))
+    finite = np.isfinite(centered).all(axis=1)
+    for pos in np.unique(row_pos):
+        pos_weights = weights[:, pos]
+        rows = np.flatnonzero((row_pos == pos) & finite)
+        raw_gd[rows] = centered[rows] @ pos_weights.T
+
+        # a NaN or infinite feature only counts where it has a weight
+        rows = np.flatnonzero((row_pos == pos) & ~finite)
+        if len(rows) > 0:
+            weighted = pos_weights[np.newaxis] != 0
+            with np.errstate(invalid='ignore'):
+                terms = centered[rows][:, np.newaxis]*pos_weights[np.newaxis]
+            raw_gd[rows] = np.where(weighted, terms, 0).sum(axis=2)
+
+    if batch:
+        return raw_gd
+    return raw_gd[:, 0]
+
+def normalize(raw_gd, lengths, coef):
+    '''
+    Turns goal differentials into wins above each table's replacement
+    player, scaled to [0, 1] over the table's range. NaN are skipped and
+    tables where every player is equal are left at 0, like MinMaxScaler.
 
-    elif pos=='-GK':
-        df['Raw_GD'] = (((df['Raw_Save%']-df.at[replace_index, 'Raw_Save%'])*10)+
-                       ((df['CS']-df.at[replace_index, 'CS'])*0.9)+
-                       ((df['Min']/90)*0.1)-2)
-        df['Raw_WAR'] = coef*(df['Raw_GD']-df.at[replace_index, 'Raw_GD'])
-        raw_war = np.array(df['Raw_WAR']).reshape(-1,1)
+    Inputs:
+        raw_gd (array): the goal differentials from goal_differential
+        lengths (array): the number of rows of each table
+        coef (float): wins per goal of differential, from find_regr
+
+    Returns:
+        (raw_war, normed_war), arrays shaped like raw_gd
+    '''
+    starts, replacement_rows, groups = segments(lengths)
+    raw_war = coef*(raw_gd - raw_gd[replacement_rows][groups])
+
+    low = np.fmin.reduceat(raw_war, starts, axis=0)
+    high = np.fmax.reduceat(raw_war, starts, axis=0)
+    spread = high - low
+    scale = 1/np.where(spread == 0, 1, spread)
+    with np.errstate(invalid='ignore'):
+        normed_war = raw_war*scale[groups] - (low*scale)[groups]
+    return (raw_war, normed_war)
+
+def score(X, group_pos, lengths, coef, weights=WEIGHTS):
+    '''
+    Computes the WAR of every player of many tables in one pass. Each
+    table is a group of consecutive rows of X ending in the table's Average
+    and Replacement rows, which count toward the range WAR is scaled over
+    like any player.
 
-        df['Normed_WAR'] = min_max_scaler.fit_transform(raw_war)
+    Inputs:
+        X (array): the stacked feature matrices of every table
+        group_pos (array): the index in POSITIONS of each table's position
+        lengths (array): the number of rows of each table, with its
+            baseline rows
+        coef (float): wins per goal of differential, from find_regr
+        weights (array): the weight matrix, or a stack of them, see
+            goal_differential
+
+    Returns:
+        (raw_gd, raw_war, normed_war), arrays with a value per row of X
+    '''
+    row_pos = np.asarray(group_pos)[segments(lengths)[2]]
+    raw_gd = goal_differential(center(X, group_pos, lengths), row_pos,
+                               weights)
+    raw_war, normed_war = normalize(raw_gd, lengths, coef)
+    return (raw_gd, raw_war, normed_war)
+
+def stack(tables):
+    '''
+    Stacks the feature matrices of many tables for score
+
+    Inputs:
+        tables (list): (df, pos, baseline_df) for each table, see
+            add_war_batch
+
+    Returns:
+        (X, group_pos, lengths), see score
+    '''
+    blocks = []
+    for df, pos, baseline_df in tables:
+        if list(baseline_df.index) != BASELINES:
+            baseline_df = baseline_df.loc[BASELINES]
+        blocks.append(features(df))
+        blocks.append(features(baseline_df))
+    X = np.concatenate(blocks)
+    group_pos = np.array([POSITIONS.index(pos) for df, pos, _ in tables])
+    lengths = np.array([len(df) + len(BASELINES) for df, _, _ in tables])
+    return (X, group_pos, lengths)
+
+def add_war_batch(tables, coef):
+    '''
+    Adds the WAR columns to many joined tables at once, stacking every
+    table's features into one matrix for score
+
+    Inputs:
+        tables (list): (df, pos, baseline_df) for each table, where df is a
+            joined table for a position and year, pos the position it is for
+            and baseline_df its Average and Replacement players from
+            baselines.compute or the baselines table
+        coef (float): wins per goal of differential, from find_regr
+
+    Returns:
+        A list of the tables with Raw_GD, Raw_WAR, Normed_WAR and WAR
+    '''
+    if len(tables) == 0:
+        return []
+
+    X, group_pos, lengths = stack(tables)
+    raw_gd, raw_war, normed_war = score(X, group_pos, lengths, coef)
+
+    scored = []
+    start = 0
+    for (df, pos, baseline_df), length in zip(tables, lengths):
+        rows = slice(start, start + len(df))
+        df['Raw_GD'] = raw_gd[rows]
+        df['Raw_WAR'] = raw_war[rows]
+        df['Normed_WAR'] = normed_war[rows]
         df['WAR'] = df['Normed_WAR']*6
+        scored.append(df)
+        start += length
+    return scored
+
+def add_war(df, pos, coef, baseline_df):
+    '''
+    Takes a joined yearly position table scraped from scraper.join_years()
+    and adds the war column to the data before being finally written to the db
+
+    Inputs:
+        table (DataFrame): the joined DataFrame for a given position and year
+        pos (str): the position that the table is for
+        coef (float): wins per goal of differential, from find_regr
+        baseline_df (DataFrame): the Average and Replacement players of the
+            table, from baselines.compute or the baselines table
 
-    return df
+    Returns:
+        table (DataFrame): the table that includes WAR for each player
+    '''
+    return add_war_batch([(df, pos, baseline_df)], coef)[0]